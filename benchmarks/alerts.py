@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Alert engine microbenchmark: readings/sec and rule evaluations/sec for rules x devices
+Usage: python benchmarks/alerts.py [--rules 10,100,1000] [--devices 10,1000] [--seconds 2]
+
+Runs in-process with no database. Rules cycle through threshold, mean_ratio
+and zscore kinds over the telemetry fields, all with a log action that never
+fires (thresholds are out of range), so the numbers are pure evaluation cost.
+Readings come from --devices devices in round-robin order on a clock that
+advances 1 second per reading, so rolling windows keep expiring slots.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from services.alerts import AlertEngine, Rule
+
+FIELDS = ('temperature', 'humidity', 'light', 'rssi')
+
+def reading(device):
+    return {
+        "temperature": round(random.uniform(20, 35), 1),
+        "humidity": round(random.uniform(30, 80), 1),
+        "light": round(random.uniform(100, 1000), 1),
+        "lightPercentage": round(random.uniform(0, 100), 1),
+        "rssi": random.randint(-90, -30),
+        "localIp": device
+    }
+
+def rules(count):
+    specs = []
+    for i in range(count):
+        field = FIELDS[i % len(FIELDS)]
+        kind = ('threshold', 'mean_ratio', 'zscore')[i % 3]
+        specs.append(Rule(f"rule-{i}", field, '>', 1e9, kind=kind, window=600 + 60 * (i % 5), alpha=0.05 + 0.01 * (i % 5)))
+    return specs
+
+def run(rule_count, device_count, seconds):
+    clock = itertools.count(1_000_000)
+    engine = AlertEngine(rules(rule_count), clock=lambda: next(clock))
+    devices = [f"10.0.{i // 256}.{i % 256}" for i in range(device_count)]
+    readings = [reading(device) for device in devices] * max(1, 1000 // device_count)
+
+    evaluated = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for document in readings:
+            engine.evaluate(document)
+        evaluated += len(readings)
+    elapsed = time.perf_counter() - started
+    return {
+        "rules": rule_count,
+        "devices": device_count,
+        "readings_per_second": round(evaluated / elapsed),
+        "rule_evaluations_per_second": round(evaluated * rule_count / elapsed),
+        "us_per_reading": round(elapsed / evaluated * 1e6, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', type=lambda value: [int(n) for n in value.split(',')], default=[10, 100, 1000])
+    parser.add_argument('--devices', type=lambda value: [int(n) for n in value.split(',')], default=[10, 1000])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = [run(rule_count, device_count, args.seconds) for rule_count in args.rules for device_count in args.devices]
+    print(json.dumps({"benchmark": "alerts", "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Export memory benchmark: streams /telemetry/export and samples RSS while reading
+Usage: MONGO_URI=mongodb://localhost:27017 python benchmarks/export_memory.py --rows 2000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from flask import Flask
+from pymongo import MongoClient
+from controllers.data_controller import DataController
+from routes import api_routes
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+
+def seed(collection, rows, chunk=10000):
+    start = datetime.utcnow() - timedelta(seconds=rows)
+    collection.drop()
+    collection.create_index([("timestamp", 1), ("_id", 1)], name="timestamp_id")
+    for offset in range(0, rows, chunk):
+        collection.insert_many([
+            {
+                "temperature": round(random.uniform(20, 35), 1),
+                "humidity": round(random.uniform(30, 80), 1),
+                "light": round(random.uniform(100, 1000), 1),
+                "lightPercentage": round(random.uniform(0, 100), 1),
+                "rssi": random.randint(-90, -30),
+                "localIp": f"192.168.1.{i % 50}",
+                "timestamp": start + timedelta(seconds=i)
+            }
+            for i in range(offset, min(offset + chunk, rows))
+        ], ordered=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--sample-every', type=int, default=100000)
+    parser.add_argument('--skip-seed', action='store_true')
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))['iot_benchmark']
+    if not args.skip_seed:
+        seed(db['sensor_data'], args.rows)
+
+    app = Flask(__name__)
+    api_routes.data_controller = DataController(db=db)
+    api_routes.setup_routes(app)
+
+    baseline = rss_mb()
+    samples = []
+    rows = 0
+    started = time.perf_counter()
+    response = app.test_client().get(f'/telemetry/export?format={args.format}', buffered=False)
+    for chunk in response.response:
+        rows += chunk.count(b'\n')
+        if rows // args.sample_every > len(samples):
+            samples.append({"rows": rows, "rss_mb": round(rss_mb(), 1)})
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "benchmark": "export_memory",
+        "format": args.format,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(rows / elapsed),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": max([s["rss_mb"] for s in samples] or [round(rss_mb(), 1)]),
+        "samples": samples
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+HTTP load test: req/s and latency percentiles for one or more running servers
+Usage:
+  python src/main.py &                                    # WSGI on :5000
+  uvicorn asgi:app --app-dir src --port 8000 &            # ASGI on :8000
+  python benchmarks/http_load.py --target wsgi=http://localhost:5000 \\
+      --target asgi=http://localhost:8000 --path /telemetry --concurrency 200 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+READING = {
+    "temperature": 25.5,
+    "humidity": 60.2,
+    "light": 450.0,
+    "lightPercentage": 75.0,
+    "rssi": -45,
+    "localIp": "192.168.1.100"
+}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def worker(client, method, url, body, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=body)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+async def run_target(name, base_url, args):
+    latencies = []
+    errors = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    body = READING if args.method == 'POST' else None
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            worker(client, args.method, base_url + args.path, body, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "target": name,
+        "url": base_url + args.path,
+        "method": args.method,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help="name=base_url, repeatable")
+    parser.add_argument('--path', default='/telemetry')
+    parser.add_argument('--method', default='GET', choices=['GET', 'POST'])
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target:
+        name, _, base_url = target.partition('=')
+        results.append(await run_target(name, base_url.rstrip('/'), args))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
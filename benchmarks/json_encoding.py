@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+JSON encoding benchmark on a 10k-point /telemetry/history response
+Usage: python benchmarks/json_encoding.py [--points 10000] [--repeat 20]
+
+Compares the previous jsonify setup (stdlib, pretty-printed, sorted keys)
+with the shared encoder, both as raw encode time and as full Flask requests,
+and reports response size with gzip (and br when brotli is installed). Also
+compares the default row format with format=columnar and format=binary.
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from flask import Flask, jsonify
+from middleware import compression
+from services.telemetry_queries import EPOCH, TELEMETRY_FIELDS, format_bucket, format_columnar, pack_columnar
+from utils import json_provider
+
+def history_response(points):
+    start = datetime(2024, 1, 1)
+    data = [format_bucket({
+        "timestamp": start + timedelta(minutes=i),
+        "temperature": 20 + (i % 100) / 7,
+        "humidity": 50 + (i % 37) / 3,
+        "light": 400 + (i % 250) * 1.3,
+        "count": 12
+    }) for i in range(points)]
+    return {"status": "success", "data": data, "count": points, "bucket": "1m", "agg": "avg"}
+
+def history_columns(points):
+    """The columnar_stage() result for the same buckets as history_response"""
+    start = datetime(2024, 1, 1)
+    return {
+        "timestamps": [int((start - EPOCH).total_seconds() * 1000) + i * 60000 for i in range(points)],
+        "count": [12] * points,
+        "temperature": [20 + (i % 100) / 7 for i in range(points)],
+        "humidity": [50 + (i % 37) / 3 for i in range(points)],
+        "light": [400 + (i % 250) * 1.3 for i in range(points)]
+    }
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+def flask_client(payload, fast):
+    app = Flask(__name__)
+    if fast:
+        json_provider.init_app(app)
+        compression.init_compression(app)
+    else:
+        app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+
+    @app.route('/history')
+    def history():
+        return jsonify(payload)
+
+    return app.test_client()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = history_response(args.points)
+    pretty = json.dumps(payload, default=json_provider.default, indent=2, sort_keys=True).encode()
+    compact = json_provider.dumps_bytes(payload)
+
+    encode = {
+        "stdlib_pretty_sorted_ms": median_ms(
+            lambda: json.dumps(payload, default=json_provider.default, indent=2, sort_keys=True), args.repeat),
+        "stdlib_compact_ms": median_ms(
+            lambda: json.dumps(payload, default=json_provider.default, separators=(',', ':')), args.repeat),
+        f"{json_provider.BACKEND}_compact_ms": median_ms(lambda: json_provider.dumps_bytes(payload), args.repeat)
+    }
+
+    old_client = flask_client(payload, fast=False)
+    new_client = flask_client(payload, fast=True)
+    requests = {
+        "previous_jsonify_ms": median_ms(lambda: old_client.get('/history'), args.repeat),
+        "fast_encoder_ms": median_ms(lambda: new_client.get('/history'), args.repeat),
+        "fast_encoder_gzip_ms": median_ms(
+            lambda: new_client.get('/history', headers={'Accept-Encoding': 'gzip'}), args.repeat)
+    }
+
+    sizes = {
+        "pretty_bytes": len(pretty),
+        "compact_bytes": len(compact),
+        "compact_gzip_bytes": len(gzip.compress(compact, compresslevel=compression.COMPRESS_LEVEL))
+    }
+    if compression.brotli is not None:
+        sizes["compact_br_bytes"] = len(compression.compress_body(compact, 'br'))
+
+    columns = history_columns(args.points)
+    columnar = json_provider.dumps_bytes({"status": "success", "data": format_columnar(columns),
+                                          "units": {key: unit for key, _, unit in TELEMETRY_FIELDS}})
+    formats = {
+        "rows_build_and_encode_ms": median_ms(lambda: json_provider.dumps_bytes(history_response(args.points)), args.repeat),
+        "columnar_build_and_encode_ms": median_ms(lambda: json_provider.dumps_bytes(format_columnar(columns)), args.repeat),
+        "binary_pack_ms": median_ms(lambda: pack_columnar(columns), args.repeat),
+        "rows_bytes": len(compact),
+        "columnar_bytes": len(columnar),
+        "binary_bytes": len(pack_columnar(columns))
+    }
+
+    print(json.dumps({
+        "benchmark": "json_encoding",
+        "points": args.points,
+        "backend": json_provider.BACKEND,
+        "encode": encode,
+        "flask_request": requests,
+        "size": sizes,
+        "formats": formats
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+MQTT ingest throughput: readings/sec from publish to acknowledged write in sensor_data
+Usage: MONGO_URI=mongodb://localhost:27017 python benchmarks/mqtt_ingest.py \\
+    --broker localhost --messages 100000 --publishers 8 --workers 2
+
+Needs a local MQTT broker with shared subscriptions (e.g. mosquitto 2.x).
+Starts --workers in-process MQTTIngestWorkers in one shared subscription
+group writing to iot_benchmark.sensor_data, publishes --messages QoS 1
+readings from --publishers clients and reports when every reading is stored.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from pymongo import MongoClient
+from controllers.data_controller import DataController
+from services.mqtt_ingest import MQTTIngestWorker
+from services.mqtt_pool import create_mqtt_client
+
+def reading(device):
+    return {
+        "temperature": round(random.uniform(20, 35), 1),
+        "humidity": round(random.uniform(30, 80), 1),
+        "light": round(random.uniform(100, 1000), 1),
+        "lightPercentage": round(random.uniform(0, 100), 1),
+        "rssi": random.randint(-90, -30),
+        "localIp": f"192.168.1.{device}"
+    }
+
+def publish(args, index, count, published):
+    client = create_mqtt_client()
+    client.connect(args.broker, args.port)
+    client.loop_start()
+    device = index % 50
+    topic = f"v1/devices/device-{device}/telemetry"
+    infos = [client.publish(topic, json.dumps(reading(device)), qos=1) for _ in range(count)]
+    for info in infos:
+        info.wait_for_publish()
+    published.append(count)
+    client.loop_stop()
+    client.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--publishers', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))['iot_benchmark']
+    collection = db['sensor_data']
+    collection.drop()
+
+    workers = [
+        MQTTIngestWorker(DataController(db=db), args.broker, args.port, group='benchmark', batch_size=args.batch_size)
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.0)
+
+    per_publisher = args.messages // args.publishers
+    total = per_publisher * args.publishers
+    published = []
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=publish, args=(args, i, per_publisher, published))
+        for i in range(args.publishers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    published_at = time.perf_counter()
+
+    deadline = started + args.timeout
+    while time.perf_counter() < deadline and sum(w.stats["stored"] for w in workers) < total:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    for worker in workers:
+        worker.stop()
+
+    stored = sum(w.stats["stored"] for w in workers)
+    results = {
+        "messages": total,
+        "publishers": args.publishers,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "publish_seconds": round(published_at - started, 3),
+        "total_seconds": round(elapsed, 3),
+        "stored": stored,
+        "in_collection": collection.count_documents({}),
+        "readings_per_second": round(stored / elapsed),
+        "per_worker": [dict(w.stats) for w in workers]
+    }
+    print(json.dumps({"benchmark": "mqtt_ingest", "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: ingest, read and command paths of the Flask app at a fixed concurrency
+Usage:
+  python benchmarks/suite.py --concurrency 50 --duration 10 --save benchmarks/baseline.json
+  python benchmarks/suite.py --compare benchmarks/baseline.json --tolerance 0.10
+
+Serves the app in-process on a threaded local HTTP server, backed by mongomock
+(or a local mongod with --mongo-uri; it uses the iot_benchmark database) and a
+loopback MQTT client that answers LED RPCs after --rpc-latency seconds.
+Scenarios: latest (GET /telemetry), history (GET /telemetry/history), led
+(POST /led), post_data (POST /data) and batch (POST /data/batch with
+--batch-size readings). Each reports req/s, p50/p95/p99 latency and process RSS.
+
+--compare exits with status 1 when a scenario's throughput falls, or its p95
+rises, by more than --tolerance relative to the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import httpx
+from flask import Flask
+from werkzeug.serving import make_server
+from controllers.data_controller import DataController
+from controllers.led_controller import LEDController
+from routes import api_routes
+from services.coreiot_service import CoreIOTService
+from services.mqtt_pool import MQTTConnectionPool
+from http_load import percentile
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+# Reads run first so they always see just the seeded readings
+SCENARIOS = ('latest', 'history', 'led', 'post_data', 'batch')
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+
+def reading(device=None):
+    return {
+        "temperature": round(random.uniform(20, 35), 1),
+        "humidity": round(random.uniform(30, 80), 1),
+        "light": round(random.uniform(100, 1000), 1),
+        "lightPercentage": round(random.uniform(0, 100), 1),
+        "rssi": random.randint(-90, -30),
+        "localIp": device or f"192.168.1.{random.randint(1, 50)}"
+    }
+
+class LoopbackMessageInfo:
+    rc = 0
+    mid = 0
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return True
+
+class LoopbackClient:
+    """MQTT broker stand-in: connects at once and answers every RPC request after a delay"""
+
+    latency = 0.01
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def loop_start(self):
+        self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        params = json.loads(payload)['params']
+        message = SimpleNamespace(topic=topic.replace('/request/', '/response/'), payload=json.dumps(params).encode())
+        threading.Timer(self.latency, self.on_message, (self, None, message)).start()
+        return LoopbackMessageInfo()
+
+def create_database(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri)['iot_benchmark']
+        db['sensor_data'].drop()
+        return db, 'mongod'
+    import mongomock
+    return mongomock.MongoClient()['iot_benchmark'], 'mongomock'
+
+def seed(db, rows, rollups=None):
+    """Readings over the last day so history queries have buckets to fill, folded into the rollups if given"""
+    now = datetime.utcnow()
+    documents = [
+        dict(reading(f"192.168.1.{i % 50}"), timestamp=now - timedelta(seconds=86400 * i / rows))
+        for i in range(rows)
+    ]
+    db['sensor_data'].insert_many(documents)
+    if rollups is not None:
+        from services.rollups import ROLLUP_STATE, ROLLUPS
+        rollups.apply(documents)
+        for name, _ in ROLLUPS:
+            db[ROLLUP_STATE].update_one({'_id': name}, {'$set': {'since': datetime.min}}, upsert=True)
+
+def create_app(db, rollups):
+    app = Flask(__name__)
+    api_routes.data_controller = DataController(db=db, rollups=rollups)
+    pool = MQTTConnectionPool("loopback", 1883, client_factory=LoopbackClient)
+    api_routes.led_controller = LEDController(coreiot_service=CoreIOTService("benchmark", pool=pool))
+    api_routes.setup_routes(app)
+    return app
+
+def scenario_request(name, batch_size):
+    """(method, path, body factory) for a scenario"""
+    if name == 'post_data':
+        return 'POST', '/data', reading
+    if name == 'batch':
+        return 'POST', '/data/batch', lambda: [reading() for _ in range(batch_size)]
+    if name == 'latest':
+        return 'GET', '/telemetry', lambda: None
+    if name == 'history':
+        return 'GET', '/telemetry/history?bucket=1h', lambda: None
+    return 'POST', '/led', lambda: {"state": random.choice([True, False])}
+
+async def worker(client, method, url, body, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=body())
+            if response.status_code >= 400 or response.json().get('status') == 'error':
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+async def run_scenario(name, base_url, args):
+    method, path, body = scenario_request(name, args.batch_size)
+    latencies = []
+    errors = []
+    rss_before = rss_mb()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            worker(client, method, base_url + path, body, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "method": method,
+        "path": path,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "rss_mb_before": round(rss_before, 1),
+        "rss_mb_after": round(rss_mb(), 1)
+    }
+
+def compare(results, baseline, tolerance):
+    """Per-scenario changes against a baseline run; returns (report, regressed)"""
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    report = []
+    regressed = False
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        throughput = result["requests_per_second"] / before["requests_per_second"] - 1 if before["requests_per_second"] else 0.0
+        p95 = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] and result["p95_ms"] else 0.0
+        failed = throughput < -tolerance or p95 > tolerance
+        regressed = regressed or failed
+        report.append({
+            "scenario": result["scenario"],
+            "throughput_change": round(throughput, 3),
+            "p95_change": round(p95, 3),
+            "regressed": failed
+        })
+    return report, regressed
+
+async def run(args):
+    db, backend = create_database(args.mongo_uri)
+    rollups = None
+    if backend == 'mongod':
+        from services.rollups import RollupStore
+        rollups = RollupStore(db)
+    seed(db, args.seed_rows, rollups)
+    LoopbackClient.latency = args.rpc_latency
+
+    server = make_server('127.0.0.1', 0, create_app(db, rollups), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        results = []
+        for name in args.scenarios:
+            results.append(await run_scenario(name, base_url, args))
+    finally:
+        server.shutdown()
+
+    return {
+        "benchmark": "suite",
+        "backend": backend,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "rss_mb_end": round(rss_mb(), 1),
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS),
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--seed-rows', type=int, default=10000)
+    parser.add_argument('--rpc-latency', type=float, default=0.01)
+    parser.add_argument('--mongo-uri', default=os.getenv('BENCHMARK_MONGO_URI'))
+    parser.add_argument('--save', help="write the results to this file as the new baseline")
+    parser.add_argument('--compare', help="baseline file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    output = asyncio.run(run(args))
+    regressed = False
+    if args.compare:
+        with open(args.compare) as f:
+            output["comparison"], regressed = compare(output["results"], json.load(f), args.tolerance)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    print(json.dumps(output, indent=2))
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
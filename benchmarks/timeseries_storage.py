@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Storage layout benchmark: plain indexed sensor_data vs a native time-series collection
+Usage: MONGO_URI=mongodb://localhost:27017 python benchmarks/timeseries_storage.py --rows 500000
+
+Measures insert rate, range-query latency (one device over an hour, all devices
+over a day downsampled to 5m buckets) and storage/index size for each layout.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from pymongo import MongoClient
+from migrations.schema import SENSOR_DATA_INDEXES, TIMESERIES_SENSOR_DATA_INDEXES
+from services.telemetry_queries import history_pipeline
+
+DEVICES = 50
+
+def readings(rows, start):
+    for i in range(rows):
+        yield {
+            "temperature": round(random.uniform(20, 35), 1),
+            "humidity": round(random.uniform(30, 80), 1),
+            "light": round(random.uniform(100, 1000), 1),
+            "lightPercentage": round(random.uniform(0, 100), 1),
+            "rssi": random.randint(-90, -30),
+            "localIp": f"192.168.1.{i % DEVICES}",
+            "timestamp": start + timedelta(seconds=i // DEVICES)
+        }
+
+def create_plain(db, name):
+    db.drop_collection(name)
+    collection = db.create_collection(name)
+    for spec in SENSOR_DATA_INDEXES:
+        collection.create_index(spec["key"], name=spec["name"])
+    return collection
+
+def create_timeseries(db, name):
+    db.drop_collection(name)
+    collection = db.create_collection(name, timeseries={
+        "timeField": "timestamp", "metaField": "localIp", "granularity": "seconds"
+    })
+    for spec in TIMESERIES_SENSOR_DATA_INDEXES:
+        collection.create_index(spec["key"], name=spec["name"])
+    return collection
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+def run_layout(db, name, create, rows, batch_size, start):
+    collection = create(db, name)
+
+    batch = []
+    started = time.perf_counter()
+    for document in readings(rows, start):
+        batch.append(document)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    insert_seconds = time.perf_counter() - started
+
+    end = start + timedelta(seconds=rows // DEVICES)
+    hour_start = end - timedelta(hours=1)
+    day_start = end - timedelta(days=1)
+    stats = db.command("collStats", name)
+
+    return {
+        "layout": name,
+        "rows": rows,
+        "inserts_per_second": round(rows / insert_seconds),
+        "device_hour_query_ms": timed(lambda: list(collection.find(
+            {"localIp": "192.168.1.7", "timestamp": {"$gte": hour_start, "$lt": end}}
+        )), 5),
+        "day_5m_aggregate_ms": timed(lambda: list(collection.aggregate(
+            history_pipeline(day_start, end, 300)
+        )), 5),
+        "storage_mb": round(stats.get("storageSize", 0) / 1e6, 1),
+        "index_mb": round(stats.get("totalIndexSize", 0) / 1e6, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))['iot_benchmark']
+    start = datetime.utcnow() - timedelta(seconds=args.rows // DEVICES)
+    results = [
+        run_layout(db, 'sensor_data_plain', create_plain, args.rows, args.batch_size, start),
+        run_layout(db, 'sensor_data_timeseries', create_timeseries, args.rows, args.batch_size, start)
+    ]
+    print(json.dumps({"benchmark": "timeseries_storage", "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
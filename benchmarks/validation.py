@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Telemetry validation microbenchmark: validations/sec for single readings and 1k-item batches
+Usage: python benchmarks/validation.py [--seconds 2]
+
+Runs in-process with no database: "single" validates one reading per call,
+"batch_1k" runs DataController.prepare_batch on 1000 readings per call.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from models.data_models import telemetry_model
+from controllers.data_controller import DataController
+
+def reading():
+    return {
+        "temperature": round(random.uniform(20, 35), 1),
+        "humidity": round(random.uniform(30, 80), 1),
+        "light": round(random.uniform(100, 1000), 1),
+        "lightPercentage": round(random.uniform(0, 100), 1),
+        "rssi": random.randint(-90, -30),
+        "localIp": f"192.168.1.{random.randint(1, 50)}"
+    }
+
+def rate(fn, items_per_call, seconds):
+    calls = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        fn()
+        calls += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "calls": calls,
+        "validations_per_second": round(calls * items_per_call / elapsed),
+        "us_per_call": round(elapsed / calls * 1e6, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    single = reading()
+    batch = [reading() for _ in range(1000)]
+    controller = DataController(db={})
+
+    results = {
+        "single": rate(lambda: telemetry_model.validate(single), 1, args.seconds),
+        "batch_1k": rate(lambda: controller.prepare_batch(batch), len(batch), args.seconds)
+    }
+    print(json.dumps({"benchmark": "validation", "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +0,0 @@
-class Config:
-    DEBUG = True
-    TESTING = False
-    SECRET_KEY = 'your_secret_key'
-    DATABASE_URI = 'sqlite:///your_database.db'
-    JSONIFY_PRETTYPRINT_REGULAR = True
-    API_VERSION = 'v1'
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+Production launcher for the ASGI app
+Usage: gunicorn -c deploy/gunicorn_asgi.conf.py asgi:app
+"""
+import multiprocessing
+import os
+
+chdir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+bind = os.getenv('ASGI_BIND', '0.0.0.0:8000')
+
+# One event loop per core is enough; each worker multiplexes thousands of connections
+workers = int(os.getenv('ASGI_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'asgi_worker.GatewayUvicornWorker'
+
+# Idle keep-alive connections from devices and dashboards
+keepalive = int(os.getenv('ASGI_KEEPALIVE', '30'))
+
+# Restart workers that stop heartbeating, and recycle them periodically
+timeout = 60
+graceful_timeout = 30
+max_requests = 100000
+max_requests_jitter = 10000
+
+# Request size limits
+limit_request_line = 4094
+limit_request_fields = 100
+limit_request_field_size = 8190
+
+backlog = 2048
@@ -0,0 +1,503 @@
+"""
+ASGI entry point serving the same routes and response shapes as main.py
+Usage: uvicorn asgi:app --app-dir src
+   or: uvicorn --factory asgi:create_app --app-dir src
+   or: gunicorn -c deploy/gunicorn_asgi.conf.py asgi:app
+"""
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+# Before the app modules, a few of which read settings (e.g. COMPRESS_MIN_SIZE) at import
+load_dotenv()
+
+from datetime import datetime
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+from config import Config
+from controllers.async_data_controller import AsyncDataController
+from controllers.led_controller import LEDController
+from controllers.device_controller import DeviceController
+from services.admission import AdmissionControl, AdmissionDenied, client_key
+from services.telemetry_hub import AsyncSubscription, telemetry_hub
+from middleware.compression import COMPRESS_MIN_SIZE, COMPRESS_LEVEL
+from middleware.metrics import ASGIMetricsMiddleware
+from utils.log import configure_logging
+from utils.metrics import app_startup, registry
+from utils.profiler import profiler, profiler_enabled
+from utils.json_provider import dumps, dumps_bytes, loads
+from services.telemetry_queries import (
+    EXPORT_BATCH_SIZE, EXPORT_FIELDS, HISTORY_MAX_POINTS, RECORDS_MAX_LIMIT, STREAM_KEEPALIVE,
+    columnar_units, csv_line, format_columnar, generate_test_telemetry, pack_columnar,
+    parse_history_params, parse_int_param, parse_range_params
+)
+
+logger = logging.getLogger(__name__)
+
+# Built by init_controllers() when the app is created, not at import
+data_controller = None
+led_controller = None
+device_controller = None
+admission = None
+
+
+class JSONResponse(StarletteJSONResponse):
+    """Compact JSON through the shared encoder, which also handles datetime and ObjectId"""
+
+    def render(self, content):
+        return dumps_bytes(content)
+
+
+def error_response(message, status_code):
+    return JSONResponse({"status": "error", "message": message}, status_code=status_code)
+
+
+async def read_json(request):
+    try:
+        return loads(await request.body())
+    except ValueError:
+        return None
+
+
+def etag_matches(header, etag):
+    """True if an If-None-Match header lists the given (unquoted) ETag"""
+    if not header or etag is None:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+
+async def admit(request, json_data):
+    """Charge the request to its client's and devices' rate limits, if they are enabled"""
+    if admission is None:
+        return
+    key = client_key(request.headers.get('authorization'), request.client.host if request.client else None)
+    if admission.shared:
+        # The Redis round trip would block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, admission.admit, key, json_data)
+    else:
+        admission.admit(key, json_data)
+
+
+def rate_limited_response(error):
+    """Response when a client or device is over its ingest rate"""
+    return JSONResponse(
+        {"status": "error", "message": str(error)},
+        status_code=429,
+        headers={'Retry-After': error.retry_after_header()}
+    )
+
+
+async def receive_data(request):
+    json_data = await read_json(request)
+    try:
+        await admit(request, json_data)
+    except AdmissionDenied as e:
+        return rate_limited_response(e)
+    response = await data_controller.receive_data(json_data)
+    return JSONResponse(response)
+
+
+async def receive_data_batch(request):
+    """Receive an array of readings in a single request"""
+    json_data = await read_json(request)
+    try:
+        await admit(request, json_data)
+    except AdmissionDenied as e:
+        return rate_limited_response(e)
+    response = await data_controller.receive_batch(json_data)
+    return JSONResponse(response)
+
+
+async def get_telemetry(request):
+    """Fetch telemetry data for frontend"""
+    try:
+        real_data, etag = await data_controller.get_latest_telemetry_entry(request.query_params.get('device'))
+
+        if real_data:
+            headers = {'ETag': f'"{etag}"'}
+            if etag_matches(request.headers.get('if-none-match'), etag):
+                return Response(status_code=304, headers=headers)
+            return JSONResponse({
+                "status": "success",
+                "data": real_data,
+                "source": "database"
+            }, headers=headers)
+
+        return JSONResponse({
+            "status": "success",
+            "data": generate_test_telemetry(),
+            "source": "test_data",
+            "timestamp": datetime.utcnow()
+        })
+    except Exception as e:
+        return error_response(f"Failed to fetch telemetry data: {str(e)}", 500)
+
+
+async def stream_telemetry(request):
+    """Push accepted readings to the client as Server-Sent Events"""
+    device = request.query_params.get('device')
+
+    async def events():
+        subscription = telemetry_hub.subscribe(subscription=AsyncSubscription(device, telemetry_hub.queue_size))
+        try:
+            yield "retry: 3000\n\n"
+            while not subscription.closed:
+                event = await subscription.get(timeout=STREAM_KEEPALIVE)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: telemetry\ndata: {dumps(event)}\n\n"
+            if subscription.dropped:
+                yield "event: dropped\ndata: {}\n\n"
+        finally:
+            telemetry_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def telemetry_ws(websocket):
+    """The live telemetry stream over a WebSocket"""
+    await websocket.accept()
+    device = websocket.query_params.get('device')
+    subscription = telemetry_hub.subscribe(subscription=AsyncSubscription(device, telemetry_hub.queue_size))
+    try:
+        while not subscription.closed:
+            event = await subscription.get(timeout=STREAM_KEEPALIVE)
+            await websocket.send_text(dumps(event if event is not None else {"type": "keepalive"}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        telemetry_hub.unsubscribe(subscription)
+
+
+async def get_telemetry_history(request):
+    """Fetch historical telemetry data, downsampled into time buckets"""
+    try:
+        params = parse_history_params(request.query_params, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    try:
+        if params['format'] != 'rows':
+            return await telemetry_history_columns(params)
+
+        historical_data = await data_controller.get_telemetry_history(
+            params['start'], params['end'], params['bucket'],
+            agg=params['agg'], device=params['device'], max_points=params['limit']
+        )
+        if historical_data is None:
+            return error_response("Database connection failed", 503)
+
+        return JSONResponse({
+            "status": "success",
+            "data": historical_data,
+            "count": len(historical_data),
+            "from": params['start'],
+            "to": params['end'],
+            "bucket": params['bucket'],
+            "agg": params['agg']
+        })
+    except Exception as e:
+        return error_response(f"Failed to fetch historical data: {str(e)}", 500)
+
+
+async def telemetry_history_columns(params):
+    """History as parallel arrays (format=columnar) or packed little-endian arrays (format=binary)"""
+    columns = await data_controller.get_telemetry_history_columns(
+        params['start'], params['end'], params['bucket'],
+        agg=params['agg'], device=params['device'], max_points=params['limit']
+    )
+    if columns is None:
+        return error_response("Database connection failed", 503)
+
+    if params['format'] == 'binary':
+        return Response(pack_columnar(columns), media_type='application/octet-stream', headers={
+            'X-Point-Count': str(len(columns.get('timestamps', []))),
+            'X-Series': ','.join(columnar_units()),
+            'X-Units': ','.join(columnar_units().values())
+        })
+
+    data = format_columnar(columns)
+    return JSONResponse({
+        "status": "success",
+        "data": data,
+        "units": columnar_units(),
+        "count": len(data['timestamps']),
+        "from": params['start'],
+        "to": params['end'],
+        "bucket": params['bucket'],
+        "agg": params['agg']
+    })
+
+
+async def export_telemetry(request):
+    """Stream raw readings as NDJSON or CSV"""
+    try:
+        start, end, device = parse_range_params(request.query_params)
+        export_format = request.query_params.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            raise ValueError("Invalid format (use ndjson or csv)")
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    if data_controller.db is None:
+        return error_response("Database connection failed", 503)
+
+    rows = data_controller.iter_export(start, end, device, batch_size=EXPORT_BATCH_SIZE)
+
+    async def ndjson():
+        async for row in rows:
+            yield dumps(row) + '\n'
+
+    async def csv_body():
+        yield csv_line(EXPORT_FIELDS)
+        async for row in rows:
+            yield csv_line([row[field] for field in EXPORT_FIELDS])
+
+    return StreamingResponse(
+        csv_body() if export_format == 'csv' else ndjson(),
+        media_type='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=sensor_data.{export_format}'}
+    )
+
+
+async def get_telemetry_records(request):
+    """Page through raw readings with an opaque keyset cursor"""
+    try:
+        start, end, device = parse_range_params(request.query_params)
+        limit = parse_int_param(request.query_params, 'limit', 100)
+        if not 0 < limit <= RECORDS_MAX_LIMIT:
+            raise ValueError(f"'limit' must be between 1 and {RECORDS_MAX_LIMIT}")
+
+        if data_controller.db is None:
+            return error_response("Database connection failed", 503)
+
+        rows, next_cursor = await data_controller.get_records_page(
+            start, end, device, limit=limit, cursor=request.query_params.get('cursor')
+        )
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        return error_response(f"Failed to fetch records: {str(e)}", 500)
+
+    return JSONResponse({
+        "status": "success",
+        "data": rows,
+        "count": len(rows),
+        "next_cursor": next_cursor
+    })
+
+
+async def control_led(request):
+    """Control LED; awaits the device's RPC response without holding a thread"""
+    try:
+        json_data = await read_json(request)
+        if not json_data or 'state' not in json_data:
+            return error_response("Missing 'state' parameter", 400)
+        return JSONResponse(await led_controller.set_led_state_async(json_data['state']))
+    except Exception as e:
+        return error_response(f"LED control error: {str(e)}", 500)
+
+
+async def get_led_status(request):
+    """Get last known LED status"""
+    try:
+        return JSONResponse(led_controller.get_led_state())
+    except Exception as e:
+        return error_response(f"Failed to get LED status: {str(e)}", 500)
+
+
+async def toggle_led(request):
+    """Toggle LED state"""
+    try:
+        return JSONResponse(await led_controller.toggle_led_async())
+    except Exception as e:
+        return error_response(f"LED toggle error: {str(e)}", 500)
+
+
+async def get_coreiot_health(request):
+    """Connection health of the CoreIOT MQTT pool"""
+    try:
+        return JSONResponse({
+            "status": "success",
+            "data": led_controller.coreiot_service.connection_stats()
+        })
+    except Exception as e:
+        return error_response(f"Failed to get CoreIOT health: {str(e)}", 500)
+
+
+async def list_devices(request):
+    """Registered devices (tokens are never returned)"""
+    try:
+        return JSONResponse(await device_controller.lookup(device_controller.list_devices))
+    except Exception as e:
+        return error_response(f"Failed to list devices: {str(e)}", 500)
+
+
+async def get_device_telemetry(request):
+    """Latest reading of one registered device"""
+    try:
+        response, etag = await device_controller.get_device_telemetry_async(request.path_params['device_id'])
+        if device_controller.is_not_found(response):
+            return JSONResponse(response, status_code=404)
+        headers = {'ETag': f'"{etag}"'} if etag is not None else {}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(response, headers=headers)
+    except Exception as e:
+        return error_response(f"Failed to fetch telemetry data: {str(e)}", 500)
+
+
+async def device_led(request):
+    """Last confirmed LED state of a device (GET) or set it (POST)"""
+    device_id = request.path_params['device_id']
+    try:
+        if request.method == 'GET':
+            response = await device_controller.lookup(device_controller.get_device_led, device_id)
+        else:
+            json_data = await read_json(request)
+            if not json_data or 'state' not in json_data:
+                return error_response("Missing 'state' parameter", 400)
+            response = await device_controller.set_device_led_async(device_id, json_data['state'])
+        return JSONResponse(response, status_code=404 if device_controller.is_not_found(response) else 200)
+    except Exception as e:
+        return error_response(f"LED control error: {str(e)}", 500)
+
+
+async def group_led(request):
+    """Send one LED command to every device in a group, concurrently"""
+    try:
+        json_data = await read_json(request)
+        if not json_data or 'state' not in json_data:
+            return error_response("Missing 'state' parameter", 400)
+        return JSONResponse(await device_controller.set_group_led_async(request.path_params['group'], json_data['state']))
+    except Exception as e:
+        return error_response(f"Group LED control error: {str(e)}", 500)
+
+
+async def get_alerts(request):
+    """Alerts that have fired and whose condition still holds"""
+    alerts = data_controller.alerts
+    if alerts is None:
+        return error_response("Alerting is disabled", 404)
+    return JSONResponse({"status": "success", "data": alerts.active(), "stats": alerts.stats})
+
+
+async def health(request):
+    """Liveness: the process is up and serving requests"""
+    return JSONResponse({"status": "success", "message": "ok"})
+
+
+async def readiness(request):
+    """Readiness: MongoDB answers a ping; includes connection pool stats"""
+    try:
+        ready, report = await data_controller.readiness()
+    except Exception as e:
+        ready, report = False, {"error": str(e)}
+    return JSONResponse({
+        "status": "success" if ready else "error",
+        "data": report
+    }, status_code=200 if ready else 503)
+
+
+async def metrics(request):
+    """Prometheus metrics for this process"""
+    return Response(registry.render(), media_type=registry.CONTENT_TYPE)
+
+
+async def profile(request):
+    """Sample every thread for `seconds` (default 10) and return folded stacks for a flame graph"""
+    if not profiler_enabled():
+        return error_response("Profiler is disabled", 404)
+    try:
+        seconds = float(request.query_params.get('seconds', '10'))
+    except ValueError:
+        return error_response("Invalid 'seconds' parameter", 400)
+    # The event loop thread keeps running (and is sampled) while an executor thread captures
+    stacks = await asyncio.get_running_loop().run_in_executor(None, profiler.capture, seconds)
+    if stacks is None:
+        return error_response("A profile is already being captured", 409)
+    return Response(stacks, media_type='text/plain')
+
+
+routes = [
+    Route('/data', receive_data, methods=['POST']),
+    Route('/data/batch', receive_data_batch, methods=['POST']),
+    Route('/telemetry', get_telemetry, methods=['GET']),
+    Route('/telemetry/stream', stream_telemetry, methods=['GET']),
+    WebSocketRoute('/telemetry/ws', telemetry_ws),
+    Route('/telemetry/history', get_telemetry_history, methods=['GET']),
+    Route('/telemetry/export', export_telemetry, methods=['GET']),
+    Route('/telemetry/records', get_telemetry_records, methods=['GET']),
+    Route('/led', control_led, methods=['POST']),
+    Route('/led/status', get_led_status, methods=['GET']),
+    Route('/led/toggle', toggle_led, methods=['POST']),
+    Route('/coreiot/health', get_coreiot_health, methods=['GET']),
+    Route('/devices', list_devices, methods=['GET']),
+    Route('/devices/{device_id}/telemetry', get_device_telemetry, methods=['GET']),
+    Route('/devices/{device_id}/led', device_led, methods=['GET', 'POST']),
+    Route('/devices/groups/{group}/led', group_led, methods=['POST']),
+    Route('/alerts', get_alerts, methods=['GET']),
+    Route('/health', health, methods=['GET']),
+    Route('/health/ready', readiness, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/debug/profile', profile, methods=['POST'])
+]
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+
+def init_controllers():
+    """Build the controllers the routes use; ones already set (e.g. by a test) are kept"""
+    global data_controller, led_controller, device_controller, admission
+    if data_controller is None:
+        data_controller = AsyncDataController()
+    if led_controller is None:
+        led_controller = LEDController()
+    if device_controller is None:
+        device_controller = DeviceController(data_controller)
+    if admission is None:
+        admission = AdmissionControl.from_env()
+
+
+def create_app(config=Config):
+    """Build the ASGI app. Controllers are created here and connect to MongoDB and CoreIOT on first use."""
+    started = time.perf_counter()
+    configure_logging()
+    init_controllers()
+    application = Starlette(
+        debug=config.DEBUG,
+        routes=routes,
+        middleware=[
+            Middleware(ASGIMetricsMiddleware),
+            Middleware(CORSMiddleware, allow_origins=config.CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"]),
+            Middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE, compresslevel=COMPRESS_LEVEL)
+        ]
+    )
+    create_seconds = time.perf_counter() - started
+    app_startup.set_function(lambda: IMPORT_SECONDS, 'asgi', 'import')
+    app_startup.set_function(lambda: create_seconds, 'asgi', 'create_app')
+    logger.info("App created", extra={"import_ms": round(IMPORT_SECONDS * 1000, 1), "create_ms": round(create_seconds * 1000, 1)})
+    return application
+
+
+def __getattr__(name):
+    # `asgi:app` for servers without --factory; created on first access instead of at import
+    if name == 'app':
+        application = globals()['app'] = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
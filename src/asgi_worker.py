@@ -0,0 +1,12 @@
+import os
+from uvicorn.workers import UvicornWorker
+
+class GatewayUvicornWorker(UvicornWorker):
+    """Uvicorn worker with connection limits suited to many idle device/dashboard clients"""
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        # Beyond this many concurrent connections/tasks new requests get 503
+        "limit_concurrency": int(os.getenv('ASGI_LIMIT_CONCURRENCY', '4000')),
+        "timeout_keep_alive": int(os.getenv('ASGI_KEEPALIVE', '30'))
+    }
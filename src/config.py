@@ -0,0 +1,15 @@
+class Config:
+    DEBUG = False
+    TESTING = False
+    SECRET_KEY = 'your_secret_key'
+    DATABASE_URI = 'sqlite:///your_database.db'
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    API_VERSION = 'v1'
+    # Browser origins allowed to call the API (the dashboard's dev server)
+    CORS_ORIGINS = ["http://localhost:5173"]
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+class TestingConfig(Config):
+    TESTING = True
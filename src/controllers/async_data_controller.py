@@ -0,0 +1,166 @@
+import logging
+from datetime import datetime
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from controllers.data_controller import DataController
+from services.rollups import ROLLUP_STATE
+from utils.db_connection import async_readiness, get_async_database, shared_async_client
+from services.telemetry_queries import (
+    KEYSET_SORT, after_cursor, columnar_stage, encode_cursor, export_row, format_bucket, range_query
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncDataController(DataController):
+    """DataController for the ASGI app, backed by the motor async driver.
+
+    Validation, the latest-value cache and live fan-out are inherited; every
+    method that talks to MongoDB is a coroutine instead.
+    """
+
+    def __init__(self, db=None, hub=None, rollups=None):
+        super().__init__(db=db, hub=hub, rollups=rollups)
+
+    def connect(self):
+        return get_async_database()
+
+    async def readiness(self):
+        return await async_readiness(shared_async_client, self.db)
+
+    def create_write_buffer(self):
+        # Motor inserts never block the event loop, so there is no write-behind queue
+        return None
+
+    def create_spool(self):
+        # The spool replayer writes with the sync driver; ASGI mode has no spool
+        return None
+
+    async def update_rollups(self, documents):
+        if self.rollups is None or not documents:
+            return
+        try:
+            await self.record_rollup_coverage()
+            for name, operations in self.rollups.operations(documents).items():
+                await self.db[name].bulk_write(operations, ordered=True)
+        except Exception as e:
+            logger.error("Error updating rollups: %s", e)
+
+    async def record_rollup_coverage(self):
+        if self.rollups.coverage_recorded:
+            return
+        for query, update in self.rollups.coverage_updates(datetime.utcnow()):
+            try:
+                await self.db[ROLLUP_STATE].update_one(query, update, upsert=True)
+            except DuplicateKeyError:
+                pass  # another process recorded it first
+        self.rollups.coverage_recorded = True
+
+    async def refresh_rollup_coverage(self):
+        if self.rollups is not None and self.rollups.coverage_stale():
+            self.rollups.set_coverage(await self.db[ROLLUP_STATE].find().to_list(length=None))
+
+    async def receive_data(self, json_data):
+        try:
+            if self.db is None:
+                return {"status": "error", "message": "Database connection failed"}
+
+            document, error = self.build_document(json_data)
+            if error:
+                return {"status": "error", "message": error}
+
+            if self.is_duplicate(document):
+                return self.duplicate_response()
+
+            result = await self.db['sensor_data'].insert_one(document)
+            await self.update_rollups([document])
+            self.accepted([document])
+
+            return {
+                "status": "success",
+                "message": "Data saved successfully",
+                "id": str(result.inserted_id)
+            }
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Failed to save data: {str(e)}"
+            }
+
+    async def receive_batch(self, json_data):
+        """Validate and store an array of readings, reporting errors per item"""
+        if self.db is None:
+            return {"status": "error", "message": "Database connection failed"}
+
+        error, documents, indexes, errors, duplicates = self.prepare_batch(json_data)
+        if error:
+            return error
+
+        failed = set()
+        if documents:
+            try:
+                await self.db['sensor_data'].insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                failed = self.bulk_write_failures(e, indexes, errors)
+            except Exception as e:
+                return {
+                    "status": "error",
+                    "message": f"Failed to save data: {str(e)}"
+                }
+            await self.update_rollups([document for i, document in enumerate(documents) if i not in failed])
+
+        return self.batch_result(documents, failed, errors, duplicates)
+
+    async def get_latest_telemetry(self, device=None):
+        return (await self.get_latest_telemetry_entry(device))[0]
+
+    async def get_latest_telemetry_entry(self, device=None):
+        """Return (data, etag) for the latest reading of a device, or of any device"""
+        try:
+            if self.db is None:
+                return None, None
+
+            cached = self.latest_cache.peek(device)
+            if cached is not None:
+                return cached
+
+            query = {'localIp': device} if device else {}
+            document = await self.db['sensor_data'].find_one(query, sort=[('timestamp', -1)])
+            return self.latest_cache.store(device, document)
+        except Exception as e:
+            logger.error("Error fetching telemetry data: %s", e)
+            return None, None
+
+    async def get_telemetry_history(self, start, end, bucket, agg='avg', device=None, max_points=500):
+        if self.db is None:
+            return None
+
+        await self.refresh_rollup_coverage()
+        source, pipeline = self.history_query(start, end, bucket, agg, device, max_points)
+        buckets = await self.db[source].aggregate(pipeline).to_list(length=None)
+        return [format_bucket(bucket) for bucket in buckets]
+
+    async def get_telemetry_history_columns(self, start, end, bucket, agg='avg', device=None, max_points=500):
+        if self.db is None:
+            return None
+
+        await self.refresh_rollup_coverage()
+        source, pipeline = self.history_query(start, end, bucket, agg, device, max_points)
+        columns = await self.db[source].aggregate(pipeline + [columnar_stage()]).to_list(length=1)
+        return columns[0] if columns else {}
+
+    async def iter_export(self, start=None, end=None, device=None, batch_size=1000):
+        """Async generator of export rows from a batched cursor"""
+        cursor = self.db['sensor_data'].find(range_query(start, end, device)).sort(KEYSET_SORT).batch_size(batch_size)
+        try:
+            async for document in cursor:
+                yield export_row(document)
+        finally:
+            await cursor.close()
+
+    async def get_records_page(self, start=None, end=None, device=None, limit=100, cursor=None):
+        query = range_query(start, end, device)
+        if cursor:
+            query = after_cursor(query, cursor)
+
+        documents = await self.db['sensor_data'].find(query).sort(KEYSET_SORT).limit(limit + 1).to_list(length=None)
+        next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+        return [export_row(document) for document in documents[:limit]], next_cursor
@@ -1,82 +1,444 @@
+import atexit
+import logging
+import os
+import threading
 from datetime import datetime
-from utils.db_connection import MongoDBConnection
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from models.data_models import telemetry_model
+from utils.db_connection import get_database, is_timeseries, readiness, shared_client
+from utils.metrics import queue_depth, spool_oldest_age, spool_replay_rate
+from services.write_buffer import WriteBehindBuffer, IngestQueueFull
+from services.spool import SPOOL_ERRORS, SpoolReplayer, open_spool
+from services.admission import Deduplicator
+from services.alerts import AlertEngine
+from services.rollups import ROLLUP_STATE, RollupStore
+from services.telemetry_cache import LatestValueCache
+from services.telemetry_hub import telemetry_hub
+from services.telemetry_queries import (
+    BUCKET_SIZES, KEYSET_SORT, after_cursor, columnar_stage, encode_cursor, export_row,
+    format_bucket, history_pipeline, range_query
+)
+
+logger = logging.getLogger(__name__)
 
 class DataController:
-    def __init__(self):
-        self.db_connection = MongoDBConnection()
-        self.db = self.db_connection.connect()
+    def __init__(self, db=None, write_buffer=None, hub=None, rollups=None, spool=None, deduplicator=None, alerts=None):
+        """Use the given database, write buffer, rollups and spool, or the shared MONGO_URI client.
+
+        Without an injected database nothing is opened here: the shared client
+        and the env-configured write buffer, rollups and spool are set up on
+        first use, so constructing a controller at import time never touches
+        the network or the disk.
+        """
+        self.max_batch_size = int(os.getenv('INGEST_MAX_BATCH_SIZE', '1000'))
+        self.latest_cache = LatestValueCache(ttl=float(os.getenv('TELEMETRY_CACHE_TTL', '5.0')))
+        self.hub = hub if hub is not None else telemetry_hub
+        self.deduplicator = deduplicator if deduplicator is not None else Deduplicator.from_env()
+        # Alert actions run on their own thread, so they use the sync client even in ASGI mode
+        self.alerts = alerts if alerts is not None else AlertEngine.from_env(database=get_database)
+        self._db = db
+        self._write_buffer = write_buffer
+        self._rollups = rollups
+        self._spool = spool
+        self._replayer = None
+        self._timeseries = None
+        self._shared = db is None
+        self._set_up = not self._shared
+        self._setup_lock = threading.Lock()
+
+    @property
+    def db(self):
+        """The injected database, or the process-wide shared one (None if unusable)"""
+        return self.connect() if self._shared else self._db
+
+    @property
+    def write_buffer(self):
+        self._ensure_set_up()
+        return self._write_buffer
+
+    @property
+    def rollups(self):
+        self._ensure_set_up()
+        return self._rollups
+
+    @property
+    def spool(self):
+        self._ensure_set_up()
+        return self._spool
+
+    def connect(self):
+        """The database configured by MONGO_URI; None if it is unusable"""
+        return get_database()
+
+    def readiness(self):
+        """Ping MongoDB and report pool and queue stats; returns (ready, report)"""
+        ready, report = readiness(shared_client, self.db)
+        if self.write_buffer is not None:
+            report["write_behind"] = dict(self.write_buffer.stats, depth=self.write_buffer.depth())
+        if self.spool is not None:
+            report["spool"] = self._replayer.metrics() if self._replayer is not None else self.spool.metrics()
+        return ready, report
+
+    def sensor_data_timeseries(self):
+        """Whether sensor_data is a time-series collection, which does not enforce unique _id; cached once known"""
+        if self._timeseries is None:
+            try:
+                self._timeseries = is_timeseries(self.db, 'sensor_data')
+            except Exception as e:
+                logger.warning("Could not tell whether sensor_data is a time-series collection: %s", e)
+                return False
+        return self._timeseries
+
+    def _ensure_set_up(self):
+        """Create the env-configured spool, write buffer and rollups once, on first use"""
+        if self._set_up:
+            return
+        with self._setup_lock:
+            if self._set_up:
+                return
+            # The spool is useful precisely when the database is not
+            self._spool = self.create_spool()
+            if self.db is not None:
+                self._rollups = self.create_rollups()
+                self._write_buffer = self.create_write_buffer()
+            self._set_up = True
+
+    def create_write_buffer(self):
+        """Optional write-behind mode: readings are queued and flushed in batches"""
+        if os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() not in ['true', '1', 'yes', 'on']:
+            return None
+        write_buffer = WriteBehindBuffer(
+            self.db['sensor_data'],
+            max_queue=int(os.getenv('WRITE_BEHIND_MAX_QUEUE', '10000')),
+            batch_size=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500')),
+            max_age=float(os.getenv('WRITE_BEHIND_MAX_AGE', '1.0')),
+            on_written=self.update_rollups,
+            on_dropped=self._spool.append if self._spool is not None else None,
+            check_stored=self.sensor_data_timeseries
+        )
+        atexit.register(write_buffer.close)
+        queue_depth.set_function(write_buffer.depth, 'write_behind')
+        return write_buffer
+
+    def create_spool(self):
+        """Optional local spool: readings are kept on disk while MongoDB is down and replayed later"""
+        if os.getenv('SPOOL_ENABLED', 'false').lower() not in ['true', '1', 'yes', 'on']:
+            return None
+        spool = open_spool(
+            os.getenv('SPOOL_DIR', 'spool'),
+            segment_size=int(os.getenv('SPOOL_SEGMENT_SIZE', str(16 * 1024 * 1024))),
+            sync=os.getenv('SPOOL_SYNC', 'false').lower() in ['true', '1', 'yes', 'on']
+        )
+        self._replayer = SpoolReplayer(
+            spool,
+            lambda: self.db['sensor_data'] if self.db is not None else None,
+            batch_size=int(os.getenv('SPOOL_REPLAY_BATCH_SIZE', '500')),
+            on_written=self.update_rollups,
+            check_stored=self.sensor_data_timeseries
+        )
+        self._replayer.start()
+        atexit.register(spool.close)
+        atexit.register(self._replayer.stop)
+        queue_depth.set_function(spool.depth, 'spool')
+        spool_oldest_age.set_function(lambda: spool.metrics()["oldest_age_seconds"])
+        spool_replay_rate.set_function(lambda: self._replayer.metrics()["replay_per_second"])
+        return spool
+
+    def create_rollups(self):
+        """Minute/hour rollups maintained at ingest and used by history queries"""
+        if os.getenv('TELEMETRY_ROLLUPS_ENABLED', 'true').lower() not in ['true', '1', 'yes', 'on']:
+            return None
+        return RollupStore(self.db)
+
+    def update_rollups(self, documents):
+        """Fold stored readings into the rollups; a failure never fails the ingest"""
+        if self.rollups is None or not documents:
+            return
+        try:
+            self.record_rollup_coverage()
+            self.rollups.apply(documents)
+        except Exception as e:
+            logger.error("Error updating rollups: %s", e)
+
+    def record_rollup_coverage(self):
+        """Once per process, mark the rollups complete from the next hour unless coverage is already recorded"""
+        if self.rollups.coverage_recorded:
+            return
+        for query, update in self.rollups.coverage_updates(datetime.utcnow()):
+            try:
+                self.db[ROLLUP_STATE].update_one(query, update, upsert=True)
+            except DuplicateKeyError:
+                pass  # another process recorded it first
+        self.rollups.coverage_recorded = True
+
+    def refresh_rollup_coverage(self):
+        if self.rollups is not None and self.rollups.coverage_stale():
+            self.rollups.set_coverage(self.db[ROLLUP_STATE].find())
     
+    def build_document(self, json_data):
+        """Validate a reading and build its document; returns (document, error)"""
+        document, error = telemetry_model.validate(json_data)
+        if error:
+            return None, error
+
+        document["_id"] = ObjectId()
+        document["timestamp"] = datetime.utcnow()
+        return document, None
+
+    def is_duplicate(self, document):
+        """True if de-duplication is on and the device just sent the same reading"""
+        return self.deduplicator is not None and self.deduplicator.is_duplicate(document)
+
+    def duplicate_response(self):
+        return {"status": "success", "message": "Duplicate reading dropped", "duplicate": True}
+
+    def accepted(self, documents):
+        """Update the latest-value cache, notify live subscribers and evaluate alert rules"""
+        for document in documents:
+            self.latest_cache.update(document)
+            self.hub.publish(document)
+            if self.alerts is not None:
+                self.alerts.evaluate(document)
+
+    def spooling(self):
+        """True while new readings should go to the spool: the database is unusable or it is still draining"""
+        return self.spool is not None and (self.db is None or self.spool.depth() > 0)
+
     def receive_data(self, json_data):
         try:
             # Check if database connection exists properly
-            if self.db is None:
+            if self.db is None and self.spool is None:
                 return {"status": "error", "message": "Database connection failed"}
             
-            # Extract and validate fields from request body
-            temperature = json_data.get("temperature")
-            humidity = json_data.get("humidity")
-            light = json_data.get("light")
-            lightPercentage = json_data.get("lightPercentage")
-            rssi = json_data.get("rssi")
-            localIp = json_data.get("localIp")
-            
-            # Validate required fields
-            if None in (temperature, humidity, light, lightPercentage, rssi, localIp):
-                return {"status": "error", "message": "Missing required fields"}
-            
-            # Create document to insert
-            document = {
-                "temperature": temperature,
-                "humidity": humidity,
-                "light": light,
-                "lightPercentage": lightPercentage,
-                "rssi": rssi,
-                "localIp": localIp,
-                "timestamp": datetime.utcnow()
-            }
+            document, error = self.build_document(json_data)
+            if error:
+                return {"status": "error", "message": error}
+
+            if self.is_duplicate(document):
+                return self.duplicate_response()
+
+            if self.spooling():
+                return self.spooled_response(document)
             
+            if self.write_buffer is not None:
+                # Raises IngestQueueFull so the route can apply backpressure
+                self.write_buffer.submit([document])
+                self.accepted([document])
+                return {
+                    "status": "success",
+                    "message": "Data accepted",
+                    "id": str(document["_id"])
+                }
+
             # Insert data into MongoDB collection
             collection = self.db['sensor_data']
-            result = collection.insert_one(document)
+            try:
+                result = collection.insert_one(document)
+            except SPOOL_ERRORS:
+                if self.spool is None:
+                    raise
+                return self.spooled_response(document)
+            self.update_rollups([document])
+            self.accepted([document])
             
             return {
                 "status": "success", 
                 "message": "Data saved successfully",
                 "id": str(result.inserted_id)
             }
+        except IngestQueueFull:
+            raise
         except Exception as e:
             return {
                 "status": "error", 
                 "message": f"Failed to save data: {str(e)}"
             }
+
+    def spooled_response(self, document):
+        """Keep a reading in the local spool for the replayer to write later"""
+        self.spool.append([document])
+        self.accepted([document])
+        return {
+            "status": "success",
+            "message": "Data spooled",
+            "id": str(document["_id"])
+        }
+
+    def receive_batch(self, json_data):
+        """Validate and store an array of readings, reporting errors per item"""
+        if self.db is None and self.spool is None:
+            return {"status": "error", "message": "Database connection failed"}
+
+        error, documents, indexes, errors, duplicates = self.prepare_batch(json_data)
+        if error:
+            return error
+
+        failed = set()
+        if documents:
+            if self.spooling():
+                self.spool.append(documents)
+            elif self.write_buffer is not None:
+                # Raises IngestQueueFull so the route can apply backpressure
+                self.write_buffer.submit(documents)
+            else:
+                try:
+                    self.db['sensor_data'].insert_many(documents, ordered=False)
+                    self.update_rollups(documents)
+                except BulkWriteError as e:
+                    failed = self.bulk_write_failures(e, indexes, errors)
+                    self.update_rollups([document for i, document in enumerate(documents) if i not in failed])
+                except Exception as e:
+                    if self.spool is None or not isinstance(e, SPOOL_ERRORS):
+                        return {
+                            "status": "error",
+                            "message": f"Failed to save data: {str(e)}"
+                        }
+                    # Readings the insert already stored are skipped as duplicates on replay
+                    self.spool.append(documents)
+
+        return self.batch_result(documents, failed, errors, duplicates)
+
+    def prepare_batch(self, json_data):
+        """Validate a batch; returns (error_response, documents, indexes, errors, duplicates)"""
+        if not isinstance(json_data, list):
+            return {"status": "error", "message": "Expected a JSON array of readings"}, [], [], [], 0
+
+        if len(json_data) > self.max_batch_size:
+            return {
+                "status": "error",
+                "message": f"Batch too large (max {self.max_batch_size} readings)"
+            }, [], [], [], 0
+
+        documents = []
+        indexes = []
+        errors = []
+        duplicates = 0
+        for index, item in enumerate(json_data):
+            document, error = self.build_document(item)
+            if error:
+                errors.append({"index": index, "message": error})
+            elif self.is_duplicate(document):
+                duplicates += 1
+            else:
+                documents.append(document)
+                indexes.append(index)
+        return None, documents, indexes, errors, duplicates
+
+    def bulk_write_failures(self, error, indexes, errors):
+        """Record per-item errors from an unordered insert_many; returns failed positions"""
+        failed = set()
+        for write_error in error.details.get("writeErrors", []):
+            failed.add(write_error["index"])
+            errors.append({
+                "index": indexes[write_error["index"]],
+                "message": f"Failed to save data: {write_error.get('errmsg')}"
+            })
+        return failed
+
+    def batch_result(self, documents, failed, errors, duplicates=0):
+        """Publish the stored readings and build the batch response"""
+        stored = [document for i, document in enumerate(documents) if i not in failed]
+        self.accepted(stored)
+
+        ids = [str(document["_id"]) for document in stored]
+        errors.sort(key=lambda error: error["index"])
+
+        if not errors:
+            status = "success"
+        elif ids:
+            status = "partial"
+        else:
+            status = "error"
+
+        return {
+            "status": status,
+            "accepted": len(ids),
+            "rejected": len(errors),
+            "duplicates": duplicates,
+            "ids": ids,
+            "errors": errors
+        }
     
-    def get_latest_telemetry(self):
-        """Get the latest telemetry data from database"""
+    def get_latest_telemetry(self, device=None):
+        """Get the latest telemetry data, served from the in-memory cache"""
+        return self.get_latest_telemetry_entry(device)[0]
+
+    def get_latest_telemetry_entry(self, device=None):
+        """Return (data, etag) for the latest reading of a device, or of any device"""
         try:
             if self.db is None:
-                return None
-            
-            collection = self.db['sensor_data']
-            latest_data = collection.find_one(sort=[('timestamp', -1)])
-            
-            if latest_data:
-                # Convert MongoDB document to the expected format
-                return {
-                    'temp': {
-                        'value': latest_data.get('temperature'),
-                        'unit': 'C'
-                    },
-                    'humid': {
-                        'value': latest_data.get('humidity'),
-                        'unit': '%'
-                    },
-                    'light': {
-                        'value': latest_data.get('light'),
-                        'unit': 'lux'
-                    },
-                    'timestamp': latest_data.get('timestamp').isoformat() if latest_data.get('timestamp') else None
-                }
-            return None
+                return None, None
+
+            def load_latest():
+                collection = self.db['sensor_data']
+                query = {'localIp': device} if device else {}
+                return collection.find_one(query, sort=[('timestamp', -1)])
+
+            return self.latest_cache.get(device, load_latest)
         except Exception as e:
-            print(f"Error fetching telemetry data: {e}")
-            return None
\ No newline at end of file
+            logger.error("Error fetching telemetry data: %s", e)
+            return None, None
+
+    def get_telemetry_history(self, start, end, bucket, agg='avg', device=None, max_points=500):
+        """Downsample readings between start and end into time buckets in MongoDB.
+
+        Returns the list of buckets, or None if the database is unavailable.
+        """
+        if self.db is None:
+            return None
+
+        self.refresh_rollup_coverage()
+        source, pipeline = self.history_query(start, end, bucket, agg, device, max_points)
+        buckets = self.db[source].aggregate(pipeline)
+        return [format_bucket(bucket) for bucket in buckets]
+
+    def get_telemetry_history_columns(self, start, end, bucket, agg='avg', device=None, max_points=500):
+        """Same buckets as get_telemetry_history, folded by MongoDB into parallel arrays.
+
+        Returns {'timestamps', 'count', <field>: [...]} (empty if no buckets),
+        or None if the database is unavailable.
+        """
+        if self.db is None:
+            return None
+
+        self.refresh_rollup_coverage()
+        source, pipeline = self.history_query(start, end, bucket, agg, device, max_points)
+        for columns in self.db[source].aggregate(pipeline + [columnar_stage()]):
+            return columns
+        return {}
+
+    def history_query(self, start, end, bucket, agg, device, max_points):
+        """(collection, pipeline) for a history request: a rollup covering the range, else raw sensor_data"""
+        if self.rollups is not None:
+            query = self.rollups.history_query(start, end, BUCKET_SIZES[bucket], agg=agg, device=device, max_points=max_points)
+            if query is not None:
+                return query
+        return 'sensor_data', history_pipeline(start, end, BUCKET_SIZES[bucket], agg=agg, device=device, max_points=max_points)
+
+    def iter_export(self, start=None, end=None, device=None, batch_size=1000):
+        """Yield export rows in time order from a batched cursor.
+
+        Only one cursor batch is held in memory at a time, so memory stays
+        flat regardless of how many readings are in range.
+        """
+        cursor = self.db['sensor_data'].find(range_query(start, end, device)).sort(KEYSET_SORT).batch_size(batch_size)
+        try:
+            for document in cursor:
+                yield export_row(document)
+        finally:
+            cursor.close()
+
+    def get_records_page(self, start=None, end=None, device=None, limit=100, cursor=None):
+        """One page of readings using keyset pagination on (timestamp, _id).
+
+        Returns (rows, next_cursor); next_cursor is None on the last page.
+        Raises ValueError for a malformed cursor.
+        """
+        query = range_query(start, end, device)
+        if cursor:
+            query = after_cursor(query, cursor)
+
+        documents = list(self.db['sensor_data'].find(query).sort(KEYSET_SORT).limit(limit + 1))
+        next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+        return [export_row(document) for document in documents[:limit]], next_cursor
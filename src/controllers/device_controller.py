@@ -0,0 +1,171 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from controllers.led_controller import LEDController
+from services.coreiot_service import CoreIOTService
+from services.device_registry import DeviceRegistry, public_device
+from utils.db_connection import get_database
+
+
+class DeviceController:
+    """Per-device telemetry and LED control for a fleet of registered devices.
+
+    Every device gets its own LEDController (and so its own last confirmed
+    state) on top of a CoreIOTService for its token. Services share the
+    process-wide MQTT pool, so each token keeps one warm connection. There is
+    one service per token, closed once no device uses the token any more.
+    Only the `max_leds` most recently used LEDControllers are kept on top of
+    them, so an evicted device starts over with no known LED state.
+    """
+
+    def __init__(self, data_controller, registry=None, service_factory=None, max_leds=None):
+        self.data_controller = data_controller
+        self.registry = registry if registry is not None else DeviceRegistry(
+            get_database, ttl=float(os.getenv('DEVICE_REGISTRY_TTL', '60'))
+        )
+        self.rpc_timeout = float(os.getenv('COREIOT_RPC_TIMEOUT', '5.0'))
+        self.service_factory = service_factory or (lambda token: CoreIOTService(token=token, rpc_timeout=self.rpc_timeout))
+        self.max_leds = max_leds if max_leds is not None else int(os.getenv('DEVICE_LED_CACHE_SIZE', '1024'))
+        self._services = {}
+        self._tokens = {}
+        self._leds = OrderedDict()
+        self._lock = threading.Lock()
+        alerts = getattr(data_controller, 'alerts', None)
+        if alerts is not None and alerts.rpc is None:
+            # Alert rules with an rpc action command registered devices
+            alerts.rpc = self.send_rpc
+
+    def led_controller(self, device):
+        """LEDController for a device document, reused while its token is unchanged"""
+        with self._lock:
+            service = self._service(device)
+            led = self._leds.get(device['_id'])
+            if led is None or led.coreiot_service is not service:
+                led = LEDController(coreiot_service=service)
+                self._leds[device['_id']] = led
+            self._leds.move_to_end(device['_id'])
+            while len(self._leds) > self.max_leds:
+                self._leds.popitem(last=False)
+            return led
+
+    def _service(self, device):
+        # Called with self._lock held: one service, so one response handler, per token
+        token = device['token']
+        previous = self._tokens.get(device['_id'])
+        self._tokens[device['_id']] = token
+        if previous is not None and previous != token and previous not in self._tokens.values():
+            # The device was given a new token and nothing else uses the old one
+            self._services.pop(previous).close()
+        service = self._services.get(token)
+        if service is None:
+            service = self._services[token] = self.service_factory(token)
+        return service
+
+    def send_rpc(self, device_id, method, params):
+        """Send an RPC to a registered device; returns a Future of its response"""
+        device = self.registry.get(device_id)
+        if device is None:
+            raise ValueError(f"Unknown device '{device_id}'")
+        return self.led_controller(device).coreiot_service.call_rpc(method, params)
+
+    def not_found(self, device_id):
+        return {"status": "error", "message": f"Unknown device '{device_id}'", "notFound": True}
+
+    @staticmethod
+    def is_not_found(response):
+        return response.get("notFound", False)
+
+    def list_devices(self):
+        return {"status": "success", "data": [public_device(device) for device in self.registry.list()]}
+
+    def get_device_telemetry(self, device_id):
+        """Latest reading of one device; returns (response, etag)"""
+        device = self.registry.get(device_id)
+        if device is None:
+            return self.not_found(device_id), None
+        data, etag = self.data_controller.get_latest_telemetry_entry(device.get('localIp', device_id))
+        return {"status": "success", "device": device_id, "data": data}, etag
+
+    def set_device_led(self, device_id, state):
+        device = self.registry.get(device_id)
+        if device is None:
+            return self.not_found(device_id)
+        return dict(self.led_controller(device).set_led_state(state), device=device_id)
+
+    def get_device_led(self, device_id):
+        device = self.registry.get(device_id)
+        if device is None:
+            return self.not_found(device_id)
+        return dict(self.led_controller(device).get_led_state(), device=device_id)
+
+    def set_group_led(self, group, state):
+        """Send an LED command to every device in a group and report per-device results.
+
+        All commands are published before any reply is awaited, so the whole
+        group completes in about one RPC round trip rather than one per device.
+        """
+        devices = self.registry.group(group)
+        if not devices:
+            return {"status": "error", "message": f"No devices in group '{group}'"}
+
+        parsed = LEDController.parse_state(state)
+        if parsed is None:
+            return {"status": "error", "message": "Invalid state value"}
+
+        results = {}
+        in_flight = []
+        for device in devices:
+            led = self.led_controller(device)
+            if led.commands is not None:
+                results[device['_id']] = led.queue_led_state(parsed)
+            else:
+                in_flight.append((device['_id'], led, led.send_led_state(parsed)))
+
+        results.update((device_id, led.led_result(parsed, future)) for device_id, led, future in in_flight)
+        return self.group_result(group, results)
+
+    async def lookup(self, method, *args):
+        """Run a registry call off the event loop; it only touches MongoDB on a cache miss"""
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def get_device_telemetry_async(self, device_id):
+        device = await self.lookup(self.registry.get, device_id)
+        if device is None:
+            return self.not_found(device_id), None
+        data, etag = await self.data_controller.get_latest_telemetry_entry(device.get('localIp', device_id))
+        return {"status": "success", "device": device_id, "data": data}, etag
+
+    async def set_device_led_async(self, device_id, state):
+        device = await self.lookup(self.registry.get, device_id)
+        if device is None:
+            return self.not_found(device_id)
+        return dict(await self.led_controller(device).set_led_state_async(state), device=device_id)
+
+    async def set_group_led_async(self, group, state):
+        """set_group_led for the ASGI app: the commands are awaited together"""
+        devices = await self.lookup(self.registry.group, group)
+        if not devices:
+            return {"status": "error", "message": f"No devices in group '{group}'"}
+        if LEDController.parse_state(state) is None:
+            return {"status": "error", "message": "Invalid state value"}
+
+        leds = [(device['_id'], self.led_controller(device)) for device in devices]
+        responses = await asyncio.gather(*(led.set_led_state_async(state) for _, led in leds))
+        return self.group_result(group, {device_id: response for (device_id, _), response in zip(leds, responses)})
+
+    def group_result(self, group, results):
+        confirmed = sum(1 for result in results.values() if result["status"] == "success")
+        if confirmed == len(results):
+            status = "success"
+        elif confirmed:
+            status = "partial"
+        else:
+            status = "error"
+        return {
+            "status": status,
+            "group": group,
+            "confirmed": confirmed,
+            "failed": len(results) - confirmed,
+            "results": results
+        }
@@ -1,57 +1,189 @@
-from services.coreiot_service import CoreIOTService
+import asyncio
+from services.command_queue import CommandCoalescer
+from services.coreiot_service import LED_METHOD, CoreIOTService
+from services.async_coreiot_service import AsyncCoreIOTService
+from services.rpc_client import RPCError
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+ON_VALUES = ('true', '1', 'on', 'yes')
+OFF_VALUES = ('false', '0', 'off', 'no')
+
+# Extra time on top of the RPC timeout before the request thread stops waiting
+RESULT_WAIT_SLACK = 1.0
 
 class LEDController:
-    def __init__(self):
+    def __init__(self, coreiot_service=None):
         self.coreiot_token = os.getenv('COREIOT_TOKEN', '')
-        self.coreiot_service = CoreIOTService(token=self.coreiot_token)
+        self.rpc_timeout = float(os.getenv('COREIOT_RPC_TIMEOUT', '5.0'))
+        if coreiot_service is None:
+            coreiot_service = CoreIOTService(token=self.coreiot_token, rpc_timeout=self.rpc_timeout)
+        self.coreiot_service = coreiot_service
+        self.rpc_timeout = coreiot_service.rpc_timeout
+        self.async_coreiot_service = AsyncCoreIOTService(coreiot_service)
         self.last_led_state = None
+        self.commands = self.create_command_queue()
+
+    def create_command_queue(self):
+        """Optional coalescing mode: commands are debounced and answered before the device confirms"""
+        window = float(os.getenv('LED_DEBOUNCE_WINDOW', '0'))
+        if window <= 0:
+            return None
+        return CommandCoalescer(self.coreiot_service.call_rpc, window, confirm=self._record_confirmed)
+
+    def _record_confirmed(self, method, state, response):
+        self.last_led_state = self.confirmed_state(response, state)
+        return self.last_led_state
+
+    @staticmethod
+    def parse_state(state):
+        """Normalize a requested LED state; returns None if it is not valid"""
+        if isinstance(state, str):
+            return state.lower() in ON_VALUES
+        elif isinstance(state, bool):
+            return state
+        elif isinstance(state, int):
+            return bool(state)
+        return None
+
+    def confirmed_state(self, response, requested):
+        """Extract the LED state reported in the device's RPC response.
+
+        Only booleans, ints and known on/off strings count as a reported state;
+        any other acknowledgement (e.g. "success") confirms the requested state.
+        """
+        if isinstance(response, dict):
+            for key in ('ledState', 'state', 'value', 'params'):
+                if key in response:
+                    response = response[key]
+                    break
+        if isinstance(response, (bool, int)):
+            return bool(response)
+        if isinstance(response, str):
+            value = response.strip().lower()
+            if value in ON_VALUES:
+                return True
+            if value in OFF_VALUES:
+                return False
+        return requested
+
+    def send_led_state(self, state):
+        """Send the LED command; returns a Future resolving to the device's response"""
+        return self.coreiot_service.send_led_command(state)
+
+    def led_result(self, state, future):
+        """Build the API response for a completed LED command Future"""
+        try:
+            response = future.result(timeout=self.rpc_timeout + RESULT_WAIT_SLACK)
+        except RPCError as e:
+            return self.not_confirmed(str(e))
+        except FutureTimeoutError:
+            return self.not_confirmed("timed out")
+        return self.confirmed_result(state, response)
+
+    def not_confirmed(self, reason):
+        return {
+            "status": "error",
+            "message": f"LED command not confirmed by device: {reason}"
+        }
+
+    def confirmed_result(self, state, response):
+        """Record and report the state confirmed by the device's response"""
+        confirmed = self.confirmed_state(response, state)
+        self.last_led_state = confirmed
+        return {
+            "status": "success",
+            "message": f"LED confirmed: {'ON' if confirmed else 'OFF'}",
+            "ledState": confirmed
+        }
     
+    def queue_led_state(self, state):
+        """Coalescing mode: record the desired state and answer without waiting for the device"""
+        outcome = self.commands.submit(LED_METHOD, state)
+        label = 'ON' if state else 'OFF'
+        return {
+            "status": "success",
+            "message": f"LED already {label}" if outcome == "unchanged" else f"LED command queued: {label}",
+            "ledState": state,
+            "confirmed": outcome == "unchanged"
+        }
+
     def set_led_state(self, state):
-        """Set LED state (connects to CoreIOT when called)"""
+        """Set LED state and return the state confirmed by the device"""
         try:
             # Validate input
-            if isinstance(state, str):
-                state = state.lower() in ['true', '1', 'on', 'yes']
-            elif isinstance(state, int):
-                state = bool(state)
-            elif not isinstance(state, bool):
+            parsed = self.parse_state(state)
+            if parsed is None:
                 return {
                     "status": "error",
                     "message": "Invalid state value"
                 }
+
+            if self.commands is not None:
+                return self.queue_led_state(parsed)
             
-            # Send command to CoreIOT (connects temporarily)
-            success = self.coreiot_service.send_led_command(state)
-            
-            if success:
-                self.last_led_state = state
-                return {
-                    "status": "success",
-                    "message": f"LED command sent: {'ON' if state else 'OFF'}",
-                    "ledState": state
-                }
-            else:
+            # The request thread waits (bounded by the RPC timeout) for the device's reply
+            return self.led_result(parsed, self.send_led_state(parsed))
+                
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"LED control error: {str(e)}"
+            }
+    
+    async def set_led_state_async(self, state):
+        """Set LED state from the ASGI app by awaiting the RPC response"""
+        try:
+            parsed = self.parse_state(state)
+            if parsed is None:
                 return {
                     "status": "error",
-                    "message": "Failed to send LED command to CoreIOT"
+                    "message": "Invalid state value"
                 }
-                
+
+            if self.commands is not None:
+                # Only records the desired state, so it never blocks the event loop
+                return self.queue_led_state(parsed)
+
+            try:
+                response = await asyncio.wait_for(
+                    self.async_coreiot_service.send_led_command(parsed),
+                    self.rpc_timeout + RESULT_WAIT_SLACK
+                )
+            except RPCError as e:
+                return self.not_confirmed(str(e))
+            except asyncio.TimeoutError:
+                return self.not_confirmed("timed out")
+            return self.confirmed_result(parsed, response)
+
         except Exception as e:
             return {
                 "status": "error",
                 "message": f"LED control error: {str(e)}"
             }
     
+    def desired_led_state(self):
+        """The state most recently asked for, falling back to the last confirmed one"""
+        if self.commands is not None:
+            return self.commands.desired(LED_METHOD, self.last_led_state)
+        return self.last_led_state
+
+    def toggle_led(self):
+        """Flip the desired LED state; an unknown state counts as OFF, so the first toggle turns it ON"""
+        return self.set_led_state(not self.desired_led_state())
+
+    async def toggle_led_async(self):
+        return await self.set_led_state_async(not self.desired_led_state())
+
     def get_led_state(self):
         """Get last known LED state"""
+        data = {
+            "lastLedState": self.last_led_state,
+            "note": "Last state confirmed by the device"
+        }
+        if self.commands is not None:
+            data["desiredLedState"] = self.desired_led_state()
         return {
             "status": "success",
-            "data": {
-                "lastLedState": self.last_led_state,
-                "note": "Last command sent (actual device state may vary)"
-            }
-        }
\ No newline at end of file
+            "data": data
+        }
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+MQTT telemetry ingest worker: devices publish readings to the broker instead of POSTing /data
+Usage: python src/ingest_worker.py
+
+Settings come from the environment: MQTT_INGEST_BROKER, MQTT_INGEST_PORT (1883),
+MQTT_INGEST_TOPIC (v1/devices/+/telemetry), MQTT_INGEST_GROUP (shared
+subscription group; run several workers with the same group to split the load),
+MQTT_INGEST_CLIENT_ID, MQTT_INGEST_USERNAME, MQTT_INGEST_PASSWORD,
+MQTT_INGEST_BATCH_SIZE (500), MQTT_INGEST_MAX_AGE (0.5 seconds) and MONGO_URI.
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+from controllers.data_controller import DataController
+from services.mqtt_ingest import TELEMETRY_TOPIC, MQTTIngestWorker
+from utils.log import configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger('ingest_worker')
+
+def main():
+    configure_logging()
+    controller = DataController()
+    if controller.db is None:
+        logger.error("Failed to connect to database")
+        sys.exit(1)
+
+    worker = MQTTIngestWorker(
+        controller,
+        os.getenv('MQTT_INGEST_BROKER', 'localhost'),
+        int(os.getenv('MQTT_INGEST_PORT', '1883')),
+        topic=os.getenv('MQTT_INGEST_TOPIC', TELEMETRY_TOPIC),
+        group=os.getenv('MQTT_INGEST_GROUP') or None,
+        batch_size=int(os.getenv('MQTT_INGEST_BATCH_SIZE', '500')),
+        max_age=float(os.getenv('MQTT_INGEST_MAX_AGE', '0.5')),
+        client_id=os.getenv('MQTT_INGEST_CLIENT_ID', ''),
+        username=os.getenv('MQTT_INGEST_USERNAME') or None,
+        password=os.getenv('MQTT_INGEST_PASSWORD') or None
+    )
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    worker.start()
+    stopping.wait()
+    logger.info("Stopping, writing pending readings")
+    worker.stop()
+    logger.info("Ingest worker stopped", extra={"stats": worker.stats})
+
+if __name__ == "__main__":
+    main()
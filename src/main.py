@@ -1,16 +1,50 @@
+import time
+
+_import_started = time.perf_counter()
+
+import logging
+from dotenv import load_dotenv
+
+# Before the app modules, a few of which read settings (e.g. COMPRESS_MIN_SIZE) at import
+load_dotenv()
+
 from flask import Flask
 from flask_cors import CORS
+from config import Config, DevelopmentConfig
 from routes.api_routes import setup_routes
+from middleware.compression import init_compression
+from middleware.metrics import init_metrics
+from utils.log import configure_logging
+from utils.metrics import app_startup
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+logger = logging.getLogger(__name__)
+
+def create_app(config=Config):
+    """Build the Flask app. Controllers are created here and connect to MongoDB and CoreIOT on first use."""
+    started = time.perf_counter()
+    configure_logging()
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # CORS for the configured origins; CORS(app) would allow all origins (less secure)
+    CORS(app, origins=config.CORS_ORIGINS)
 
-app = Flask(__name__)
+    # gzip/br for larger responses, negotiated from Accept-Encoding
+    init_compression(app)
 
-# Enable CORS for all routes and origins
-CORS(app, origins=["http://localhost:5173"])
+    # Per-route request counters and latency histograms for /metrics
+    init_metrics(app)
 
-# Or for development, allow all origins (less secure)
-# CORS(app)
+    setup_routes(app)
 
-setup_routes(app)
+    create_seconds = time.perf_counter() - started
+    app_startup.set_function(lambda: IMPORT_SECONDS, 'wsgi', 'import')
+    app_startup.set_function(lambda: create_seconds, 'wsgi', 'create_app')
+    logger.info("App created", extra={"import_ms": round(IMPORT_SECONDS * 1000, 1), "create_ms": round(create_seconds * 1000, 1)})
+    return app
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app(DevelopmentConfig).run()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Device registry admin: register, list and remove devices in the devices collection
+Usage:
+  python src/manage_devices.py list
+  python src/manage_devices.py register ID [--name NAME] [--group GROUP ...] [--local-ip IP]
+  python src/manage_devices.py remove ID
+
+`register` creates or replaces a device. Its CoreIOT access token is read from
+COREIOT_DEVICE_TOKEN, or prompted for, so it stays out of the shell history.
+Running apps pick up changes once their cached lookups expire
+(DEVICE_REGISTRY_TTL). Exits with status 1 on failure.
+"""
+import argparse
+import getpass
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+from services.device_registry import DeviceRegistry, public_device
+from utils.db_connection import MongoDBConnection
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['list', 'register', 'remove'])
+    parser.add_argument('device_id', nargs='?', default=None)
+    parser.add_argument('--name', default=None, help="register: display name (defaults to the id)")
+    parser.add_argument('--group', dest='groups', action='append', default=[], help="register: group to join; repeat for several")
+    parser.add_argument('--local-ip', default=None, help="register: localIp of its sensor_data readings (defaults to the id)")
+    args = parser.parse_args()
+    load_dotenv()
+    if args.command != 'list' and not args.device_id:
+        parser.error(f"{args.command} needs a device ID")
+
+    token = None
+    if args.command == 'register':
+        token = os.getenv('COREIOT_DEVICE_TOKEN') or getpass.getpass(f"Access token for {args.device_id}: ")
+        if not token:
+            parser.error("register needs an access token")
+
+    db_connection = MongoDBConnection()
+    db = db_connection.connect()
+    if db is None:
+        print("❌ Failed to connect to database")
+        sys.exit(1)
+
+    try:
+        registry = DeviceRegistry(lambda: db)
+        if args.command == 'list':
+            for device in registry.list():
+                device = public_device(device)
+                print(f"{device['id']}  name={device['name']} localIp={device['localIp']} groups={','.join(device['groups'] or [])}")
+        elif args.command == 'register':
+            registry.register(args.device_id, token, name=args.name, groups=args.groups, local_ip=args.local_ip)
+            print(f"✅ Registered {args.device_id}")
+        elif args.command == 'remove':
+            if not registry.remove(args.device_id):
+                print(f"❌ Unknown device '{args.device_id}'")
+                sys.exit(1)
+            print(f"✅ Removed {args.device_id}")
+    except Exception as e:
+        print(f"❌ Device command failed: {e}")
+        sys.exit(1)
+    finally:
+        db_connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+from flask import g, request
+from utils.metrics import http_errors, http_latency, http_requests
+
+# Requests that matched no route share one label, so stray paths cannot grow the series count
+UNMATCHED_ROUTE = 'unmatched'
+
+
+def observe_request(method, route, status, seconds):
+    http_requests.inc(method, route, str(status))
+    http_latency.observe(seconds, method, route)
+    if status >= 500:
+        http_errors.inc(method, route)
+
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+
+
+def _record_response(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        observe_request(request.method, _route(), response.status_code, time.perf_counter() - started)
+    return response
+
+
+def _record_exception(error):
+    # after_request does not run for unhandled exceptions; count those here
+    started = g.pop('request_started', None)
+    if started is not None and error is not None:
+        observe_request(request.method, _route(), 500, time.perf_counter() - started)
+
+
+def init_metrics(app):
+    """Per-route request counters and latency histograms for the Flask app.
+
+    Streamed responses are timed up to the start of the stream.
+    """
+    app.before_request(_start_timer)
+    app.after_request(_record_response)
+    app.teardown_request(_record_exception)
+
+
+class ASGIMetricsMiddleware:
+    """The same request metrics for the ASGI app, labelled with the matched route's path"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            observe_request(scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status, time.perf_counter() - started)
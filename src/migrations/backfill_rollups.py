@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Rebuild the sensor_rollup_1m / sensor_rollup_1h collections from raw sensor_data
+Usage: python src/migrations/backfill_rollups.py [--from 2024-01-01] [--to 2024-02-01] [--batch-size 5000]
+
+The range is widened to whole hours, its rollup buckets are deleted and then
+refilled from sensor_data in time order, so a rebuild can be repeated safely.
+By default it ends at the start of the current hour; readings ingested into
+the range while it runs would be counted twice, so avoid rebuilding live hours.
+
+History only reads a rollup from the start of its recorded coverage. The rebuilt
+range extends that coverage when it reaches it: ingest covers from the hour
+after the app first stored a reading with rollups enabled, so after an upgrade
+run this once that hour has started.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dotenv import load_dotenv
+from utils.db_connection import MongoDBConnection
+from utils.helpers import parse_datetime
+from services.rollups import ROLLUP_STATE, ROLLUPS, RollupStore, extend_coverage
+from services.telemetry_queries import KEYSET_SORT, bucket_start, range_query
+
+HOUR = 3600
+
+class RollupBackfill:
+    def __init__(self, db, batch_size=5000):
+        self.db = db
+        self.rollups = RollupStore(db)
+        self.batch_size = batch_size
+
+    def run(self, start=None, end=None):
+        """Rebuild rollups for [start, end); returns the number of readings folded in"""
+        end = bucket_start(end or datetime.utcnow(), HOUR)
+        if start is not None:
+            start = bucket_start(start, HOUR)
+
+        for name, _ in ROLLUPS:
+            deleted = self.db[name].delete_many(range_query(start, end)).deleted_count
+            print(f"🗑️ Cleared {deleted} buckets from {name}")
+
+        cursor = self.db['sensor_data'].find(range_query(start, end)).sort(KEYSET_SORT).batch_size(self.batch_size)
+        folded = 0
+        started = time.perf_counter()
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) < self.batch_size:
+                continue
+            folded += self.fold(batch, folded, started)
+            batch = []
+        if batch:
+            folded += self.fold(batch, folded, started)
+
+        for name, _ in ROLLUPS:
+            self.extend_coverage(name, start or datetime.min, end)
+        return folded
+
+    def extend_coverage(self, name, start, end):
+        if extend_coverage(self.db, name, start, end):
+            print(f"📈 {name} covers history from {start.isoformat()}")
+            return
+        state = self.db[ROLLUP_STATE].find_one({'_id': name})
+        if state is None:
+            print(f"⚠️ {name} has no ingest coverage yet, so history keeps reading sensor_data; rerun after the app has stored readings")
+        else:
+            print(f"⚠️ {name} is only complete from {state['since'].isoformat()}, after {end.isoformat()}; rerun once that hour has started")
+
+    def fold(self, batch, folded, started):
+        self.rollups.apply(batch)
+        total = folded + len(batch)
+        print(f"📦 Folded {total} readings ({total / max(time.perf_counter() - started, 1e-9):.0f}/s)")
+        return len(batch)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from', dest='start', type=parse_datetime, default=None)
+    parser.add_argument('--to', dest='end', type=parse_datetime, default=None)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+    load_dotenv()
+
+    db_connection = MongoDBConnection()
+    db = db_connection.connect()
+    if db is None:
+        print("❌ Failed to connect to database")
+        sys.exit(1)
+
+    try:
+        backfill = RollupBackfill(db, batch_size=args.batch_size)
+        backfill.rollups.create_indexes()
+        folded = backfill.run(args.start, args.end)
+        print(f"✅ Rollup rebuild complete: {folded} readings folded")
+    finally:
+        db_connection.close()
+
+if __name__ == "__main__":
+    main()
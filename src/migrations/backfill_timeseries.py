@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Copy readings from sensor_data_legacy into the time-series sensor_data collection
+Usage: python src/migrations/backfill_timeseries.py [--batch-size 5000] [--drop-source]
+
+The copy runs in _id order and records its position in the migration_state
+collection after every batch, so an interrupted run resumes where it stopped.
+Time-series collections do not enforce unique _id, so a run interrupted between
+a batch write and its checkpoint copies that one batch again.
+"""
+import argparse
+import os
+import sys
+import time
+from pymongo.errors import BulkWriteError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dotenv import load_dotenv
+from utils.db_connection import MongoDBConnection
+from migrations.create_collections import LEGACY_COLLECTION
+
+STATE_COLLECTION = 'migration_state'
+
+class TimeseriesBackfill:
+    def __init__(self, db, source=LEGACY_COLLECTION, target='sensor_data', batch_size=5000):
+        self.db = db
+        self.source = db[source]
+        self.target = db[target]
+        self.state = db[STATE_COLLECTION]
+        self.state_id = f"backfill:{source}->{target}"
+        self.batch_size = batch_size
+
+    def checkpoint(self):
+        state = self.state.find_one({"_id": self.state_id})
+        return state.get("last_id") if state else None
+
+    def run(self):
+        """Copy every remaining batch; returns the number of documents copied"""
+        last_id = self.checkpoint()
+        copied = 0
+        started = time.perf_counter()
+
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            batch = list(self.source.find(query).sort("_id", 1).limit(self.batch_size))
+            if not batch:
+                break
+
+            try:
+                self.target.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                print(f"⚠️ {len(e.details.get('writeErrors', []))} documents rejected in batch ending {batch[-1]['_id']}")
+
+            last_id = batch[-1]["_id"]
+            self.state.update_one(
+                {"_id": self.state_id},
+                {"$set": {"last_id": last_id}, "$inc": {"copied": len(batch)}},
+                upsert=True
+            )
+            copied += len(batch)
+            rate = copied / max(time.perf_counter() - started, 1e-9)
+            print(f"📦 Copied {copied} documents ({rate:.0f}/s)")
+
+        return copied
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--drop-source', action='store_true', help="Drop the legacy collection once the copy is complete")
+    args = parser.parse_args()
+    load_dotenv()
+
+    db_connection = MongoDBConnection()
+    db = db_connection.connect()
+    if db is None:
+        print("❌ Failed to connect to database")
+        sys.exit(1)
+
+    try:
+        backfill = TimeseriesBackfill(db, batch_size=args.batch_size)
+        copied = backfill.run()
+        print(f"✅ Backfill complete: {copied} documents copied")
+        if args.drop_source:
+            db.drop_collection(LEGACY_COLLECTION)
+            print(f"🗑️ Dropped collection: {LEGACY_COLLECTION}")
+    finally:
+        db_connection.close()
+
+if __name__ == "__main__":
+    main()
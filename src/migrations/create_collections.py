@@ -1,37 +1,39 @@
 import os
 import sys
 from datetime import datetime
-from pymongo import MongoClient, ASCENDING, DESCENDING
 from dotenv import load_dotenv
 
 # Add src directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.db_connection import MongoDBConnection
+from models.data_models import SENSOR_DATA_VALIDATOR
+from services.rollups import ROLLUPS
+from migrations.runner import LEDGER_COLLECTION, MigrationRunner
+from migrations.schema import apply_index_plan, is_timeseries, plan_indexes
 
-load_dotenv()
+# Where convert_sensor_data_to_timeseries moves the old plain collection
+LEGACY_COLLECTION = 'sensor_data_legacy'
 
 class MongoMigration:
-    def __init__(self):
-        self.db_connection = MongoDBConnection()
-        self.db = self.db_connection.connect()
+    def __init__(self, db=None):
+        self.db_connection = None if db is not None else MongoDBConnection()
+        self.db = db if db is not None else self.db_connection.connect()
+
+    def close(self):
+        if self.db_connection is not None:
+            self.db_connection.close()
     
     def create_collections_and_indexes(self):
-        """Create collections and indexes for the IoT application"""
+        """Apply every pending versioned migration (see migrations/versions.py)"""
         try:
             if self.db is None:
                 print("❌ Failed to connect to database")
                 return False
             
             print("🚀 Starting MongoDB migration...")
-            
-            # Create sensor_data collection with schema validation
-            self.create_sensor_data_collection()
-            
-            # Create indexes for better performance
-            self.create_indexes()
-            
-            # Insert sample data
-            self.insert_sample_data()
+            applied = MigrationRunner(self.db).up()
+            if not applied:
+                print("📦 Database is already up to date")
             
             print("✅ Migration completed successfully!")
             return True
@@ -40,82 +42,7 @@ class MongoMigration:
             print(f"❌ Migration failed: {e}")
             return False
         finally:
-            self.db_connection.close()
-    
-    def create_sensor_data_collection(self):
-        """Create sensor_data collection with validation schema"""
-        collection_name = 'sensor_data'
-        
-        # Check if collection already exists
-        if collection_name in self.db.list_collection_names():
-            print(f"📦 Collection '{collection_name}' already exists")
-            return
-        
-        # JSON Schema validation
-        validator = {
-            "$jsonSchema": {
-                "bsonType": "object",
-                "required": ["temperature", "humidity", "light", "timestamp"],
-                "properties": {
-                    "temperature": {
-                        "bsonType": "number",
-                        "description": "Temperature in Celsius"
-                    },
-                    "humidity": {
-                        "bsonType": "number",
-                        "minimum": 0,
-                        "maximum": 100,
-                        "description": "Humidity percentage (0-100)"
-                    },
-                    "light": {
-                        "bsonType": "number",
-                        "minimum": 0,
-                        "description": "Light intensity in lux"
-                    },
-                    "lightPercentage": {
-                        "bsonType": "number",
-                        "minimum": 0,
-                        "maximum": 100,
-                        "description": "Light percentage (0-100)"
-                    },
-                    "rssi": {
-                        "bsonType": "number",
-                        "description": "WiFi signal strength"
-                    },
-                    "localIp": {
-                        "bsonType": "string",
-                        "description": "Device local IP address"
-                    },
-                    "timestamp": {
-                        "bsonType": "date",
-                        "description": "Data timestamp"
-                    }
-                }
-            }
-        }
-        
-        # Create collection with validation
-        self.db.create_collection(collection_name, validator=validator)
-        print(f"✅ Created collection '{collection_name}' with schema validation")
-    
-    def create_indexes(self):
-        """Create indexes for better query performance"""
-        collection = self.db['sensor_data']
-        
-        # Create compound index on timestamp (descending) for latest data queries
-        collection.create_index([("timestamp", DESCENDING)], name="timestamp_desc")
-        print("✅ Created index: timestamp_desc")
-        
-        # Create compound index for time-based queries
-        collection.create_index([
-            ("timestamp", DESCENDING),
-            ("temperature", ASCENDING)
-        ], name="timestamp_temp")
-        print("✅ Created index: timestamp_temp")
-        
-        # Create index for IP-based queries
-        collection.create_index([("localIp", ASCENDING)], name="localIp_asc")
-        print("✅ Created index: localIp_asc")
+            self.close()
     
     def insert_sample_data(self):
         """Insert sample data for testing"""
@@ -145,10 +72,55 @@ class MongoMigration:
         result = collection.insert_many(sample_data)
         print(f"✅ Inserted {len(result.inserted_ids)} sample documents")
     
+    def convert_sensor_data_to_timeseries(self, granularity=None, expire_after_seconds=None):
+        """Recreate sensor_data as a time-series collection keyed by localIp.
+
+        The existing collection is renamed to sensor_data_legacy so ingest can
+        continue into the new collection right away; copy the old readings
+        with migrations/backfill_timeseries.py afterwards. A time-series
+        collection does not enforce a unique _id, so spool replays and
+        write retries look up what is already stored instead of relying on
+        duplicate-key errors; running apps only notice after a restart.
+        """
+        collection_name = 'sensor_data'
+        granularity = granularity or os.getenv('SENSOR_DATA_GRANULARITY', 'seconds')
+        if expire_after_seconds is None and os.getenv('SENSOR_DATA_RETENTION_DAYS'):
+            expire_after_seconds = int(os.getenv('SENSOR_DATA_RETENTION_DAYS')) * 86400
+
+        if is_timeseries(self.db, collection_name):
+            print(f"📦 Collection '{collection_name}' is already a time-series collection")
+            return
+
+        if collection_name in self.db.list_collection_names():
+            if LEGACY_COLLECTION in self.db.list_collection_names():
+                raise RuntimeError(f"'{LEGACY_COLLECTION}' already exists; finish or drop the previous backfill first")
+            self.db[collection_name].rename(LEGACY_COLLECTION)
+            print(f"📦 Renamed '{collection_name}' to '{LEGACY_COLLECTION}'")
+
+        options = {
+            "timeseries": {
+                "timeField": "timestamp",
+                "metaField": "localIp",
+                "granularity": granularity
+            },
+            "validator": SENSOR_DATA_VALIDATOR
+        }
+        if expire_after_seconds:
+            options["expireAfterSeconds"] = expire_after_seconds
+
+        self.db.create_collection(collection_name, **options)
+        print(f"✅ Created time-series collection '{collection_name}' (granularity={granularity}, "
+              f"expireAfterSeconds={expire_after_seconds})")
+
+        # Buckets are already clustered by time; one compound index serves per-device
+        # range queries and the (timestamp, _id) sort used by export
+        apply_index_plan(self.db, [step for step in plan_indexes(self.db, [collection_name]) if step[0] != 'drop'])
+
     def drop_collections(self):
         """Drop all collections (use with caution!)"""
         try:
-            collections = ['sensor_data']
+            # The ledger goes too, so the next migration recreates everything
+            collections = ['sensor_data'] + [name for name, _ in ROLLUPS] + [LEDGER_COLLECTION]
             for collection_name in collections:
                 if collection_name in self.db.list_collection_names():
                     self.db.drop_collection(collection_name)
@@ -158,6 +130,7 @@ class MongoMigration:
 
 def main():
     """Main migration function"""
+    load_dotenv()
     migration = MongoMigration()
     
     print("MongoDB Migration Script")
@@ -165,11 +138,15 @@ def main():
     print("1. Run migration (create collections and indexes)")
     print("2. Drop all collections (DANGER!)")
     print("3. Exit")
+    print("4. Convert sensor_data to a time-series collection")
     
-    choice = input("\nEnter your choice (1-3): ").strip()
+    choice = input("\nEnter your choice (1-4): ").strip()
     
     if choice == "1":
         migration.create_collections_and_indexes()
+    elif choice == "4":
+        migration.convert_sensor_data_to_timeseries()
+        print("➡️ Restart the app and ingest workers, then copy old readings: python src/migrations/backfill_timeseries.py")
     elif choice == "2":
         confirm = input("⚠️ This will delete ALL data! Type 'DELETE' to confirm: ")
         if confirm == "DELETE":
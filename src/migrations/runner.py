@@ -0,0 +1,121 @@
+"""
+Applies and reverts the versioned migrations in migrations/versions.py, recording each in a ledger
+
+The schema_migrations collection holds one document per applied migration:
+{_id: version, name, appliedAt, durationMs}. A lease in migration_state keeps
+two runners (e.g. several replicas starting at once) from migrating together.
+"""
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from migrations.versions import MIGRATIONS
+
+LEDGER_COLLECTION = 'schema_migrations'
+LOCK_COLLECTION = 'migration_state'
+LOCK_ID = 'migration_lock'
+
+
+class IrreversibleMigration(Exception):
+    """Raised when reverting past a migration that has no down step"""
+
+
+class MigrationLocked(Exception):
+    """Raised when another runner holds the migration lock"""
+
+
+class MigrationRunner:
+    def __init__(self, db, migrations=MIGRATIONS, lease_seconds=600, owner=None, log=print):
+        self.db = db
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.ledger = db[LEDGER_COLLECTION]
+        self.locks = db[LOCK_COLLECTION]
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.log = log
+
+    def applied(self):
+        """{version: ledger document} of applied migrations"""
+        return {entry['_id']: entry for entry in self.ledger.find()}
+
+    def status(self):
+        applied = self.applied()
+        return [{
+            "version": migration.version,
+            "name": migration.name,
+            "applied": migration.version in applied,
+            "appliedAt": applied.get(migration.version, {}).get('appliedAt'),
+            "reversible": migration.down is not None
+        } for migration in self.migrations]
+
+    def up(self, target=None):
+        """Apply every pending migration up to `target` (default: all); returns the versions applied"""
+        with self.lock():
+            applied = self.applied()
+            done = []
+            for migration in self.migrations:
+                if target is not None and migration.version > target:
+                    break
+                if migration.version in applied:
+                    continue
+                started = time.perf_counter()
+                migration.up(self.db)
+                duration = round((time.perf_counter() - started) * 1000)
+                self.ledger.insert_one({
+                    '_id': migration.version,
+                    'name': migration.name,
+                    'appliedAt': datetime.utcnow(),
+                    'durationMs': duration
+                })
+                self.log(f"✅ Applied {migration.version} {migration.name} ({duration} ms)")
+                done.append(migration.version)
+            return done
+
+    def down(self, target):
+        """Revert applied migrations newer than `target`, newest first; returns the versions reverted"""
+        with self.lock():
+            applied = self.applied()
+            pending = [migration for migration in reversed(self.migrations)
+                       if migration.version > target and migration.version in applied]
+            irreversible = [migration for migration in pending if migration.down is None]
+            if irreversible:
+                # Checked up front, so a revert never stops half way
+                raise IrreversibleMigration(f"Migration {irreversible[0].version} {irreversible[0].name} cannot be reverted")
+            done = []
+            for migration in pending:
+                migration.down(self.db)
+                self.ledger.delete_one({'_id': migration.version})
+                self.log(f"↩️ Reverted {migration.version} {migration.name}")
+                done.append(migration.version)
+            return done
+
+    def lock(self):
+        return _Lease(self)
+
+
+class _Lease:
+    """Context manager holding the migration lock; an expired lease may be taken over"""
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    def __enter__(self):
+        runner = self.runner
+        now = datetime.utcnow()
+        lease = {'owner': runner.owner, 'leaseUntil': now + timedelta(seconds=runner.lease_seconds)}
+        taken = runner.locks.find_one_and_update(
+            {'_id': LOCK_ID, '$or': [{'owner': None}, {'owner': runner.owner}, {'leaseUntil': {'$lt': now}}]},
+            {'$set': lease}
+        )
+        if taken is None:
+            try:
+                runner.locks.insert_one(dict(lease, _id=LOCK_ID))
+            except DuplicateKeyError:
+                holder = runner.locks.find_one({'_id': LOCK_ID}) or {}
+                raise MigrationLocked(f"Migrations are locked by {holder.get('owner')} until {holder.get('leaseUntil')}")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.runner.locks.update_one({'_id': LOCK_ID, 'owner': self.runner.owner}, {'$set': {'owner': None, 'leaseUntil': None}})
+        return False
@@ -0,0 +1,127 @@
+"""
+Declared indexes for every collection the application owns, and the tools to converge a database on them
+
+plan_indexes() diffs the declared indexes against list_indexes(); apply_index_plan()
+carries the plan out one index at a time; index_usage() reports $indexStats so
+unused indexes can be found before they are dropped.
+"""
+from pymongo import ASCENDING, DESCENDING
+from services.device_registry import DEVICE_INDEXES, DEVICES_COLLECTION
+from services.rollups import ROLLUP_INDEXES, ROLLUPS
+from utils.db_connection import is_timeseries
+
+# Plain sensor_data: range scans and export/keyset pagination (latest-value reads scan
+# timestamp_id in reverse), per-device lookups
+SENSOR_DATA_INDEXES = (
+    {'key': [('timestamp', ASCENDING), ('_id', ASCENDING)], 'name': 'timestamp_id'},
+    {'key': [('localIp', ASCENDING)], 'name': 'localIp_asc'}
+)
+
+# Time-series sensor_data: buckets are already clustered by time
+TIMESERIES_SENSOR_DATA_INDEXES = (
+    {'key': [('localIp', ASCENDING), ('timestamp', DESCENDING)], 'name': 'localIp_timestamp'},
+    {'key': [('timestamp', ASCENDING), ('_id', ASCENDING)], 'name': 'timestamp_id'}
+)
+
+
+# Trailing field of the stand-in index built while an index is replaced; never set, so uniqueness is unchanged
+REBUILD_FIELD = '_rebuild'
+
+
+def declared_indexes(db):
+    """{collection: index specs} the application expects"""
+    declared = {
+        'sensor_data': TIMESERIES_SENSOR_DATA_INDEXES if is_timeseries(db, 'sensor_data') else SENSOR_DATA_INDEXES,
+        DEVICES_COLLECTION: DEVICE_INDEXES
+    }
+    for name, _ in ROLLUPS:
+        declared[name] = ROLLUP_INDEXES
+    return declared
+
+
+def same_definition(spec, existing):
+    return [tuple(pair) for pair in spec['key']] == list(existing['key'].items()) and \
+        bool(spec.get('unique')) == bool(existing.get('unique'))
+
+
+def plan_indexes(db, collections=None):
+    """Steps that bring the indexes in line with the declared ones.
+
+    Each step is (action, collection, spec or index name): 'create' for a
+    missing index, 'replace' for one whose name is declared with other keys
+    or options, and 'drop' for one nothing declares. Creates come first, so
+    queries keep an index while replaced or unused ones are dropped.
+    """
+    declared = declared_indexes(db)
+    creates, drops = [], []
+    for collection, specs in declared.items():
+        if collections is not None and collection not in collections:
+            continue
+        existing = {index['name']: index for index in db[collection].list_indexes()}
+        for spec in specs:
+            current = existing.get(spec['name'])
+            if current is None:
+                creates.append(('create', collection, spec))
+            elif not same_definition(spec, current):
+                creates.append(('replace', collection, spec))
+        names = {spec['name'] for spec in specs}
+        drops.extend(('drop', collection, name) for name in existing if name != '_id_' and name not in names)
+    return creates + drops
+
+
+def apply_index_plan(db, plan, drop_unused=False, commit_quorum=None, log=print):
+    """Carry out a plan one index at a time; 'drop' steps only run with drop_unused.
+
+    Building one index at a time bounds the extra load on the primary. On a
+    replica set, `commit_quorum` (e.g. 'majority') is passed to createIndexes
+    so every member builds concurrently and the primary keeps serving.
+
+    MongoDB cannot change or rename an index in place, so a replaced index is
+    first built under a temporary name with REBUILD_FIELD appended to its
+    keys. That stand-in serves the same queries while the old index is dropped
+    and the declared one is built, and is dropped last.
+    """
+    def create(collection, key, options):
+        if commit_quorum is not None:
+            options = dict(options, commitQuorum=commit_quorum)
+        db[collection].create_index(key, **options)
+
+    for action, collection, target in plan:
+        if action == 'drop':
+            if drop_unused:
+                db[collection].drop_index(target)
+                log(f"🗑️ Dropped index {collection}.{target}")
+            else:
+                log(f"⚠️ Not declared, kept: {collection}.{target}")
+            continue
+        options = {option: value for option, value in target.items() if option != 'key'}
+        if action == 'replace':
+            # TTL only applies to single-field indexes
+            stand_in = {option: value for option, value in options.items() if option != 'expireAfterSeconds'}
+            stand_in['name'] = f"{target['name']}{REBUILD_FIELD}"
+            create(collection, list(target['key']) + [(REBUILD_FIELD, ASCENDING)], stand_in)
+            db[collection].drop_index(target['name'])
+            create(collection, target['key'], options)
+            db[collection].drop_index(stand_in['name'])
+        else:
+            create(collection, target['key'], options)
+        log(f"✅ {'Rebuilt' if action == 'replace' else 'Created'} index {collection}.{target['name']}")
+
+
+def index_usage(db, collections=None):
+    """Per-index operation counts from $indexStats since each index's tracking began (last restart or build)"""
+    declared = declared_indexes(db)
+    report = []
+    for collection in collections or declared:
+        names = {spec['name'] for spec in declared.get(collection, ())}
+        for stats in db[collection].aggregate([{'$indexStats': {}}]):
+            report.append({
+                "collection": collection,
+                "name": stats['name'],
+                "ops": stats['accesses']['ops'],
+                "since": stats['accesses']['since'],
+                "host": stats.get('host'),
+                "declared": stats['name'] == '_id_' or stats['name'] in names
+            })
+    report.sort(key=lambda entry: (entry["collection"], entry["ops"]))
+    return report
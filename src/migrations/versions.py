@@ -0,0 +1,89 @@
+"""
+Schema migrations in the order they are applied. Never renumber or edit an applied
+migration; add a new one. Every step is safe to re-run against a database that
+already has its effect, so databases created before the ledger existed converge too.
+"""
+from pymongo import ASCENDING, DESCENDING
+from models.data_models import SENSOR_DATA_VALIDATOR
+from migrations.schema import SENSOR_DATA_INDEXES, TIMESERIES_SENSOR_DATA_INDEXES, apply_index_plan, is_timeseries, plan_indexes
+from services.device_registry import DEVICE_INDEXES, DEVICES_COLLECTION
+from services.rollups import ROLLUP_INDEXES, ROLLUPS
+
+# Declared on plain sensor_data until migration 6 dropped it
+TIMESTAMP_DESC_INDEX = {'key': [('timestamp', DESCENDING)], 'name': 'timestamp_desc'}
+
+
+class Migration:
+    """One versioned change; `down` is None when it cannot be undone without losing data"""
+
+    def __init__(self, version, name, up, down=None):
+        self.version = version
+        self.name = name
+        self.up = up
+        self.down = down
+
+
+def create_sensor_data(db):
+    if 'sensor_data' not in db.list_collection_names():
+        db.create_collection('sensor_data', validator=SENSOR_DATA_VALIDATOR)
+
+
+def create_indexes_for(collection):
+    def up(db):
+        apply_index_plan(db, [step for step in plan_indexes(db, [collection]) if step[0] != 'drop'], log=lambda message: None)
+    return up
+
+
+def drop_indexes(collection, specs):
+    def down(db):
+        existing = {index['name'] for index in db[collection].list_indexes()}
+        for spec in specs:
+            if spec['name'] in existing:
+                db[collection].drop_index(spec['name'])
+    return down
+
+
+def drop_sensor_data_indexes(db):
+    specs = TIMESERIES_SENSOR_DATA_INDEXES if is_timeseries(db, 'sensor_data') else SENSOR_DATA_INDEXES + (TIMESTAMP_DESC_INDEX,)
+    drop_indexes('sensor_data', specs)(db)
+
+
+def drop_timestamp_temp(db):
+    # Every query it could serve is served by a timestamp index, and it cost every insert a second key
+    if 'timestamp_temp' in {index['name'] for index in db['sensor_data'].list_indexes()}:
+        db['sensor_data'].drop_index('timestamp_temp')
+
+
+def create_timestamp_temp(db):
+    db['sensor_data'].create_index([('timestamp', DESCENDING), ('temperature', ASCENDING)], name='timestamp_temp')
+
+
+def drop_timestamp_desc(db):
+    # A reverse scan of timestamp_id serves every query it did, and it cost every insert another key
+    drop_indexes('sensor_data', (TIMESTAMP_DESC_INDEX,))(db)
+
+
+def create_timestamp_desc(db):
+    # Time-series sensor_data never had it
+    if not is_timeseries(db, 'sensor_data'):
+        db['sensor_data'].create_index(TIMESTAMP_DESC_INDEX['key'], name=TIMESTAMP_DESC_INDEX['name'])
+
+
+def create_rollup_indexes(db):
+    for name, _ in ROLLUPS:
+        create_indexes_for(name)(db)
+
+
+def drop_rollup_indexes(db):
+    for name, _ in ROLLUPS:
+        drop_indexes(name, ROLLUP_INDEXES)(db)
+
+
+MIGRATIONS = (
+    Migration(1, 'create_sensor_data', create_sensor_data),
+    Migration(2, 'sensor_data_indexes', create_indexes_for('sensor_data'), drop_sensor_data_indexes),
+    Migration(3, 'drop_timestamp_temp', drop_timestamp_temp, create_timestamp_temp),
+    Migration(4, 'rollup_indexes', create_rollup_indexes, drop_rollup_indexes),
+    Migration(5, 'device_indexes', create_indexes_for(DEVICES_COLLECTION), drop_indexes(DEVICES_COLLECTION, DEVICE_INDEXES)),
+    Migration(6, 'drop_timestamp_desc', drop_timestamp_desc, create_timestamp_desc)
+)
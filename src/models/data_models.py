@@ -1,11 +1,116 @@
-from pydantic import BaseModel
+import math
+from numbers import Number
 
-class DataModel(BaseModel):
-    id: int
-    name: str
-    value: float
+# MongoDB $jsonSchema for sensor_data; the ingest validator is compiled from it
+SENSOR_DATA_VALIDATOR = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["temperature", "humidity", "light", "timestamp"],
+        "properties": {
+            "temperature": {
+                "bsonType": "number",
+                "description": "Temperature in Celsius"
+            },
+            "humidity": {
+                "bsonType": "number",
+                "minimum": 0,
+                "maximum": 100,
+                "description": "Humidity percentage (0-100)"
+            },
+            "light": {
+                "bsonType": "number",
+                "minimum": 0,
+                "description": "Light intensity in lux"
+            },
+            "lightPercentage": {
+                "bsonType": "number",
+                "minimum": 0,
+                "maximum": 100,
+                "description": "Light percentage (0-100)"
+            },
+            "rssi": {
+                "bsonType": "number",
+                "description": "WiFi signal strength"
+            },
+            "localIp": {
+                "bsonType": "string",
+                "description": "Device local IP address"
+            },
+            "timestamp": {
+                "bsonType": "date",
+                "description": "Data timestamp"
+            }
+        }
+    }
+}
 
-class ResponseModel(BaseModel):
-    success: bool
-    message: str
-    data: DataModel = None
\ No newline at end of file
+# Fields a device must send; timestamp is set by the server
+REQUIRED_FIELDS = ("temperature", "humidity", "light", "lightPercentage", "rssi", "localIp")
+
+
+# BSON stores integers as at most 64-bit
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _is_number(value):
+    # bool is an int subclass but is stored as a BSON boolean, which the schema rejects
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        # Checked before isfinite, which overflows on ints past the float range (e.g. 10**400)
+        return _INT64_MIN <= value <= _INT64_MAX
+    return isinstance(value, Number) and math.isfinite(value)
+
+
+def _is_string(value):
+    return isinstance(value, str)
+
+
+_TYPE_CHECKS = {
+    "number": (_is_number, "a finite number"),
+    "string": (_is_string, "a string")
+}
+
+
+class TelemetryModel:
+    """Telemetry reading validator compiled once from SENSOR_DATA_VALIDATOR.
+
+    The schema is turned into a flat tuple of (field, check, minimum, maximum)
+    rules up front, so validating a reading is a single pass with no schema
+    lookups. It applies the same type and range rules as the collection
+    validator, so bad readings are rejected before a database round trip.
+    """
+
+    def __init__(self, schema=SENSOR_DATA_VALIDATOR, required=REQUIRED_FIELDS):
+        properties = schema["$jsonSchema"]["properties"]
+        rules = []
+        for field in required:
+            spec = properties[field]
+            check, expected = _TYPE_CHECKS[spec["bsonType"]]
+            rules.append((field, check, expected, spec.get("minimum"), spec.get("maximum")))
+        self.fields = tuple(required)
+        self.rules = tuple(rules)
+
+    def validate(self, data):
+        """Return (document, error): the reading's known fields, or a message"""
+        if not isinstance(data, dict):
+            return None, "Reading must be a JSON object"
+
+        missing = [field for field in self.fields if data.get(field) is None]
+        if missing:
+            return None, f"Missing required fields: {', '.join(missing)}"
+
+        for field, check, expected, minimum, maximum in self.rules:
+            value = data[field]
+            if not check(value):
+                return None, f"'{field}' must be {expected}"
+            if minimum is not None and value < minimum:
+                return None, f"'{field}' must be at least {minimum}"
+            if maximum is not None and value > maximum:
+                return None, f"'{field}' must be at most {maximum}"
+
+        return {field: data[field] for field in self.fields}, None
+
+
+# Shared by single and batch ingest on every entry point
+telemetry_model = TelemetryModel()
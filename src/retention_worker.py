@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Retention worker: rolls up, archives and deletes sensor_data readings past their retention
+Usage: python src/retention_worker.py [--once] [--max-hours N]
+
+Settings come from the environment: RETENTION_RAW_DAYS (30), RETENTION_ARCHIVE_DIR
+(unset: no archive), RETENTION_ARCHIVE_FORMAT (ndjson or parquet),
+RETENTION_BATCH_SIZE (1000), RETENTION_MAX_RATE (5000 readings/sec),
+RETENTION_MINUTE_ROLLUP_DAYS (7), RETENTION_INTERVAL (3600 seconds between
+runs) and MONGO_URI. Several workers may run; one holds the lease at a time.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+from services.retention import RetentionJob
+from utils.db_connection import get_database
+from utils.log import configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger('retention_worker')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--once', action='store_true', help="run one pass and exit")
+    parser.add_argument('--max-hours', type=int, default=None, help="compact at most this many hours per pass")
+    args = parser.parse_args()
+
+    configure_logging()
+    db = get_database()
+    if db is None:
+        logger.error("Failed to connect to database")
+        sys.exit(1)
+
+    job = RetentionJob.from_env(db)
+    interval = float(os.getenv('RETENTION_INTERVAL', '3600'))
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    while True:
+        try:
+            stats = job.run(max_hours=args.max_hours, stop=stopping)
+            if stats is not None:
+                logger.info("Retention pass complete", extra={"stats": stats})
+        except Exception as e:
+            logger.error("Retention pass failed: %s", e)
+        if args.once or stopping.wait(interval):
+            break
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,109 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from controllers.data_controller import DataController
 from controllers.led_controller import LEDController
-import random
-from datetime import datetime, timedelta
+from controllers.device_controller import DeviceController
+from services.write_buffer import IngestQueueFull
+from services.admission import AdmissionControl, AdmissionDenied, client_key
+from services.telemetry_hub import telemetry_hub
+from utils.json_provider import dumps, init_app as init_json
+from utils.metrics import registry
+from utils.profiler import profiler, profiler_enabled
+from services.telemetry_queries import (
+    EXPORT_BATCH_SIZE, HISTORY_MAX_POINTS, RECORDS_MAX_LIMIT, STREAM_KEEPALIVE,
+    columnar_units, csv_lines, format_columnar, generate_test_telemetry, pack_columnar,
+    parse_history_params, parse_int_param, parse_range_params
+)
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 api_routes = Blueprint('api_routes', __name__)
-data_controller = DataController()
-led_controller = LEDController()
+
+# Built by init_controllers() when the app is set up, not at import
+data_controller = None
+led_controller = None
+device_controller = None
+admission = None
 
 @api_routes.route('/data', methods=['POST'])
 def receive_data():
     json_data = request.get_json()
-    response = data_controller.receive_data(json_data)
-    print(f"Received data: {json_data}")
+    try:
+        admit(json_data)
+        response = data_controller.receive_data(json_data)
+    except AdmissionDenied as e:
+        return rate_limited_response(e)
+    except IngestQueueFull as e:
+        return ingest_queue_full_response(e)
+    logger.debug("Received data", extra={"reading": json_data})
     return jsonify(response)
 
+@api_routes.route('/data/batch', methods=['POST'])
+def receive_data_batch():
+    """Receive an array of readings in a single request"""
+    json_data = request.get_json(silent=True)
+    try:
+        admit(json_data)
+        response = data_controller.receive_batch(json_data)
+    except AdmissionDenied as e:
+        return rate_limited_response(e)
+    except IngestQueueFull as e:
+        return ingest_queue_full_response(e)
+    return jsonify(response)
+
+def admit(json_data):
+    """Charge the request to its client's and devices' rate limits, if they are enabled"""
+    if admission is not None:
+        admission.admit(client_key(request.headers.get('Authorization'), request.remote_addr), json_data)
+
+def rate_limited_response(error):
+    """Response when a client or device is over its ingest rate"""
+    response = jsonify({
+        "status": "error",
+        "message": str(error)
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = error.retry_after_header()
+    return response
+
+def ingest_queue_full_response(error):
+    """Backpressure response when the write-behind queue is full"""
+    response = jsonify({
+        "status": "error",
+        "message": str(error)
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = '1'
+    return response
+
 @api_routes.route('/telemetry', methods=['GET'])
 def get_telemetry():
     """Fetch telemetry data for frontend"""
     try:
-        real_data = data_controller.get_latest_telemetry()
+        real_data, etag = data_controller.get_latest_telemetry_entry(request.args.get('device'))
         
         if real_data:
-            return jsonify({
+            # Unchanged polls get a 304 straight from the cache
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = jsonify({
                 "status": "success",
                 "data": real_data,
                 "source": "database"
             })
+            response.set_etag(etag)
+            return response
         else:
             test_data = generate_test_telemetry()
             return jsonify({
                 "status": "success",
                 "data": test_data,
                 "source": "test_data",
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow()
             })
     except Exception as e:
         return jsonify({
@@ -41,25 +111,70 @@ def get_telemetry():
             "message": f"Failed to fetch telemetry data: {str(e)}"
         }), 500
 
+@api_routes.route('/telemetry/stream', methods=['GET'])
+def stream_telemetry():
+    """Push accepted readings to the client as Server-Sent Events.
+
+    Without gevent workers the stream holds a worker thread for as long as the client stays connected.
+    """
+    device = request.args.get('device')
+
+    def events():
+        # Subscribe once streaming starts so the finally below always unsubscribes
+        subscription = telemetry_hub.subscribe(device)
+        try:
+            yield "retry: 3000\n\n"
+            while not subscription.closed:
+                event = subscription.get(timeout=STREAM_KEEPALIVE)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: telemetry\ndata: {dumps(event)}\n\n"
+            if subscription.dropped:
+                # Slow consumer; the client should reconnect
+                yield "event: dropped\ndata: {}\n\n"
+        finally:
+            telemetry_hub.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @api_routes.route('/telemetry/history', methods=['GET'])
 def get_telemetry_history():
-    """Fetch historical telemetry data"""
+    """Fetch historical telemetry data, downsampled into time buckets"""
     try:
-        # Get query parameters
-        limit = request.args.get('limit', 10, type=int)
-        
-        # Generate historical test data
-        historical_data = []
-        for i in range(limit):
-            timestamp = datetime.utcnow() - timedelta(minutes=i*5)
-            data = generate_test_telemetry()
-            data['timestamp'] = timestamp.isoformat()
-            historical_data.append(data)
+        params = parse_history_params(request.args, HISTORY_MAX_POINTS)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    try:
+        if params['format'] != 'rows':
+            return telemetry_history_columns(params)
+
+        historical_data = data_controller.get_telemetry_history(
+            params['start'], params['end'], params['bucket'],
+            agg=params['agg'], device=params['device'], max_points=params['limit']
+        )
+        if historical_data is None:
+            return jsonify({
+                "status": "error",
+                "message": "Database connection failed"
+            }), 503
         
         return jsonify({
             "status": "success",
             "data": historical_data,
-            "count": len(historical_data)
+            "count": len(historical_data),
+            "from": params['start'],
+            "to": params['end'],
+            "bucket": params['bucket'],
+            "agg": params['agg']
         })
     except Exception as e:
         return jsonify({
@@ -67,10 +182,110 @@ def get_telemetry_history():
             "message": f"Failed to fetch historical data: {str(e)}"
         }), 500
 
+def telemetry_history_columns(params):
+    """History as parallel arrays (format=columnar) or packed little-endian arrays (format=binary)"""
+    columns = data_controller.get_telemetry_history_columns(
+        params['start'], params['end'], params['bucket'],
+        agg=params['agg'], device=params['device'], max_points=params['limit']
+    )
+    if columns is None:
+        return jsonify({
+            "status": "error",
+            "message": "Database connection failed"
+        }), 503
+
+    if params['format'] == 'binary':
+        body = pack_columnar(columns)
+        return Response(body, mimetype='application/octet-stream', headers={
+            'X-Point-Count': str(len(columns.get('timestamps', []))),
+            'X-Series': ','.join(columnar_units()),
+            'X-Units': ','.join(columnar_units().values())
+        })
+
+    data = format_columnar(columns)
+    return jsonify({
+        "status": "success",
+        "data": data,
+        "units": columnar_units(),
+        "count": len(data['timestamps']),
+        "from": params['start'],
+        "to": params['end'],
+        "bucket": params['bucket'],
+        "agg": params['agg']
+    })
+
+@api_routes.route('/telemetry/export', methods=['GET'])
+def export_telemetry():
+    """Stream raw readings as NDJSON or CSV"""
+    try:
+        start, end, device = parse_range_params(request.args)
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            raise ValueError("Invalid format (use ndjson or csv)")
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    if data_controller.db is None:
+        return jsonify({
+            "status": "error",
+            "message": "Database connection failed"
+        }), 503
+
+    rows = data_controller.iter_export(start, end, device, batch_size=EXPORT_BATCH_SIZE)
+    if export_format == 'csv':
+        body, mimetype = csv_lines(rows), 'text/csv'
+    else:
+        body, mimetype = (dumps(row) + '\n' for row in rows), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=sensor_data.{export_format}'}
+    )
+
+@api_routes.route('/telemetry/records', methods=['GET'])
+def get_telemetry_records():
+    """Page through raw readings with an opaque keyset cursor"""
+    try:
+        start, end, device = parse_range_params(request.args)
+        limit = parse_int_param(request.args, 'limit', 100)
+        if not 0 < limit <= RECORDS_MAX_LIMIT:
+            raise ValueError(f"'limit' must be between 1 and {RECORDS_MAX_LIMIT}")
+
+        if data_controller.db is None:
+            return jsonify({
+                "status": "error",
+                "message": "Database connection failed"
+            }), 503
+
+        rows, next_cursor = data_controller.get_records_page(
+            start, end, device, limit=limit, cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Failed to fetch records: {str(e)}"
+        }), 500
+
+    return jsonify({
+        "status": "success",
+        "data": rows,
+        "count": len(rows),
+        "next_cursor": next_cursor
+    })
+
 # LED Control Endpoints
 @api_routes.route('/led', methods=['POST'])
 def control_led():
-    """Control LED (connects to CoreIOT on-demand)"""
+    """Control LED over the pooled CoreIOT connection"""
     try:
         json_data = request.get_json()
         
@@ -80,7 +295,7 @@ def control_led():
                 "message": "Missing 'state' parameter"
             }), 400
         
-        # This will connect to CoreIOT, send command, and disconnect
+        # Publishes on a warm connection and waits for the device's RPC response
         response = led_controller.set_led_state(json_data['state'])
         return jsonify(response)
         
@@ -114,22 +329,170 @@ def toggle_led():
             "message": f"LED toggle error: {str(e)}"
         }), 500
 
-def generate_test_telemetry():
-    """Generate test telemetry data"""
-    return {
-        'temp': {
-            'value': round(random.uniform(20.0, 35.0), 1),
-            'unit': 'C'
-        },
-        'humid': {
-            'value': round(random.uniform(30.0, 80.0), 1),
-            'unit': '%'
-        },
-        'light': {
-            'value': round(random.uniform(100.0, 1000.0), 1),
-            'unit': 'lux'
-        }
-    }
+@api_routes.route('/coreiot/health', methods=['GET'])
+def get_coreiot_health():
+    """Connection health of the CoreIOT MQTT pool"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": led_controller.coreiot_service.connection_stats()
+        })
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Failed to get CoreIOT health: {str(e)}"
+        }), 500
+
+# Fleet Endpoints
+@api_routes.route('/devices', methods=['GET'])
+def list_devices():
+    """Registered devices (tokens are never returned)"""
+    try:
+        return jsonify(device_controller.list_devices())
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Failed to list devices: {str(e)}"
+        }), 500
+
+@api_routes.route('/devices/<device_id>/telemetry', methods=['GET'])
+def get_device_telemetry(device_id):
+    """Latest reading of one registered device"""
+    try:
+        response, etag = device_controller.get_device_telemetry(device_id)
+        if device_controller.is_not_found(response):
+            return jsonify(response), 404
+        if etag is not None and request.if_none_match.contains(etag):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        response = jsonify(response)
+        if etag is not None:
+            response.set_etag(etag)
+        return response
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Failed to fetch telemetry data: {str(e)}"
+        }), 500
+
+@api_routes.route('/devices/<device_id>/led', methods=['GET', 'POST'])
+def device_led(device_id):
+    """Last confirmed LED state of a device (GET) or set it (POST)"""
+    try:
+        if request.method == 'GET':
+            response = device_controller.get_device_led(device_id)
+        else:
+            json_data = request.get_json(silent=True)
+            if not json_data or 'state' not in json_data:
+                return jsonify({
+                    "status": "error",
+                    "message": "Missing 'state' parameter"
+                }), 400
+            response = device_controller.set_device_led(device_id, json_data['state'])
+        return jsonify(response), 404 if device_controller.is_not_found(response) else 200
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"LED control error: {str(e)}"
+        }), 500
+
+@api_routes.route('/devices/groups/<group>/led', methods=['POST'])
+def group_led(group):
+    """Send one LED command to every device in a group, concurrently"""
+    try:
+        json_data = request.get_json(silent=True)
+        if not json_data or 'state' not in json_data:
+            return jsonify({
+                "status": "error",
+                "message": "Missing 'state' parameter"
+            }), 400
+        return jsonify(device_controller.set_group_led(group, json_data['state']))
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Group LED control error: {str(e)}"
+        }), 500
+
+@api_routes.route('/alerts', methods=['GET'])
+def get_alerts():
+    """Alerts that have fired and whose condition still holds"""
+    alerts = data_controller.alerts
+    if alerts is None:
+        return jsonify({"status": "error", "message": "Alerting is disabled"}), 404
+    return jsonify({"status": "success", "data": alerts.active(), "stats": alerts.stats})
+
+@api_routes.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "success", "message": "ok"})
+
+@api_routes.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness: MongoDB answers a ping; includes connection pool stats"""
+    try:
+        ready, report = data_controller.readiness()
+    except Exception as e:
+        ready, report = False, {"error": str(e)}
+    return jsonify({
+        "status": "success" if ready else "error",
+        "data": report
+    }), 200 if ready else 503
+
+@api_routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(registry.render(), content_type=registry.CONTENT_TYPE)
+
+@api_routes.route('/debug/profile', methods=['POST'])
+def profile():
+    """Sample every thread for `seconds` (default 10) and return folded stacks for a flame graph"""
+    if not profiler_enabled():
+        return jsonify({"status": "error", "message": "Profiler is disabled"}), 404
+    try:
+        seconds = float(request.args.get('seconds', '10'))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid 'seconds' parameter"}), 400
+    stacks = profiler.capture(seconds)
+    if stacks is None:
+        return jsonify({"status": "error", "message": "A profile is already being captured"}), 409
+    return Response(stacks, mimetype='text/plain')
+
+def setup_websocket(app):
+    """Register /telemetry/ws when the optional flask-sock package is installed"""
+    try:
+        from flask_sock import Sock
+    except ImportError:
+        return
+
+    sock = Sock(app)
+
+    @sock.route('/telemetry/ws')
+    def telemetry_ws(ws):
+        subscription = telemetry_hub.subscribe(request.args.get('device'))
+        try:
+            while not subscription.closed:
+                event = subscription.get(timeout=STREAM_KEEPALIVE)
+                ws.send(dumps(event if event is not None else {"type": "keepalive"}))
+        finally:
+            telemetry_hub.unsubscribe(subscription)
+
+def init_controllers():
+    """Build the controllers the routes use; ones already set (e.g. by a test or benchmark) are kept"""
+    global data_controller, led_controller, device_controller, admission
+    if data_controller is None:
+        data_controller = DataController()
+    if led_controller is None:
+        led_controller = LEDController()
+    if device_controller is None:
+        device_controller = DeviceController(data_controller)
+    if admission is None:
+        admission = AdmissionControl.from_env()
 
 def setup_routes(app):
-    app.register_blueprint(api_routes)
\ No newline at end of file
+    init_controllers()
+    # Responses carry datetimes and ObjectIds; encode them compactly with the shared encoder
+    init_json(app)
+    app.register_blueprint(api_routes)
+    setup_websocket(app)
\ No newline at end of file
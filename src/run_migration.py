@@ -1,28 +1,99 @@
 #!/usr/bin/env python3
 """
-Simple migration runner script
-Usage: python run_migration.py
+Migration runner: applies versioned schema migrations and converges indexes, without prompts
+Usage:
+  python run_migration.py [up] [--to VERSION]    apply pending migrations (the default)
+  python run_migration.py down --to VERSION      revert migrations newer than VERSION
+  python run_migration.py status                 list migrations and whether they are applied
+  python run_migration.py indexes [--apply] [--drop-unused] [--commit-quorum majority]
+                                                 diff declared indexes against the database
+  python run_migration.py index-usage            operations per index from $indexStats
+  python run_migration.py seed                   insert two sample readings
+  python run_migration.py timeseries [--granularity seconds]
+                                                 rebuild sensor_data as a time-series collection
+
+Applied migrations are recorded in the schema_migrations collection, so running
+`up` again only applies what is new. Exits with status 1 on failure.
 """
+import argparse
 import sys
 import os
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from dotenv import load_dotenv
 from migrations.create_collections import MongoMigration
+from migrations.runner import MigrationRunner
+from migrations.schema import apply_index_plan, index_usage, plan_indexes
+from utils.db_connection import MongoDBConnection
+
+def print_status(runner):
+    for entry in runner.status():
+        mark = "✅" if entry["applied"] else "⏳"
+        applied_at = f" ({entry['appliedAt'].isoformat()})" if entry["appliedAt"] else ""
+        reversible = "" if entry["reversible"] else " [irreversible]"
+        print(f"{mark} {entry['version']:>3} {entry['name']}{applied_at}{reversible}")
+
+def print_plan(plan):
+    if not plan:
+        print("✅ Indexes match the declared ones")
+    for action, collection, target in plan:
+        name = target if action == 'drop' else f"{target['name']} {target['key']}"
+        print(f"{action:>8} {collection}.{name}")
+
+def print_usage(report):
+    for entry in report:
+        declared = "" if entry["declared"] else " [not declared]"
+        print(f"{entry['ops']:>12} {entry['collection']}.{entry['name']} since {entry['since'].isoformat()}{declared}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', nargs='?', default='up', choices=['up', 'down', 'status', 'indexes', 'index-usage', 'seed', 'timeseries'])
+    parser.add_argument('--to', type=int, default=None, help="target version for up/down")
+    parser.add_argument('--apply', action='store_true', help="indexes: create missing and rebuild changed indexes")
+    parser.add_argument('--drop-unused', action='store_true', help="indexes: with --apply, also drop undeclared indexes")
+    parser.add_argument('--commit-quorum', default=None, help="indexes: createIndexes commitQuorum on a replica set")
+    parser.add_argument('--granularity', default=None, help="timeseries: seconds, minutes or hours (default SENSOR_DATA_GRANULARITY)")
+    args = parser.parse_args()
+    load_dotenv()
+    if args.command == 'down' and args.to is None:
+        parser.error("down needs --to VERSION (0 reverts everything)")
+
+    db_connection = MongoDBConnection()
+    db = db_connection.connect()
+    if db is None:
+        print("❌ Failed to connect to database")
+        sys.exit(1)
 
-def run_migration():
-    """Run the database migration"""
-    print("🚀 Running IoT Database Migration...")
-    migration = MongoMigration()
-    success = migration.create_collections_and_indexes()
-    
-    if success:
-        print("\n✅ Migration completed successfully!")
-        print("Your database is ready for IoT data collection.")
-    else:
-        print("\n❌ Migration failed!")
+    try:
+        runner = MigrationRunner(db)
+        if args.command == 'up':
+            print("🚀 Running IoT Database Migration...")
+            applied = runner.up(args.to)
+            print(f"✅ Applied {len(applied)} migrations" if applied else "📦 Database is already up to date")
+        elif args.command == 'down':
+            reverted = runner.down(args.to)
+            print(f"✅ Reverted {len(reverted)} migrations")
+        elif args.command == 'status':
+            print_status(runner)
+        elif args.command == 'indexes':
+            plan = plan_indexes(db)
+            print_plan(plan)
+            if args.apply:
+                apply_index_plan(db, plan, drop_unused=args.drop_unused, commit_quorum=args.commit_quorum)
+        elif args.command == 'index-usage':
+            print_usage(index_usage(db))
+        elif args.command == 'seed':
+            MongoMigration(db=db).insert_sample_data()
+        elif args.command == 'timeseries':
+            MongoMigration(db=db).convert_sensor_data_to_timeseries(granularity=args.granularity)
+            print("➡️ Restart the app and ingest workers, then copy old readings: python src/migrations/backfill_timeseries.py")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
         sys.exit(1)
+    finally:
+        db_connection.close()
 
 if __name__ == "__main__":
-    run_migration()
\ No newline at end of file
+    main()
@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from bson import encode as bson_encode
+from utils.metrics import admission_denied, duplicates_dropped
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Atomic token bucket for the shared backend: KEYS[1] = bucket; ARGV = rate, burst, now, cost.
+# Returns {allowed, retry_after}; idle buckets expire once they would be full again.
+REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+def client_key(authorization, remote_addr):
+    """Bucket key for a request: a digest of its Authorization header, else its address"""
+    if authorization:
+        return 'token:' + hashlib.sha256(authorization.encode()).hexdigest()[:32]
+    return f'addr:{remote_addr}'
+
+
+class AdmissionDenied(Exception):
+    """Raised when a device or token has used up its ingest rate"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBuckets:
+    """In-process token buckets keyed by string, split over `shards` independently locked dicts.
+
+    Each key refills at `rate` tokens per second up to `burst`. A shard that
+    grows past `max_keys` forgets buckets that have refilled completely, since
+    a fresh bucket behaves the same.
+    """
+
+    shared = False
+
+    def __init__(self, rate, burst, shards=16, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def acquire(self, key, cost=1):
+        """Take `cost` tokens; returns (allowed, seconds until they would be available)"""
+        # A request bigger than the burst could never pass; let it through on a full bucket
+        cost = min(cost, self.burst)
+        buckets, lock = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated = buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                buckets[key] = (tokens, now)
+                allowed, retry_after = False, (cost - tokens) / self.rate
+            if len(buckets) > self.max_keys:
+                self._evict(buckets, now)
+        return allowed, retry_after
+
+    def _evict(self, buckets, now):
+        full_after = self.burst / self.rate
+        for key in [key for key, (_, updated) in buckets.items() if now - updated >= full_after]:
+            del buckets[key]
+
+
+class RedisTokenBuckets:
+    """The same token buckets kept in Redis, so every worker process shares one budget per key"""
+
+    shared = True
+
+    def __init__(self, client, rate, burst, prefix='admission:'):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._script = client.register_script(REDIS_TOKEN_BUCKET)
+
+    def acquire(self, key, cost=1):
+        cost = min(cost, self.burst)
+        allowed, retry_after = self._script(keys=[self.prefix + key], args=[self.rate, self.burst, time.time(), cost])
+        return bool(allowed), float(retry_after)
+
+
+class AdmissionControl:
+    """Per-token and per-device ingest rate limits.
+
+    `token_buckets` limit each access token (or client address when a request
+    has none); `device_buckets` limit each device by its `localIp`. Either may
+    be None to turn that limit off. If the shared backend fails, requests are
+    admitted rather than rejected.
+    """
+
+    def __init__(self, token_buckets=None, device_buckets=None):
+        self.token_buckets = token_buckets
+        self.device_buckets = device_buckets
+        self.shared = any(buckets is not None and buckets.shared for buckets in (token_buckets, device_buckets))
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "denied_token": 0, "denied_device": 0, "backend_errors": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Limits configured by the ADMISSION_* variables; None when ADMISSION_ENABLED is off"""
+        if os.getenv('ADMISSION_ENABLED', 'false').lower() not in ['true', '1', 'yes', 'on']:
+            return None
+        redis_url = os.getenv('ADMISSION_REDIS_URL', '')
+        if redis_url and redis is None:
+            logger.warning("ADMISSION_REDIS_URL is set but the redis package is not installed; limits are per process")
+
+        def buckets(prefix):
+            rate = float(os.getenv(f'ADMISSION_{prefix}_RATE', '0'))
+            if rate <= 0:
+                return None
+            burst = float(os.getenv(f'ADMISSION_{prefix}_BURST', str(rate)))
+            if redis_url and redis is not None:
+                return RedisTokenBuckets(redis.Redis.from_url(redis_url), rate, burst, prefix=f'admission:{prefix.lower()}:')
+            return TokenBuckets(rate, burst, shards=int(os.getenv('ADMISSION_SHARDS', '16')))
+
+        return cls(token_buckets=buckets('TOKEN'), device_buckets=buckets('DEVICE'))
+
+    def admit(self, token, readings):
+        """Charge one token-bucket unit per reading to the token and to each reading's device.
+
+        Raises AdmissionDenied with the time until the request would fit.
+        """
+        readings = readings if isinstance(readings, list) else [readings]
+        cost = max(1, len(readings))
+        if self.token_buckets is not None and token:
+            self._check(self.token_buckets, token, cost, "token", "Rate limit exceeded for this client")
+
+        if self.device_buckets is not None:
+            per_device = {}
+            for reading in readings:
+                device = reading.get('localIp') if isinstance(reading, dict) else None
+                if isinstance(device, str):
+                    per_device[device] = per_device.get(device, 0) + 1
+            for device, count in per_device.items():
+                self._check(self.device_buckets, device, count, "device", f"Rate limit exceeded for device '{device}'")
+
+        self._count("admitted")
+
+    def _check(self, buckets, key, cost, scope, message):
+        try:
+            allowed, retry_after = buckets.acquire(key, cost)
+        except Exception as e:
+            # Rate limiting is protective; an unreachable backend must not stop ingest
+            self._count("backend_errors")
+            logger.warning("Admission backend error, admitting: %s", e)
+            return
+        if not allowed:
+            self._count(f"denied_{scope}")
+            admission_denied.inc(scope)
+            raise AdmissionDenied(message, retry_after)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+class Deduplicator:
+    """Drops a reading identical to the previous one from the same device within `window` seconds.
+
+    Only the last fingerprint per device is kept, so memory grows with the
+    number of devices, not readings.
+    """
+
+    def __init__(self, window, shards=16):
+        self.window = window
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls):
+        """Configured by DEDUP_WINDOW seconds; None when it is 0 (the default)"""
+        window = float(os.getenv('DEDUP_WINDOW', '0'))
+        return cls(window) if window > 0 else None
+
+    def is_duplicate(self, document):
+        """True if the same device sent identical values within the window; records the reading either way"""
+        device = document.get('localIp')
+        values = {key: value for key, value in document.items() if key not in ('_id', 'timestamp')}
+        fingerprint = hashlib.blake2b(bson_encode(values), digest_size=16).digest()
+        seen, lock = self._shards[hash(device) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            previous = seen.get(device)
+            seen[device] = (fingerprint, now)
+            duplicate = previous is not None and previous[0] == fingerprint and now - previous[1] < self.window
+            if duplicate:
+                # Keep the window anchored at the first copy, so a steady stream of copies still lets one through per window
+                seen[device] = previous
+        if duplicate:
+            # Shards hold different locks, so the shared count needs its own
+            with self._dropped_lock:
+                self.dropped += 1
+            duplicates_dropped.inc()
+        return duplicate
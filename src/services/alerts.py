@@ -0,0 +1,326 @@
+import json
+import logging
+import math
+import operator
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from utils.metrics import alerts_fired
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le
+}
+FIELDS = ('temperature', 'humidity', 'light', 'lightPercentage', 'rssi')
+KINDS = ('threshold', 'mean_ratio', 'zscore')
+
+
+class RollingMean:
+    """Mean of the values seen in the last `window` seconds, kept in `slots` fixed time slots.
+
+    Adding a value and reading the mean are O(1) amortized: only slots the
+    clock has moved past are cleared, so memory never depends on the rate.
+    """
+
+    __slots__ = ('slot_seconds', 'sums', 'counts', 'head', 'total', 'count')
+
+    def __init__(self, window, slots=60):
+        self.slot_seconds = window / slots
+        self.sums = [0.0] * slots
+        self.counts = [0] * slots
+        self.head = None
+        self.total = 0.0
+        self.count = 0
+
+    def _advance(self, now):
+        epoch = int(now // self.slot_seconds)
+        if self.head is None or epoch - self.head >= len(self.sums):
+            self.sums = [0.0] * len(self.sums)
+            self.counts = [0] * len(self.counts)
+            self.total, self.count = 0.0, 0
+        elif epoch > self.head:
+            for expired in range(self.head + 1, epoch + 1):
+                i = expired % len(self.sums)
+                self.total -= self.sums[i]
+                self.count -= self.counts[i]
+                self.sums[i], self.counts[i] = 0.0, 0
+        else:
+            # A clock that went backwards keeps filling the current slot
+            return self.head % len(self.sums)
+        self.head = epoch
+        return epoch % len(self.sums)
+
+    def add(self, value, now):
+        i = self._advance(now)
+        self.sums[i] += value
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def mean(self, now):
+        self._advance(now)
+        return self.total / self.count if self.count else None
+
+
+class EWMA:
+    """Exponentially weighted mean and variance, for z-scores against recent behaviour"""
+
+    __slots__ = ('alpha', 'mean', 'variance', 'count')
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def add(self, value, now=None):
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.count += 1
+
+    def zscore(self, value, min_samples):
+        if self.count < min_samples or self.variance <= 0:
+            return None
+        return (value - self.mean) / math.sqrt(self.variance)
+
+
+class Rule:
+    """One alert condition: `metric op value` held for `duration` seconds.
+
+    The metric depends on `kind`: the reading itself (threshold), the reading
+    divided by its rolling mean over `window` seconds (mean_ratio), or its
+    z-score against an EWMA with weight `alpha` (zscore). Baselines are taken
+    before the reading is added to them.
+    """
+
+    def __init__(self, name, field, op, value, kind='threshold', duration=0.0, window=3600.0,
+                 alpha=0.1, min_samples=10, devices=None, actions=None, cooldown=0.0):
+        if field not in FIELDS:
+            raise ValueError(f"Rule '{name}': unknown field '{field}'")
+        if op not in OPERATORS:
+            raise ValueError(f"Rule '{name}': unknown operator '{op}'")
+        if kind not in KINDS:
+            raise ValueError(f"Rule '{name}': unknown kind '{kind}'")
+        self.name = name
+        self.field = field
+        self.op = op
+        self.compare = OPERATORS[op]
+        self.value = value
+        self.kind = kind
+        self.duration = duration
+        self.window = window
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.devices = frozenset(devices) if devices else None
+        self.actions = actions if actions is not None else [{"type": "log"}]
+        self.cooldown = cooldown
+        if kind == 'mean_ratio':
+            self.baseline = ('mean', field, window)
+        elif kind == 'zscore':
+            self.baseline = ('ewma', field, alpha)
+        else:
+            self.baseline = None
+
+    @classmethod
+    def from_dict(cls, spec):
+        spec = dict(spec)
+        if 'for' in spec:
+            spec['duration'] = spec.pop('for')
+        return cls(**spec)
+
+    def new_baseline(self):
+        return RollingMean(self.window) if self.kind == 'mean_ratio' else EWMA(self.alpha)
+
+    def metric(self, reading, baseline, now):
+        """The value compared against the rule's threshold; None while there is no baseline yet"""
+        if self.kind == 'threshold':
+            return reading
+        if self.kind == 'mean_ratio':
+            mean = baseline.mean(now)
+            if baseline.count < self.min_samples:
+                return None
+            return reading / mean if mean else None
+        return baseline.zscore(reading, self.min_samples)
+
+    def describe(self):
+        return f"{self.field} {self.op} {self.value}" if self.kind == 'threshold' else f"{self.kind}({self.field}) {self.op} {self.value}"
+
+
+class RuleState:
+    __slots__ = ('since', 'active', 'fired_at')
+
+    def __init__(self):
+        self.since = None
+        self.active = False
+        self.fired_at = None
+
+
+class AlertEngine:
+    """Evaluates alert rules on each accepted reading with per-device incremental state.
+
+    Each device keeps one RuleState per rule and one baseline (a RollingMean or
+    EWMA) per distinct (kind, field, parameter), so a reading costs O(rules)
+    with no database access. Devices are split over independently locked
+    shards. Actions run on a single background thread, so a slow action never
+    holds up ingest:
+
+    - {"type": "log"} logs the alert at WARNING.
+    - {"type": "store"} inserts it into the `alerts` collection.
+    - {"type": "rpc", "method": ..., "params": ..., "device": ...} sends an
+      RPC through `rpc(device, method, params)`, to the reading's device
+      unless `device` is given.
+    """
+
+    def __init__(self, rules, database=None, rpc=None, clock=time.time, shards=16):
+        self.rules = rules
+        self.database = database
+        self.rpc = rpc
+        self.clock = clock
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"evaluated": 0, "fired": 0, "resolved": 0, "action_errors": 0}
+
+    @classmethod
+    def from_env(cls, database=None):
+        """Rules from the JSON file named by ALERT_RULES_FILE; None when it is not set"""
+        path = os.getenv('ALERT_RULES_FILE', '')
+        if not path:
+            return None
+        with open(path) as f:
+            specs = json.load(f)
+        if isinstance(specs, dict):
+            specs = specs.get('rules', [])
+        return cls([Rule.from_dict(spec) for spec in specs], database=database)
+
+    def evaluate(self, document):
+        """Check every rule against a reading, then fold it into the device's baselines"""
+        device = document.get('localIp')
+        now = self.clock()
+        fired = []
+        shard, lock = self._shards[hash(device) % len(self._shards)]
+        with lock:
+            state = shard.get(device)
+            if state is None:
+                state = shard[device] = ([RuleState() for _ in self.rules], {})
+            rule_states, baselines = state
+
+            for rule, rule_state in zip(self.rules, rule_states):
+                if rule.devices is not None and device not in rule.devices:
+                    continue
+                reading = document.get(rule.field)
+                if not isinstance(reading, (int, float)):
+                    continue
+                baseline = None
+                if rule.baseline is not None:
+                    baseline = baselines.get(rule.baseline)
+                    if baseline is None:
+                        baseline = baselines[rule.baseline] = rule.new_baseline()
+                metric = rule.metric(reading, baseline, now)
+                alert = self._update(rule, rule_state, device, reading, metric, now)
+                if alert is not None:
+                    fired.append((rule, alert))
+
+            for key, baseline in baselines.items():
+                reading = document.get(key[1])
+                if isinstance(reading, (int, float)):
+                    baseline.add(reading, now)
+            self._count("evaluated")
+
+        for rule, alert in fired:
+            self._dispatch(rule, alert)
+
+    def _update(self, rule, state, device, reading, metric, now):
+        """Advance one rule's state; returns the alert if it fires now"""
+        if metric is None or not rule.compare(metric, rule.value):
+            if state.active:
+                state.active = False
+                self._count("resolved")
+                logger.info("Alert %s on %s resolved", rule.name, device)
+            state.since = None
+            return None
+
+        if state.since is None:
+            state.since = now
+        if state.active or now - state.since < rule.duration:
+            return None
+        if state.fired_at is not None and now - state.fired_at < rule.cooldown:
+            return None
+
+        state.active = True
+        state.fired_at = now
+        self._count("fired")
+        alerts_fired.inc(rule.name)
+        return {
+            "rule": rule.name,
+            "condition": rule.describe(),
+            "device": device,
+            "field": rule.field,
+            "value": reading,
+            "metric": metric,
+            "since": datetime.utcfromtimestamp(state.since),
+            "firedAt": datetime.utcfromtimestamp(now)
+        }
+
+    def _count(self, key):
+        # Shards hold different locks, so the shared counters need their own
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def active(self):
+        """(rule, device) pairs whose condition currently holds and has fired"""
+        alerts = []
+        for shard, lock in self._shards:
+            with lock:
+                for device, (rule_states, _) in shard.items():
+                    alerts.extend(
+                        {"rule": rule.name, "device": device, "since": datetime.utcfromtimestamp(state.since)}
+                        for rule, state in zip(self.rules, rule_states) if state.active
+                    )
+        return alerts
+
+    def _dispatch(self, rule, alert):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alert-actions')
+        for action in rule.actions:
+            self._executor.submit(self._run_action, action, alert)
+
+    def _run_action(self, action, alert):
+        try:
+            kind = action.get('type', 'log')
+            if kind == 'log':
+                logger.warning("Alert %s on %s: %s", alert["rule"], alert["device"], alert["condition"], extra={"alert": alert})
+            elif kind == 'store':
+                db = self.database() if self.database is not None else None
+                if db is None:
+                    raise RuntimeError("no database for the store action")
+                db['alerts'].insert_one(dict(alert))
+            elif kind == 'rpc':
+                if self.rpc is None:
+                    raise RuntimeError("no RPC sender for the rpc action")
+                self.rpc(action.get('device', alert["device"]), action['method'], action.get('params'))
+            else:
+                raise ValueError(f"unknown action type '{kind}'")
+        except Exception as e:
+            self._count("action_errors")
+            logger.error("Alert %s action failed: %s", alert["rule"], e)
+
+    def wait_for_actions(self):
+        """Block until every action submitted so far has run"""
+        with self._executor_lock:
+            executor = self._executor
+        if executor is not None:
+            executor.submit(lambda: None).result()
@@ -0,0 +1,20 @@
+import asyncio
+
+class AsyncCoreIOTService:
+    """Awaitable facade over CoreIOTService for the ASGI app.
+
+    RPC calls already complete through Futures resolved by the MQTT network
+    thread, so awaiting them never ties up an event-loop or worker thread.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def call_rpc(self, method, params, timeout=None):
+        return await asyncio.wrap_future(self.service.call_rpc(method, params, timeout))
+
+    async def send_led_command(self, state, timeout=None):
+        return await asyncio.wrap_future(self.service.send_led_command(state, timeout))
+
+    def connection_stats(self):
+        return self.service.connection_stats()
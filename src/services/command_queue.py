@@ -0,0 +1,128 @@
+import logging
+import threading
+from utils.metrics import rpc_commands
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class CommandCoalescer:
+    """Per-device RPC queue that only ever sends the latest desired value of each method.
+
+    `submit` records the desired value and returns at once. A send happens
+    `window` seconds after the first submit of a quiet period, so a burst of
+    commands collapses into one RPC carrying the last value. At most one RPC
+    per method is in flight; values submitted meanwhile are sent when it
+    completes. Nothing is sent when the desired value is the one the device
+    last confirmed.
+
+    `send(method, value)` returns a Future of the device's response and
+    `confirm(method, value, response)` turns that into the confirmed value.
+    """
+
+    def __init__(self, send, window, confirm=None):
+        self.send = send
+        self.window = window
+        self.confirm = confirm or (lambda method, value, response: value)
+        self._condition = threading.Condition()
+        self._desired = {}
+        self._in_flight = {}
+        self._confirmed = {}
+        self._timers = {}
+        self.stats = {"submitted": 0, "sent": 0, "coalesced": 0, "unchanged": 0, "failed": 0}
+
+    def submit(self, method, value):
+        """Record `value` as desired; returns 'queued', 'coalesced' or 'unchanged'"""
+        with self._condition:
+            self.stats["submitted"] += 1
+            if method in self._desired:
+                # Replaces a value that was never sent
+                self._desired[method] = value
+                return self._count("coalesced", method)
+            if method not in self._in_flight and self._confirmed.get(method, _UNSET) == value:
+                return self._count("unchanged", method)
+            self._desired[method] = value
+            if method not in self._in_flight:
+                self._schedule(method)
+            return "queued"
+
+    def desired(self, method, default=None):
+        """The latest value asked for: pending, else in flight, else last confirmed"""
+        with self._condition:
+            for values in (self._desired, self._in_flight, self._confirmed):
+                if method in values:
+                    return values[method]
+            return default
+
+    def confirmed(self, method, default=None):
+        with self._condition:
+            return self._confirmed.get(method, default)
+
+    def wait_idle(self, timeout=None):
+        """Block until nothing is pending or in flight; returns False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._desired and not self._in_flight, timeout)
+
+    def close(self):
+        """Cancel pending sends; commands already in flight still complete"""
+        with self._condition:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._desired.clear()
+            self._condition.notify_all()
+
+    def _count(self, outcome, method):
+        self.stats[outcome] += 1
+        rpc_commands.inc(method, outcome)
+        return outcome
+
+    def _schedule(self, method):
+        timer = threading.Timer(self.window, self._flush, (method,))
+        timer.daemon = True
+        self._timers[method] = timer
+        timer.start()
+
+    def _flush(self, method):
+        with self._condition:
+            self._timers.pop(method, None)
+            if method not in self._desired:
+                return
+            value = self._desired.pop(method)
+            if self._confirmed.get(method, _UNSET) == value:
+                # Toggled back to where the device already is
+                self._count("unchanged", method)
+                self._condition.notify_all()
+                return
+            self._in_flight[method] = value
+            self._count("sent", method)
+
+        try:
+            future = self.send(method, value)
+        except Exception as e:
+            self._completed(method, value, None, e)
+            return
+        future.add_done_callback(lambda future: self._done(method, value, future))
+
+    def _done(self, method, value, future):
+        error = future.exception()
+        self._completed(method, value, None if error else future.result(), error)
+
+    def _completed(self, method, value, response, error):
+        confirmed = _UNSET
+        if error is None:
+            try:
+                confirmed = self.confirm(method, value, response)
+            except Exception as e:
+                error = e
+        with self._condition:
+            del self._in_flight[method]
+            if error is None:
+                self._confirmed[method] = confirmed
+            else:
+                self._count("failed", method)
+                logger.warning("RPC %s not confirmed: %s", method, error)
+            if method in self._desired:
+                self._schedule(method)
+            self._condition.notify_all()
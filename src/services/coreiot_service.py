@@ -1,68 +1,107 @@
-import paho.mqtt.client as mqtt
 import json
+import logging
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import Future
+from services.mqtt_pool import MQTT_ERR_NO_CONN, MQTT_ERR_SUCCESS, error_string, get_pool
+from utils.metrics import mqtt_rpc_latency
+from services.rpc_client import (
+    PendingRequests, RPCError, next_request_id,
+    RPC_REQUEST_TOPIC, RPC_RESPONSE_TOPIC, RPC_RESPONSE_PREFIX
+)
+
+logger = logging.getLogger(__name__)
+
+LED_METHOD = "setValueButtonLED"
+
+
+def _observe_rpc(started):
+    """Done callback timing requests the device answered"""
+    def observe(future):
+        if not future.cancelled() and future.exception() is None:
+            mqtt_rpc_latency.observe(time.perf_counter() - started)
+    return observe
+
 
 class CoreIOTService:
-    def __init__(self, token, server="app.coreiot.io", port=1883):
+    def __init__(self, token, server="app.coreiot.io", port=1883, pool=None, rpc_timeout=5.0):
         self.token = token
         self.server = server
         self.port = port
-    
-    def send_led_command(self, state):
-        """Send LED command via RPC (connect, send, disconnect)"""
-        client = None
+        self.rpc_timeout = rpc_timeout
+        self.pool = pool if pool is not None else get_pool(server, port)
+        self.pending = PendingRequests()
+        self._subscribed = False
+        self._subscribe_lock = threading.Lock()
+
+    def _connection(self):
+        """Pooled connection with the RPC response subscription in place"""
+        connection = self.pool.get(self.token)
+        with self._subscribe_lock:
+            if not self._subscribed:
+                connection.add_message_handler(self._on_message)
+                connection.subscribe(RPC_RESPONSE_TOPIC)
+                self._subscribed = True
+        return connection
+
+    def call_rpc(self, method, params, timeout=None):
+        """Send an RPC request and return a Future completed by the device's response"""
+        future = Future()
+        future.add_done_callback(_observe_rpc(time.perf_counter()))
         try:
-            # Create and configure client
-            client = mqtt.Client()
-            client.username_pw_set(self.token)
-            
-            connected = False
-            
-            def on_connect(client, userdata, flags, rc):
-                nonlocal connected
-                connected = (rc == 0)
-                if connected:
-                    print(f"✅ Connected to CoreIOT for LED command")
-                else:
-                    print(f"❌ Failed to connect: {rc}")
-            
-            client.on_connect = on_connect
-            
-            # Connect
-            print(f"🔌 Connecting to {self.server} for LED command...")
-            client.connect(self.server, self.port, 60)
-            client.loop_start()
-            
-            # Wait for connection
-            timeout = 5
-            while not connected and timeout > 0:
-                time.sleep(0.1)
-                timeout -= 0.1
-            
-            if not connected:
-                return False
-            
-            # Send RPC command to device
-            rpc_topic = "v1/devices/me/rpc/request/1"
-            rpc_payload = {
-                "method": "setValueButtonLED",
-                "params": state
-            }
-            
-            result = client.publish(rpc_topic, json.dumps(rpc_payload))
-            print(f"📤 Sent LED RPC command: {state}")
-            
-            # Wait for publish
-            time.sleep(0.5)
-            
-            return result.rc == mqtt.MQTT_ERR_SUCCESS
-            
+            connection = self._connection()
+            request_id = next_request_id()
+            self.pending.add(request_id, future, timeout if timeout is not None else self.rpc_timeout)
+
+            payload = json.dumps({"method": method, "params": params})
+            info = connection.publish_nowait(RPC_REQUEST_TOPIC.format(request_id), payload)
+            if info.rc not in (MQTT_ERR_SUCCESS, MQTT_ERR_NO_CONN):
+                self.pending.fail(request_id, RPCError(f"Publish failed: {error_string(info.rc)}"))
+            else:
+                logger.debug("Sent RPC %s #%s", method, request_id, extra={"params": params})
         except Exception as e:
-            print(f"❌ LED command error: {e}")
-            return False
-        finally:
-            if client:
-                client.loop_stop()
-                client.disconnect()
-                print("🔌 Disconnected from CoreIOT")
\ No newline at end of file
+            if not future.done():
+                future.set_exception(RPCError(str(e)))
+        return future
+
+    def send_rpc(self, method, params, timeout=None):
+        """Send an RPC request and block until the device answers or the timeout expires"""
+        return self.call_rpc(method, params, timeout).result()
+
+    def send_led_command(self, state, timeout=None):
+        """Send LED command via RPC; the returned Future resolves to the device's response"""
+        return self.call_rpc(LED_METHOD, state, timeout)
+
+    def _on_message(self, topic, payload):
+        if not topic.startswith(RPC_RESPONSE_PREFIX):
+            return
+        try:
+            request_id = int(topic[len(RPC_RESPONSE_PREFIX):])
+        except ValueError:
+            return
+
+        try:
+            response = json.loads(payload)
+        except ValueError:
+            response = payload.decode('utf-8', errors='replace')
+        self.pending.complete(request_id, response)
+
+    def close(self):
+        """Stop handling RPC responses; the pooled connection closes if nothing else uses it"""
+        with self._subscribe_lock:
+            if not self._subscribed:
+                return
+            self._subscribed = False
+        connection = self.pool.peek(self.token)
+        if connection is not None:
+            connection.remove_message_handler(self._on_message)
+        self.pool.release(self.token)
+
+    def connection_stats(self):
+        """Health of this service's connection and of the shared pool; opens nothing"""
+        connection = self.pool.peek(self.token)
+        return {
+            "connection": connection.health() if connection is not None else {"state": "not started"},
+            "pool": self.pool.stats(),
+            "pendingRpc": len(self.pending)
+        }
@@ -0,0 +1,96 @@
+import threading
+import time
+from pymongo import ASCENDING
+
+DEVICES_COLLECTION = 'devices'
+
+# Group lookups for fleet commands
+DEVICE_INDEXES = (
+    {'key': [('groups', ASCENDING)], 'name': 'groups_asc'},
+)
+
+# Fields of a device document that are safe to return from the API (never the token)
+PUBLIC_FIELDS = ('name', 'groups', 'localIp')
+
+
+def public_device(device):
+    """API shape for a device document"""
+    data = {field: device.get(field) for field in PUBLIC_FIELDS}
+    data['id'] = device['_id']
+    return data
+
+
+class DeviceRegistry:
+    """Device id -> CoreIOT access token, stored in the devices collection and cached.
+
+    Device documents look like {_id: id, token, name, groups: [...], localIp}.
+    `localIp` links a device to its sensor_data readings and defaults to the id.
+    Lookups (including misses and group listings) are cached for `ttl` seconds.
+    """
+
+    def __init__(self, db_provider, ttl=60.0):
+        self.db_provider = db_provider
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        db = self.db_provider()
+        return db[DEVICES_COLLECTION] if db is not None else None
+
+    def create_indexes(self):
+        for spec in DEVICE_INDEXES:
+            self.collection.create_index(spec['key'], name=spec['name'])
+
+    def get(self, device_id):
+        """The device document, or None if it is not registered"""
+        return self._cached(('device', device_id), lambda: self._find_one(device_id))
+
+    def group(self, group):
+        """All devices in a group, in id order"""
+        return self._cached(('group', group), lambda: self._find_group(group))
+
+    def list(self):
+        return self._find({})
+
+    def register(self, device_id, token, name=None, groups=(), local_ip=None):
+        """Create or replace a device and drop any cached copies of it"""
+        document = {'token': token, 'name': name or device_id, 'groups': list(groups), 'localIp': local_ip or device_id}
+        self.collection.update_one({'_id': device_id}, {'$set': document}, upsert=True)
+        self.invalidate()
+        return dict(document, _id=device_id)
+
+    def remove(self, device_id):
+        """Delete a device; returns whether it was registered"""
+        deleted = self.collection.delete_one({'_id': device_id}).deleted_count
+        self.invalidate()
+        return deleted > 0
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _cached(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def _find_one(self, device_id):
+        collection = self.collection
+        return collection.find_one({'_id': device_id}) if collection is not None else None
+
+    def _find_group(self, group):
+        return self._find({'groups': group})
+
+    def _find(self, query):
+        collection = self.collection
+        if collection is None:
+            return []
+        return list(collection.find(query).sort('_id', ASCENDING))
@@ -0,0 +1,236 @@
+import json
+import logging
+import threading
+import time
+from pymongo.write_concern import WriteConcern
+from services.mqtt_pool import create_mqtt_client
+from services.spool import insert_once
+from utils.metrics import queue_depth
+
+logger = logging.getLogger(__name__)
+
+# Devices publish readings to v1/devices/<device id>/telemetry
+TELEMETRY_TOPIC = 'v1/devices/+/telemetry'
+
+
+def shared_topic(topic, group=None):
+    """The topic filter to subscribe to; with a group, the broker splits messages across its members"""
+    return f"$share/{group}/{topic}" if group else topic
+
+
+def decode_readings(payload):
+    """Decode a message body into a list of readings (a JSON object or array); raises ValueError"""
+    try:
+        data = json.loads(payload)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    return data if isinstance(data, list) else [data]
+
+
+class MQTTIngestWorker:
+    """Subscribes to device telemetry topics and stores readings in sensor_data in batches.
+
+    Readings are validated with the controller's `build_document`, so they
+    follow the same rules as POST /data. A batch is written when `batch_size`
+    readings are waiting or the oldest is `max_age` seconds old, with an
+    unordered insert_many using `write_concern`. Messages are acknowledged
+    manually, only after the write holding their readings has returned; a
+    message with nothing valid in it is acknowledged straight away, since
+    redelivering it would not help. A write that fails because MongoDB is
+    unreachable is retried every `retry_delay` seconds without acknowledging,
+    so the broker's in-flight window pushes back on publishers meanwhile.
+    """
+
+    def __init__(self, controller, server, port=1883, topic=TELEMETRY_TOPIC, group=None, qos=1,
+                 batch_size=500, max_age=0.5, retry_delay=1.0, write_concern=None,
+                 client_id='', username=None, password=None, keepalive=60,
+                 client_factory=create_mqtt_client):
+        self.controller = controller
+        self.server = server
+        self.port = port
+        self.topic = shared_topic(topic, group)
+        self.qos = qos
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self.write_concern = write_concern or WriteConcern(w='majority', j=True)
+        self.keepalive = keepalive
+
+        # (received_at, mid, qos, documents) per message, in arrival order
+        self._pending = []
+        self._pending_count = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._retry_at = 0.0
+
+        self.stats = {
+            "messages": 0,
+            "accepted": 0,
+            "invalid": 0,
+            "duplicates": 0,
+            "stored": 0,
+            "failed": 0,
+            "batches": 0,
+            "retries": 0,
+            "acked": 0,
+            "connects": 0
+        }
+
+        # A fixed client id keeps the broker session, so unacknowledged messages survive a restart
+        self.client = client_factory(client_id=client_id, clean_session=not client_id)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.manual_ack = hasattr(self.client, 'manual_ack_set')
+        if self.manual_ack:
+            self.client.manual_ack_set(True)
+        else:
+            logger.warning("paho-mqtt < 2.0: messages are acknowledged on receipt, not after the write")
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+
+    @property
+    def collection(self):
+        return self.controller.db['sensor_data'].with_options(write_concern=self.write_concern)
+
+    def start(self):
+        """Connect and start the network loop and the batch writer"""
+        self._thread = threading.Thread(target=self._run, name="mqtt-ingest-writer", daemon=True)
+        self._thread.start()
+        queue_depth.set_function(self.depth, 'mqtt_ingest')
+        logger.info("Connecting to %s:%s, subscribing to %s", self.server, self.port, self.topic)
+        self.client.connect_async(self.server, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def stop(self, timeout=10.0):
+        """Stop receiving, write and acknowledge what is pending, then disconnect"""
+        self.client.unsubscribe(self.topic)
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def depth(self):
+        """Number of readings waiting to be written"""
+        with self._condition:
+            return self._pending_count
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            with self._condition:
+                self.stats["connects"] += 1
+            logger.info("Connected, ingesting telemetry")
+            client.subscribe(self.topic, self.qos)
+        else:
+            logger.warning("Failed to connect: %s", rc)
+
+    def _on_message(self, client, userdata, message):
+        try:
+            readings = decode_readings(message.payload)
+        except ValueError:
+            # Counted as one invalid reading
+            readings = [None]
+        documents = []
+        duplicates = 0
+        for reading in readings:
+            document, error = self.controller.build_document(reading)
+            if error:
+                continue
+            if self.controller.is_duplicate(document):
+                duplicates += 1
+            else:
+                documents.append(document)
+
+        with self._condition:
+            self.stats["messages"] += 1
+            self.stats["accepted"] += len(documents)
+            self.stats["duplicates"] += duplicates
+            self.stats["invalid"] += len(readings) - len(documents) - duplicates
+            if documents:
+                self._pending.append((time.monotonic(), message.mid, message.qos, documents))
+                self._pending_count += len(documents)
+                self._condition.notify()
+                return
+        # Nothing to store, so nothing to wait for
+        self._ack([(message.mid, message.qos)])
+
+    def _ack(self, messages):
+        """Send the PUBACKs for written messages"""
+        if not self.manual_ack:
+            return
+        acked = 0
+        for mid, qos in messages:
+            if qos > 0:
+                self.client.ack(mid, qos)
+                acked += 1
+        with self._condition:
+            self.stats["acked"] += acked
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._flush_due():
+                    self._condition.wait(self._time_until_due())
+                if self._closed and not self._pending:
+                    return
+            if not self._flush_batch() and self._closed:
+                # Still failing at shutdown: leave the rest unacknowledged for redelivery
+                return
+
+    def _flush_due(self):
+        if not self._pending:
+            return False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        return self._closed or self._pending_count >= self.batch_size or now - self._pending[0][0] >= self.max_age
+
+    def _time_until_due(self):
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        if now < self._retry_at:
+            return self._retry_at - now
+        return max(0.0, self.max_age - (now - self._pending[0][0]))
+
+    def _flush_batch(self):
+        """Write whole messages up to batch_size readings and ack them; False if the write must be retried"""
+        with self._condition:
+            taken = 0
+            count = 0
+            while taken < len(self._pending) and (count == 0 or count + len(self._pending[taken][3]) <= self.batch_size):
+                count += len(self._pending[taken][3])
+                taken += 1
+            messages = self._pending[:taken]
+
+        documents = [document for _, _, _, message_documents in messages for document in message_documents]
+        # A time-series sensor_data has no unique _id, so a retry checks what the last attempt stored
+        retry = self._retry_at > 0 and self.controller.sensor_data_timeseries()
+        try:
+            # Rejected readings are left out; retrying will not help them
+            stored = insert_once(self.collection, documents, check_stored=retry)
+            if len(stored) < len(documents):
+                logger.error("MQTT ingest batch had %d failed readings", len(documents) - len(stored))
+        except Exception as e:
+            logger.warning("MQTT ingest write failed, will retry: %s", e)
+            with self._condition:
+                self._retry_at = time.monotonic() + self.retry_delay
+                self.stats["retries"] += 1
+            return False
+
+        self.controller.update_rollups(stored)
+        self.controller.accepted(stored)
+
+        with self._condition:
+            del self._pending[:taken]
+            self._pending_count -= count
+            self._retry_at = 0.0
+            self.stats["batches"] += 1
+            self.stats["stored"] += len(stored)
+            self.stats["failed"] += len(documents) - len(stored)
+        self._ack([(mid, qos) for _, mid, qos, _ in messages])
+        return True
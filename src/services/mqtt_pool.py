@@ -0,0 +1,282 @@
+import atexit
+import logging
+import threading
+import time
+from utils.metrics import mqtt_connect_latency, mqtt_publish_latency
+
+logger = logging.getLogger(__name__)
+
+# paho's return codes for a publish that was sent or queued until reconnect
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+# Publishes whose PUBACK never arrives (e.g. dropped on disconnect) are forgotten past this many
+MAX_TIMED_PUBLISHES = 10000
+
+
+def create_mqtt_client(client_id='', clean_session=None):
+    """Create a paho client using the v1 callback signatures on any paho version"""
+    # Imported on the first connection, so importing the app does not pay for paho
+    import paho.mqtt.client as mqtt
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id, clean_session=clean_session)
+    return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+
+def error_string(rc):
+    """paho's description of a return code"""
+    import paho.mqtt.client as mqtt
+    return mqtt.error_string(rc)
+
+
+class MQTTConnection:
+    """Long-lived, auto-reconnecting MQTT connection for a single device token"""
+
+    def __init__(self, token, server, port, keepalive=60, client_factory=create_mqtt_client):
+        self.token = token
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._handlers_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._subscriptions = {}
+        self._message_handlers = []
+        self._connect_started = None
+        # Send time of each publish_nowait awaiting its PUBACK, by message id
+        self._publish_started = {}
+
+        self.stats = {
+            "connects": 0,
+            "disconnects": 0,
+            "connect_failures": 0,
+            "published": 0,
+            "publish_failures": 0,
+            "messages_received": 0,
+            "last_connected_at": None,
+            "last_error": None
+        }
+
+        self.client = client_factory()
+        self.client.username_pw_set(token)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+
+    def start(self):
+        """Start the network loop; paho reconnects in the background from here on"""
+        with self._lock:
+            if self._started:
+                return
+            logger.info("Connecting to %s:%s", self.server, self.port)
+            self._connect_started = time.perf_counter()
+            self.client.connect_async(self.server, self.port, self.keepalive)
+            self.client.loop_start()
+            self._started = True
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout):
+        self.start()
+        return self._connected.wait(timeout)
+
+    def publish(self, topic, payload, qos=1, timeout=5.0):
+        """Publish on the warm connection and wait for the PUBACK"""
+        deadline = time.monotonic() + timeout
+        if not self.wait_connected(timeout):
+            self._count("publish_failures", error="not connected")
+            return False
+
+        error = None
+        try:
+            started = time.perf_counter()
+            info = self.client.publish(topic, payload, qos=qos)
+            info.wait_for_publish(max(0.0, deadline - time.monotonic()))
+            published = info.is_published()
+            if published:
+                mqtt_publish_latency.observe(time.perf_counter() - started)
+        except (ValueError, RuntimeError) as e:
+            error = str(e)
+            published = False
+
+        self._count("published" if published else "publish_failures", error=error)
+        return published
+
+    def publish_nowait(self, topic, payload, qos=1):
+        """Queue a publish without waiting; paho delivers it once connected"""
+        self.start()
+        started = time.perf_counter()
+        info = self.client.publish(topic, payload, qos=qos)
+        if qos > 0:
+            with self._stats_lock:
+                if len(self._publish_started) >= MAX_TIMED_PUBLISHES:
+                    self._publish_started.clear()
+                self._publish_started[info.mid] = started
+        if info.rc in (MQTT_ERR_SUCCESS, MQTT_ERR_NO_CONN):
+            self._count("published")
+        else:
+            self._count("publish_failures", error=error_string(info.rc))
+        return info
+
+    def subscribe(self, topic, qos=1):
+        """Subscribe now and again after every reconnect"""
+        with self._handlers_lock:
+            self._subscriptions[topic] = qos
+        if self.is_connected():
+            self.client.subscribe(topic, qos)
+
+    def add_message_handler(self, handler):
+        """Register handler(topic, payload) for every incoming message"""
+        with self._handlers_lock:
+            self._message_handlers.append(handler)
+
+    def remove_message_handler(self, handler):
+        with self._handlers_lock:
+            if handler in self._message_handlers:
+                self._message_handlers.remove(handler)
+
+    def has_message_handlers(self):
+        with self._handlers_lock:
+            return bool(self._message_handlers)
+
+    def close(self):
+        with self._lock:
+            if not self._started:
+                return
+            self.client.loop_stop()
+            self.client.disconnect()
+            self._started = False
+            self._connected.clear()
+
+    def health(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict(stats, connected=self.is_connected(), server=self.server, port=self.port)
+
+    def _count(self, key, error=None):
+        """Update a counter; called from both request threads and paho's network thread"""
+        with self._stats_lock:
+            self.stats[key] += 1
+            if error is not None:
+                self.stats["last_error"] = error
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self._connected.set()
+            self._count("connects")
+            with self._stats_lock:
+                self.stats["last_connected_at"] = time.time()
+                started, self._connect_started = self._connect_started, None
+            if started is not None:
+                mqtt_connect_latency.observe(time.perf_counter() - started)
+            logger.info("Connected to %s:%s", self.server, self.port)
+            with self._handlers_lock:
+                subscriptions = list(self._subscriptions.items())
+            for topic, qos in subscriptions:
+                client.subscribe(topic, qos)
+        else:
+            self._count("connect_failures", error=f"connect failed: {rc}")
+            logger.warning("Failed to connect to %s:%s: %s", self.server, self.port, rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+        self._count("disconnects", error=f"unexpected disconnect: {rc}" if rc != 0 else None)
+        if rc != 0:
+            with self._stats_lock:
+                self._connect_started = time.perf_counter()
+            logger.warning("Disconnected from %s:%s (%s), reconnecting", self.server, self.port, rc)
+
+    def _on_publish(self, client, userdata, mid):
+        with self._stats_lock:
+            started = self._publish_started.pop(mid, None)
+        if started is not None:
+            mqtt_publish_latency.observe(time.perf_counter() - started)
+
+    def _on_message(self, client, userdata, message):
+        self._count("messages_received")
+        for handler in list(self._message_handlers):
+            try:
+                handler(message.topic, message.payload)
+            except Exception as e:
+                logger.exception("MQTT message handler error: %s", e)
+
+
+class MQTTConnectionPool:
+    """One warm MQTTConnection per device token, shared across requests"""
+
+    def __init__(self, server, port, keepalive=60, client_factory=create_mqtt_client):
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.client_factory = client_factory
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            connection = self._connections.get(token)
+            if connection is None:
+                connection = MQTTConnection(
+                    token, self.server, self.port,
+                    keepalive=self.keepalive,
+                    client_factory=self.client_factory
+                )
+                self._connections[token] = connection
+        connection.start()
+        return connection
+
+    def peek(self, token):
+        """Existing connection for a token, or None; never opens one"""
+        with self._lock:
+            return self._connections.get(token)
+
+    def release(self, token):
+        """Close and forget a token's connection once no message handler is left on it"""
+        with self._lock:
+            connection = self._connections.get(token)
+            if connection is None or connection.has_message_handlers():
+                return
+            del self._connections[token]
+        connection.close()
+
+    def stats(self):
+        with self._lock:
+            connections = list(self._connections.values())
+        health = [c.health() for c in connections]
+        return {
+            "server": self.server,
+            "port": self.port,
+            "connections": len(health),
+            "connected": sum(1 for h in health if h["connected"]),
+            "published": sum(h["published"] for h in health),
+            "publish_failures": sum(h["publish_failures"] for h in health),
+            "reconnects": sum(max(0, h["connects"] - 1) for h in health)
+        }
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(server, port):
+    """Process-wide pool for a broker address"""
+    with _pools_lock:
+        pool = _pools.get((server, port))
+        if pool is None:
+            pool = MQTTConnectionPool(server, port)
+            _pools[(server, port)] = pool
+            atexit.register(pool.close_all)
+        return pool
@@ -0,0 +1,250 @@
+import gzip
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from services.admission import TokenBuckets
+from services.rollups import ROLLUP_STATE, extend_coverage, rollup_updates
+from services.telemetry_queries import KEYSET_SORT, bucket_start, export_row, range_query
+from utils.json_provider import dumps
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+HOURLY_ROLLUP = 'sensor_rollup_1h'
+MINUTE_ROLLUP = 'sensor_rollup_1m'
+STATE_COLLECTION = 'retention_state'
+ARCHIVE_FORMATS = ('ndjson', 'parquet')
+
+# Phases of compacting one hour, in order; a resumed job restarts the phase it was in
+PHASES = ('rollup', 'archive', 'delete')
+
+
+def parquet_schema():
+    return pyarrow.schema([
+        ('id', pyarrow.string()),
+        ('timestamp', pyarrow.timestamp('ms')),
+        ('temperature', pyarrow.float64()),
+        ('humidity', pyarrow.float64()),
+        ('light', pyarrow.float64()),
+        ('lightPercentage', pyarrow.float64()),
+        ('rssi', pyarrow.float64()),
+        ('localIp', pyarrow.string())
+    ])
+
+
+class RetentionJob:
+    """Compacts sensor_data readings older than `retention`, one whole hour at a time.
+
+    Each expired hour goes through three phases: its sensor_rollup_1h buckets
+    are rebuilt from the raw readings, the readings are written to an archive
+    file under `archive_dir` (skipped when it is None), and then they are
+    deleted. Progress is checkpointed in the retention_state collection after
+    every phase, so a job that stops is resumed where it left off, by this or
+    another process. A lease on the same document keeps two jobs from running
+    at once.
+
+    Reads and deletes go in batches of `batch_size` and are paced to at most
+    `max_rate` readings per second (0 for unpaced), so compaction leaves room
+    for foreground writes.
+
+    Hours older than the last completed one (readings that arrived late, e.g.
+    from a spool) are archived to a separate file and deleted without a
+    rebuild, since the hour's other readings are already gone; the rollups
+    counted them at ingest.
+    """
+
+    def __init__(self, db, retention, archive_dir=None, archive_format='ndjson', batch_size=1000, max_rate=0,
+                 minute_rollup_retention=None, lease_seconds=300, owner=None, clock=datetime.utcnow):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format '{archive_format}' (use one of {', '.join(ARCHIVE_FORMATS)})")
+        if archive_format == 'parquet' and pyarrow is None:
+            raise RuntimeError("The parquet archive format needs the pyarrow package")
+        self.db = db
+        self.retention = retention
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self.batch_size = batch_size
+        self.pacer = TokenBuckets(max_rate, max(max_rate, batch_size), shards=1) if max_rate > 0 else None
+        self.minute_rollup_retention = minute_rollup_retention
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.clock = clock
+        self.state = db[STATE_COLLECTION]
+        self.stats = {"hours": 0, "archived": 0, "deleted": 0, "rolled_up": 0, "stragglers": 0}
+
+    @classmethod
+    def from_env(cls, db):
+        return cls(
+            db,
+            timedelta(days=float(os.getenv('RETENTION_RAW_DAYS', '30'))),
+            archive_dir=os.getenv('RETENTION_ARCHIVE_DIR') or None,
+            archive_format=os.getenv('RETENTION_ARCHIVE_FORMAT', 'ndjson'),
+            batch_size=int(os.getenv('RETENTION_BATCH_SIZE', '1000')),
+            max_rate=float(os.getenv('RETENTION_MAX_RATE', '5000')),
+            minute_rollup_retention=timedelta(days=float(os.getenv('RETENTION_MINUTE_ROLLUP_DAYS', '7')))
+        )
+
+    def run(self, max_hours=None, stop=None):
+        """Compact every expired hour (or at most `max_hours`); returns stats, or None if another job holds the lease.
+
+        A set `stop` event ends the run after the current hour.
+        """
+        checkpoint = self.acquire()
+        if checkpoint is None:
+            logger.info("Retention job already running elsewhere")
+            return None
+        try:
+            cutoff = bucket_start(self.clock() - self.retention, HOUR)
+            watermark = checkpoint.get('watermark')
+            done = 0
+            while (max_hours is None or done < max_hours) and not (stop is not None and stop.is_set()):
+                oldest = self.db['sensor_data'].find_one(range_query(end=cutoff), {'timestamp': 1}, sort=KEYSET_SORT)
+                if oldest is None:
+                    break
+                hour = bucket_start(oldest['timestamp'], HOUR)
+                straggler = watermark is not None and hour < watermark
+                phase = checkpoint.get('phase') if checkpoint.get('hour') == hour else PHASES[0]
+                self.compact_hour(hour, phase, straggler)
+                watermark = max(watermark or hour, hour + timedelta(seconds=HOUR))
+                checkpoint = self.save(hour=None, phase=None, watermark=watermark)
+                done += 1
+            self.prune_minute_rollups()
+            return dict(self.stats, cutoff=cutoff, watermark=watermark)
+        finally:
+            self.release()
+
+    def compact_hour(self, hour, phase, straggler=False):
+        end = hour + timedelta(seconds=HOUR)
+        phases = PHASES[PHASES.index(phase or PHASES[0]):]
+        logger.info("Compacting %s from phase %s", hour.isoformat(), phases[0], extra={"straggler": straggler})
+        if 'rollup' in phases and not straggler:
+            self.save(hour=hour, phase='rollup')
+            self.rebuild_rollup(hour, end)
+            # Older hours went first, so the hourly rollup is complete up to `end`
+            extend_coverage(self.db, HOURLY_ROLLUP, datetime.min, end)
+        if 'archive' in phases and self.archive_dir is not None:
+            self.save(hour=hour, phase='archive')
+            self.archive(hour, end, straggler)
+        self.save(hour=hour, phase='delete')
+        self.delete(hour, end)
+        self.stats["hours"] += 1
+        if straggler:
+            self.stats["stragglers"] += 1
+
+    def rebuild_rollup(self, hour, end):
+        """Recompute the hour's hourly buckets from its raw readings, replacing what ingest built"""
+        rollup = self.db[HOURLY_ROLLUP]
+        rollup.delete_many({'timestamp': hour})
+        for batch in self.batches(hour, end):
+            self.write_rollup(rollup, rollup_updates(batch, HOUR))
+            self.stats["rolled_up"] += len(batch)
+
+    def write_rollup(self, rollup, updates):
+        # Ordered, so each bucket exists before its `last` update runs
+        rollup.bulk_write([UpdateOne(query, update, upsert=upsert) for query, update, upsert in updates], ordered=True)
+
+    def archive_path(self, hour, straggler):
+        name = hour.strftime('%H')
+        if straggler:
+            # Never overwrite the file holding the rest of the hour
+            name += f".late-{int(time.time())}"
+        extension = 'parquet' if self.archive_format == 'parquet' else 'ndjson.gz'
+        return os.path.join(self.archive_dir, 'sensor_data', hour.strftime('%Y'), hour.strftime('%m'), hour.strftime('%d'), f"{name}.{extension}")
+
+    def archive(self, hour, end, straggler=False):
+        """Write the hour's readings to a file, replacing any partial file a stopped run left"""
+        path = self.archive_path(hour, straggler)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = path + '.tmp'
+        count = 0
+        if self.archive_format == 'parquet':
+            schema = parquet_schema()
+            with parquet.ParquetWriter(temporary, schema, compression='zstd') as writer:
+                for batch in self.batches(hour, end):
+                    rows = [dict(export_row(document), timestamp=document['timestamp']) for document in batch]
+                    writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+                    count += len(rows)
+        else:
+            with gzip.open(temporary, 'wt', encoding='utf-8') as f:
+                for batch in self.batches(hour, end):
+                    f.writelines(dumps(export_row(document)) + '\n' for document in batch)
+                    count += len(batch)
+        os.replace(temporary, path)
+        self.stats["archived"] += count
+        logger.info("Archived %d readings to %s", count, path)
+
+    def delete(self, hour, end):
+        collection = self.db['sensor_data']
+        while True:
+            ids = [document['_id'] for document in
+                   collection.find(range_query(hour, end), {'_id': 1}).sort(KEYSET_SORT).limit(self.batch_size)]
+            if not ids:
+                return
+            self.pace(len(ids))
+            self.stats["deleted"] += collection.delete_many({'_id': {'$in': ids}}).deleted_count
+
+    def prune_minute_rollups(self):
+        """Minute buckets are only useful for recent history; drop those past their retention"""
+        if self.minute_rollup_retention is None:
+            return
+        cutoff = bucket_start(self.clock() - self.minute_rollup_retention, HOUR)
+        # History before the cutoff no longer reads the minute rollup
+        self.db[ROLLUP_STATE].update_one({'_id': MINUTE_ROLLUP}, {'$max': {'since': cutoff}})
+        deleted = self.db[MINUTE_ROLLUP].delete_many({'timestamp': {'$lt': cutoff}}).deleted_count
+        if deleted:
+            logger.info("Pruned %d minute rollup buckets before %s", deleted, cutoff.isoformat())
+
+    def batches(self, start, end):
+        """The range's readings in time order, `batch_size` at a time, paced"""
+        batch = []
+        for document in self.db['sensor_data'].find(range_query(start, end)).sort(KEYSET_SORT).batch_size(self.batch_size):
+            batch.append(document)
+            if len(batch) == self.batch_size:
+                self.pace(len(batch))
+                yield batch
+                batch = []
+        if batch:
+            self.pace(len(batch))
+            yield batch
+
+    def pace(self, count):
+        if self.pacer is None:
+            return
+        while True:
+            allowed, retry_after = self.pacer.acquire('retention', count)
+            if allowed:
+                return
+            time.sleep(retry_after)
+
+    def acquire(self):
+        """Take the job lease; returns the checkpoint, or None if another owner holds a live lease"""
+        now = self.clock()
+        lease = {'owner': self.owner, 'leaseUntil': now + timedelta(seconds=self.lease_seconds)}
+        free = {'_id': 'sensor_data', '$or': [
+            {'owner': None}, {'owner': self.owner}, {'leaseUntil': {'$lt': now}}
+        ]}
+        if self.state.count_documents({'_id': 'sensor_data'}) == 0:
+            self.state.update_one({'_id': 'sensor_data'}, {'$setOnInsert': {'owner': None}}, upsert=True)
+        return self.state.find_one_and_update(free, {'$set': lease}, return_document=ReturnDocument.AFTER)
+
+    def save(self, **fields):
+        """Checkpoint progress and renew the lease"""
+        fields.update(leaseUntil=self.clock() + timedelta(seconds=self.lease_seconds), updatedAt=self.clock())
+        checkpoint = self.state.find_one_and_update(
+            {'_id': 'sensor_data', 'owner': self.owner}, {'$set': fields}, return_document=ReturnDocument.AFTER
+        )
+        if checkpoint is None:
+            raise RuntimeError("Retention job lease was taken over by another process")
+        return checkpoint
+
+    def release(self):
+        self.state.update_one({'_id': 'sensor_data', 'owner': self.owner}, {'$set': {'owner': None, 'leaseUntil': None}})
@@ -0,0 +1,202 @@
+import time
+from datetime import timedelta
+from numbers import Number
+from pymongo import ASCENDING, UpdateOne
+from services.telemetry_queries import TELEMETRY_FIELDS, bucket_id, bucket_start
+
+# Rollup collections maintained at ingest, finest first: (collection, bucket seconds)
+ROLLUPS = (
+    ('sensor_rollup_1m', 60),
+    ('sensor_rollup_1h', 3600)
+)
+
+# Indexes on every rollup collection, as MongoDB index specs
+ROLLUP_INDEXES = (
+    {'key': [('localIp', ASCENDING), ('timestamp', ASCENDING)], 'name': 'localIp_timestamp', 'unique': True},
+    {'key': [('timestamp', ASCENDING)], 'name': 'timestamp_asc'}
+)
+
+# Reading fields aggregated into every rollup bucket
+ROLLUP_FIELDS = ('temperature', 'humidity', 'light', 'rssi')
+
+# One {'_id': rollup collection, 'since': datetime} per rollup: it holds every reading from `since` on
+ROLLUP_STATE = 'rollup_state'
+
+# Seconds a RollupStore reuses the coverage it last read
+COVERAGE_REFRESH = 60
+
+
+def is_number(value):
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def rollup_updates(documents, bucket_seconds):
+    """Upserts folding readings into per-device rollup buckets.
+
+    Readings are first accumulated in memory, so a batch costs two updates per
+    (device, bucket) it touches rather than per reading. Returns a list of
+    (filter, update, upsert) tuples: the first update of each pair maintains
+    count/sum/min/max, the second replaces `last` only if this batch holds a
+    newer reading than the one already stored.
+    """
+    buckets = {}
+    for document in documents:
+        key = (document.get('localIp'), bucket_start(document['timestamp'], bucket_seconds))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {'count': 0, 'sum': {}, 'min': {}, 'max': {}, 'last': None}
+        bucket['count'] += 1
+        for field in ROLLUP_FIELDS:
+            value = document.get(field)
+            if not is_number(value):
+                continue
+            bucket['sum'][field] = bucket['sum'].get(field, 0) + value
+            bucket['min'][field] = min(bucket['min'].get(field, value), value)
+            bucket['max'][field] = max(bucket['max'].get(field, value), value)
+        if bucket['last'] is None or document['timestamp'] >= bucket['last']['timestamp']:
+            bucket['last'] = document
+
+    updates = []
+    for (device, start), bucket in buckets.items():
+        key = {'localIp': device, 'timestamp': start}
+        increments = {'count': bucket['count']}
+        increments.update({f'sum.{field}': value for field, value in bucket['sum'].items()})
+        updates.append((key, {
+            '$inc': increments,
+            '$min': {f'min.{field}': value for field, value in bucket['min'].items()},
+            '$max': {f'max.{field}': value for field, value in bucket['max'].items()}
+        }, True))
+
+        last = bucket['last']
+        newer = dict(key, **{'$or': [
+            {'lastAt': {'$exists': False}},
+            {'lastAt': {'$lte': last['timestamp']}}
+        ]})
+        updates.append((newer, {'$set': {
+            'lastAt': last['timestamp'],
+            'last': {field: last.get(field) for field in ROLLUP_FIELDS}
+        }}, False))
+    return updates
+
+
+def choose_rollup(bucket_seconds):
+    """Coarsest rollup whose buckets tile the requested bucket, or None"""
+    for name, seconds in reversed(ROLLUPS):
+        if bucket_seconds % seconds == 0:
+            return name, seconds
+    return None
+
+
+def extend_coverage(db, name, start, end):
+    """Record that rollup `name` now holds every reading in [start, end).
+
+    Coverage is one open-ended range, so it only grows when the two meet (the
+    recorded `since` is at or before `end`). Returns whether it did.
+    """
+    return db[ROLLUP_STATE].update_one({'_id': name, 'since': {'$lte': end}}, {'$min': {'since': start}}).matched_count > 0
+
+
+def rollup_history_pipeline(start, end, bucket_seconds, rollup_seconds, agg='avg', device=None, max_points=500):
+    """history_pipeline over a rollup collection: scans O(buckets) instead of O(readings).
+
+    Rollup buckets are matched whole, so the first history bucket also covers
+    readings from the start of the rollup bucket containing `start`, and the
+    last one readings up to the end of the rollup bucket containing `end`.
+    """
+    match = {'timestamp': {'$gte': bucket_start(start, rollup_seconds), '$lt': end}}
+    if device:
+        match['localIp'] = device
+
+    group = {
+        '_id': bucket_id(bucket_seconds),
+        'count': {'$sum': '$count'}
+    }
+    for _, field, _ in TELEMETRY_FIELDS:
+        if agg == 'avg':
+            group[field] = {'$sum': f'$sum.{field}'}
+        elif agg == 'last':
+            group[field] = {'$last': f'$last.{field}'}
+        else:
+            group[field] = {f'${agg}': f'${agg}.{field}'}
+
+    pipeline = [{'$match': match}]
+    if agg == 'last':
+        pipeline.append({'$sort': {'timestamp': 1}})
+    pipeline.append({'$group': group})
+    if agg == 'avg':
+        pipeline.append({'$addFields': {
+            field: {'$divide': [f'${field}', '$count']}
+            for _, field, _ in TELEMETRY_FIELDS
+        }})
+    pipeline += [
+        {'$sort': {'_id': 1}},
+        {'$limit': max_points},
+        {'$addFields': {'timestamp': '$_id'}}
+    ]
+    return pipeline
+
+
+class RollupStore:
+    """Per-device minute and hour aggregates of sensor_data, kept current at ingest.
+
+    A rollup only answers history from the `since` recorded for it in
+    rollup_state. The first ingest of each process records, unless one is
+    already there, that rollups are complete from the next whole hour on;
+    backfill and retention extend it back. `coverage` is the last read copy,
+    refreshed by the controller every COVERAGE_REFRESH seconds.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.coverage = {}
+        self.coverage_read_at = None
+        self.coverage_recorded = False
+
+    def create_indexes(self):
+        for name, _ in ROLLUPS:
+            for spec in ROLLUP_INDEXES:
+                options = {option: value for option, value in spec.items() if option != 'key'}
+                self.db[name].create_index(spec['key'], **options)
+
+    def operations(self, documents):
+        """{collection name: bulk operations} folding the readings into every rollup"""
+        operations = {}
+        for name, seconds in ROLLUPS:
+            updates = rollup_updates(documents, seconds)
+            if updates:
+                operations[name] = [UpdateOne(query, update, upsert=upsert) for query, update, upsert in updates]
+        return operations
+
+    def apply(self, documents):
+        # Ordered, so each bucket exists before its `last` update runs
+        for name, operations in self.operations(documents).items():
+            self.db[name].bulk_write(operations, ordered=True)
+
+    def coverage_updates(self, now):
+        """(filter, update) upserts recording that ingest folds every reading from the hour after `now`"""
+        since = bucket_start(now, 3600) + timedelta(hours=1)
+        return [({'_id': name}, {'$setOnInsert': {'since': since}}) for name, _ in ROLLUPS]
+
+    def coverage_stale(self):
+        return self.coverage_read_at is None or time.monotonic() - self.coverage_read_at >= COVERAGE_REFRESH
+
+    def set_coverage(self, states):
+        self.coverage = {state['_id']: state.get('since') for state in states}
+        self.coverage_read_at = time.monotonic()
+
+    def history_query(self, start, end, bucket_seconds, agg='avg', device=None, max_points=500):
+        """(collection, pipeline) answering a history request from the coarsest fitting rollup.
+
+        Returns None when no rollup tiles the bucket size or that rollup does
+        not cover `start`, so the request falls back to raw readings.
+        """
+        rollup = choose_rollup(bucket_seconds)
+        if rollup is None:
+            return None
+        name, rollup_seconds = rollup
+        since = self.coverage.get(name)
+        if since is None or bucket_start(start, rollup_seconds) < since:
+            return None
+        return name, rollup_history_pipeline(
+            start, end, bucket_seconds, rollup_seconds, agg=agg, device=device, max_points=max_points
+        )
@@ -0,0 +1,92 @@
+import heapq
+import itertools
+import threading
+import time
+
+RPC_REQUEST_TOPIC = "v1/devices/me/rpc/request/{}"
+RPC_RESPONSE_TOPIC = "v1/devices/me/rpc/response/+"
+RPC_RESPONSE_PREFIX = "v1/devices/me/rpc/response/"
+
+# Request ids are allocated process-wide so services sharing a connection never collide
+_request_ids = itertools.count(1)
+
+
+def next_request_id():
+    return next(_request_ids)
+
+
+class RPCError(Exception):
+    """Raised when an RPC request could not be sent"""
+
+
+class RPCTimeoutError(RPCError):
+    """Raised when the device does not answer an RPC request in time"""
+
+
+class PendingRequests:
+    """Pending RPC requests keyed by id, completed by responses or expired on deadline.
+
+    A single reaper thread expires every table's requests, so in-flight commands
+    never hold a thread of their own.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def add(self, request_id, future, timeout):
+        with self._lock:
+            self._futures[request_id] = future
+        future.add_done_callback(lambda _: self._discard(request_id))
+        _reaper.schedule(self, request_id, time.monotonic() + timeout)
+
+    def complete(self, request_id, result):
+        """Resolve a request with the device's response; False if it is not pending"""
+        future = self._discard(request_id)
+        if future is None:
+            return False
+        if not future.done():
+            future.set_result(result)
+        return True
+
+    def fail(self, request_id, error):
+        future = self._discard(request_id)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._futures)
+
+    def _discard(self, request_id):
+        with self._lock:
+            return self._futures.pop(request_id, None)
+
+
+class _TimeoutReaper:
+    """Background thread that fails pending requests once their deadline passes"""
+
+    def __init__(self):
+        self._deadlines = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, table, request_id, deadline):
+        with self._condition:
+            heapq.heappush(self._deadlines, (deadline, request_id, table))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rpc-timeouts", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._deadlines or self._deadlines[0][0] > time.monotonic():
+                    wait = None if not self._deadlines else self._deadlines[0][0] - time.monotonic()
+                    self._condition.wait(wait)
+                _, request_id, table = heapq.heappop(self._deadlines)
+            table.fail(request_id, RPCTimeoutError(f"RPC request {request_id} timed out"))
+
+
+_reaper = _TimeoutReaper()
@@ -0,0 +1,395 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+import bson
+from pymongo.errors import BulkWriteError, ConnectionFailure, WTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# length, crc32 of the body, append time (epoch seconds); a zero length marks the end of a segment
+RECORD_HEADER = struct.Struct('<IId')
+CURSOR_FILE = 'cursor'
+LOCK_FILE = 'lock'
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+# Errors that mean MongoDB is unreachable or slow rather than that the reading is bad
+SPOOL_ERRORS = (ConnectionFailure, WTimeoutError)
+
+DUPLICATE_KEY = 11000
+
+
+def unstored(collection, documents):
+    """The documents whose _id is not in the collection yet; the batch's time range bounds the lookup"""
+    timestamps = [document['timestamp'] for document in documents]
+    query = {
+        'timestamp': {'$gte': min(timestamps), '$lte': max(timestamps)},
+        '_id': {'$in': [document['_id'] for document in documents]}
+    }
+    stored = {document['_id'] for document in collection.find(query, {'_id': 1})}
+    return [document for document in documents if document['_id'] not in stored]
+
+
+def insert_once(collection, documents, check_stored=False):
+    """Unordered insert_many of a batch an earlier attempt may have partly stored; returns the stored documents.
+
+    A duplicate-key error means that attempt stored the reading, so it counts
+    as stored; other write errors leave it out. Time-series collections do not
+    enforce a unique _id, so pass `check_stored` for them: readings already
+    there are then skipped instead of inserted twice. Errors other than
+    BulkWriteError are raised.
+    """
+    pending = unstored(collection, documents) if check_stored else documents
+    if not pending:
+        return documents
+    try:
+        collection.insert_many(pending, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        rejected = {id(pending[error["index"]]) for error in errors if error.get("code") != DUPLICATE_KEY}
+        return [document for document in documents if id(document) not in rejected]
+    return documents
+
+
+def segment_name(sequence):
+    return f"{SEGMENT_PREFIX}{sequence:012d}{SEGMENT_SUFFIX}"
+
+
+def encode_record(document, appended_at):
+    body = bson.encode(document)
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body), appended_at) + body
+
+
+def read_record(buffer, offset, end):
+    """Decode the record at offset; returns (document, appended_at, next_offset) or None at the end"""
+    if offset + RECORD_HEADER.size > end:
+        return None
+    length, crc, appended_at = RECORD_HEADER.unpack_from(buffer, offset)
+    start = offset + RECORD_HEADER.size
+    if length == 0 or start + length > end:
+        return None
+    body = bytes(buffer[start:start + length])
+    if zlib.crc32(body) != crc:
+        return None
+    return bson.decode(body), appended_at, start + length
+
+
+class Spool:
+    """Append-only local spool of readings in memory-mapped segment files.
+
+    Records are BSON documents behind a (length, crc32, append time) header.
+    Segments are preallocated to `segment_size` bytes and written through a
+    shared mapping, so an append is a memory copy and survives a crash of the
+    process; with `sync` each append is also flushed to disk. The replay
+    position is kept in a small cursor file, replaced atomically after each
+    replayed batch, and fully replayed segments are deleted. On open, each
+    segment is scanned up to its first torn or corrupt record.
+
+    A spool directory belongs to one process at a time; use `open_spool` to
+    claim a free one when several workers share a base directory.
+    """
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, sync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync = sync
+        self._lock = threading.Condition()
+        self._ends = {}
+        self._write_sequence = None
+        self._write_map = None
+        self._write_file = None
+        self._write_offset = 0
+        self._depth = 0
+        self._oldest = None
+        self.lock_file = None
+        self.stats = {
+            "spooled": 0,
+            "replayed": 0,
+            "failed": 0,
+            "corrupt_segments": 0
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self._read_sequence, self._read_offset = self._load_cursor()
+        self._recover()
+
+    def append(self, documents):
+        """Spool documents in order"""
+        now = time.time()
+        records = [encode_record(document, now) for document in documents]
+        with self._lock:
+            for record in records:
+                if self._write_map is None or self._write_offset + len(record) > len(self._write_map):
+                    self._open_segment(len(record))
+                self._write_map[self._write_offset:self._write_offset + len(record)] = record
+                self._write_offset += len(record)
+                self._ends[self._write_sequence] = self._write_offset
+            if self.sync:
+                self._write_map.flush()
+            if self._oldest is None:
+                self._oldest = now
+            self._depth += len(records)
+            self.stats["spooled"] += len(records)
+            self._lock.notify_all()
+
+    def depth(self):
+        """Number of spooled readings not replayed yet"""
+        with self._lock:
+            return self._depth
+
+    def wait(self, timeout=None):
+        """Block until there is something to replay; returns the depth"""
+        with self._lock:
+            if not self._depth:
+                self._lock.wait(timeout)
+            return self._depth
+
+    def read_batch(self, limit):
+        """Up to `limit` of the oldest unreplayed documents, plus the position to commit after them"""
+        documents = []
+        with self._lock:
+            sequence, offset = self._read_sequence, self._read_offset
+            ends = dict(self._ends)
+
+        for segment in sorted(s for s in ends if s >= sequence):
+            if segment != sequence:
+                sequence, offset = segment, 0
+            with open(self._path(segment), 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                while len(documents) < limit:
+                    record = read_record(data, offset, ends[segment])
+                    if record is None:
+                        break
+                    documents.append(record[0])
+                    offset = record[2]
+            finally:
+                data.close()
+            if len(documents) >= limit:
+                break
+        return documents, (sequence, offset)
+
+    def commit(self, position, count, failed=0):
+        """Mark everything before position as replayed and drop finished segments"""
+        sequence, offset = position
+        with self._lock:
+            self._read_sequence, self._read_offset = sequence, offset
+            self._depth = max(0, self._depth - count)
+            self.stats["replayed"] += count
+            self.stats["failed"] += failed
+            finished = [s for s in self._ends if s < sequence]
+            for segment in finished:
+                del self._ends[segment]
+            self._oldest = self._peek_oldest() if self._depth else None
+            self._save_cursor()
+        for segment in finished:
+            os.remove(self._path(segment))
+
+    def metrics(self):
+        """Counters plus depth, segment count and the age of the oldest unreplayed reading"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["depth"] = self._depth
+            stats["segments"] = len(self._ends)
+            stats["oldest_age_seconds"] = round(time.time() - self._oldest, 3) if self._oldest is not None else None
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _path(self, sequence):
+        return os.path.join(self.directory, segment_name(sequence))
+
+    def _open_segment(self, min_size):
+        """Seal the current segment and start the next, preallocated and mapped"""
+        self._close_segment()
+        sequence = max(self._ends, default=self._read_sequence) + 1
+        size = max(self.segment_size, min_size + RECORD_HEADER.size)
+        self._write_file = open(self._path(sequence), 'w+b')
+        self._write_file.truncate(size)
+        self._write_map = mmap.mmap(self._write_file.fileno(), size)
+        self._write_sequence = sequence
+        self._write_offset = 0
+        self._ends[sequence] = 0
+
+    def _close_segment(self):
+        if self._write_map is not None:
+            self._write_map.flush()
+            self._write_map.close()
+            self._write_file.close()
+            self._write_map = None
+            self._write_file = None
+
+    def _recover(self):
+        """Find the valid end of every segment left from an earlier run and count what is unreplayed"""
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            sequence = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            if sequence < self._read_sequence:
+                os.remove(self._path(sequence))
+                continue
+            with open(self._path(sequence), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    continue
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = 0
+                while True:
+                    record = read_record(data, offset, size)
+                    if record is None:
+                        break
+                    if sequence > self._read_sequence or offset >= self._read_offset:
+                        self._depth += 1
+                        if self._oldest is None:
+                            self._oldest = record[1]
+                    offset = record[2]
+                if offset + RECORD_HEADER.size <= size and any(data[offset:offset + RECORD_HEADER.size]):
+                    # Torn or corrupt record: everything after it in this segment is unreadable
+                    self.stats["corrupt_segments"] += 1
+                    logger.warning("Spool segment %s is corrupt after byte %d", name, offset)
+            finally:
+                data.close()
+            self._ends[sequence] = offset
+        # New appends always go to a fresh segment, never after a recovered tail
+
+    def _peek_oldest(self):
+        for segment in sorted(s for s in self._ends if s >= self._read_sequence):
+            offset = self._read_offset if segment == self._read_sequence else 0
+            if segment == self._write_sequence and self._write_map is not None:
+                record = read_record(self._write_map, offset, self._ends[segment])
+            else:
+                with open(self._path(segment), 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    record = read_record(data, offset, self._ends[segment])
+                finally:
+                    data.close()
+            if record is not None:
+                return record[1]
+        return None
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                sequence, offset = f.read().split()
+                return int(sequence), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self._read_sequence} {self._read_offset}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+
+def open_spool(base_directory, slots=64, **kwargs):
+    """Claim the first spool directory under base_directory that no other process holds.
+
+    The claim is an exclusive flock held for the life of the process, so a
+    restarted worker picks up whatever an earlier one left unreplayed.
+    """
+    os.makedirs(base_directory, exist_ok=True)
+    for slot in range(slots):
+        directory = os.path.join(base_directory, f"spool-{slot}")
+        os.makedirs(directory, exist_ok=True)
+        lock = open(os.path.join(directory, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        spool = Spool(directory, **kwargs)
+        spool.lock_file = lock
+        return spool
+    raise RuntimeError(f"All {slots} spool directories under {base_directory} are in use")
+
+
+class SpoolReplayer:
+    """Background thread that drains a spool into sensor_data in ordered batches.
+
+    Documents keep the _id they were spooled with, so a batch that is
+    replayed again after a crash only produces duplicate key errors, which
+    count as stored. While MongoDB is unreachable the batch is retried every
+    `retry_delay` seconds. `on_written` gets the documents each batch stored,
+    duplicates included, since no earlier attempt got as far as calling it.
+    When `check_stored()` is true (a time-series collection, which has no
+    unique _id) every batch is checked against what is stored first.
+    """
+
+    def __init__(self, spool, collection_provider, batch_size=500, retry_delay=1.0, on_written=None, check_stored=None):
+        self.check_stored = check_stored
+        self.spool = spool
+        self.collection_provider = collection_provider
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.on_written = on_written
+        self._stop = threading.Event()
+        self._thread = None
+        self._rate = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def metrics(self):
+        return dict(self.spool.metrics(), replay_per_second=round(self._rate, 1))
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.spool.wait(timeout=1.0):
+                self._rate = 0.0
+                continue
+            started = time.perf_counter()
+            try:
+                replayed = self.replay_batch()
+            except SPOOL_ERRORS as e:
+                logger.warning("Spool replay failed, will retry: %s", e)
+                self._rate = 0.0
+                self._stop.wait(self.retry_delay)
+                continue
+            except Exception as e:
+                logger.exception("Spool replay error: %s", e)
+                self._stop.wait(self.retry_delay)
+                continue
+            self._rate = replayed / max(time.perf_counter() - started, 1e-9)
+
+    def replay_batch(self):
+        """Write the oldest batch and commit it; returns the number replayed"""
+        documents, position = self.spool.read_batch(self.batch_size)
+        if not documents:
+            return 0
+
+        collection = self.collection_provider()
+        if collection is None:
+            raise ConnectionFailure("Database connection failed")
+        # Readings an earlier attempt stored (a replay that never committed, or an insert
+        # that failed before spooling) never reached on_written, so they count as stored
+        stored = insert_once(collection, documents, check_stored=self.check_stored is not None and self.check_stored())
+        rejected = len(documents) - len(stored)
+        if rejected:
+            logger.error("Spool replay had %d rejected readings", rejected)
+
+        self.spool.commit(position, len(documents), failed=rejected)
+        if stored and self.on_written is not None:
+            try:
+                self.on_written(stored)
+            except Exception as e:
+                logger.exception("Spool on_written callback failed: %s", e)
+        return len(documents)
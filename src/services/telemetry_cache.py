@@ -0,0 +1,85 @@
+import threading
+import time
+from services.telemetry_queries import format_telemetry
+
+# Cache key for the newest reading across all devices
+ALL_DEVICES = '*'
+
+
+class LatestValueCache:
+    """Latest telemetry per device, kept current by ingest (write-through).
+
+    Readings written by other processes are picked up when an entry is older
+    than `ttl` seconds and gets reloaded from the database.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def update(self, document):
+        """Write-through from ingest; keeps only readings newer than the cached ones"""
+        entry = self._entry(document)
+        with self._lock:
+            for key in (document.get('localIp'), ALL_DEVICES):
+                current = self._entries.get(key)
+                if current is None or not _newer(current, entry):
+                    self._entries[key] = entry
+
+    def get(self, device, loader):
+        """Return (data, etag) for a device (None for all), loading on miss or expiry.
+
+        `loader()` returns the newest sensor_data document or None.
+        """
+        cached = self.peek(device)
+        if cached is not None:
+            return cached
+        return self.store(device, loader())
+
+    def peek(self, device):
+        """Fresh (data, etag) for a device, or None on a miss or expired entry"""
+        key = device or ALL_DEVICES
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] > time.monotonic():
+                self.stats["hits"] += 1
+                return entry["data"], entry["etag"]
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, device, document):
+        """Cache a document loaded from the database and return its (data, etag)"""
+        key = device or ALL_DEVICES
+        entry = self._entry(document)
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and _newer(current, entry):
+                # A write-through stored a newer reading while we were loading
+                entry = current
+            else:
+                self._entries[key] = entry
+        return entry["data"], entry["etag"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _entry(self, document):
+        if document is None:
+            return {"data": None, "etag": None, "document_ts": None, "expires_at": time.monotonic() + self.ttl}
+        timestamp = document.get('timestamp')
+        return {
+            "data": format_telemetry(document),
+            "etag": f"{document.get('_id')}-{timestamp.isoformat() if timestamp else ''}",
+            "document_ts": timestamp,
+            "expires_at": time.monotonic() + self.ttl
+        }
+
+
+def _newer(entry, other):
+    """True if entry holds a strictly newer reading than other"""
+    if entry["document_ts"] is None:
+        return False
+    return other["document_ts"] is None or entry["document_ts"] > other["document_ts"]
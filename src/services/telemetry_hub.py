@@ -0,0 +1,139 @@
+import asyncio
+import queue
+import threading
+from services.telemetry_queries import format_telemetry
+
+
+class Subscription:
+    """A subscriber's bounded event queue, optionally filtered to one device.
+
+    Uses queue.Queue, which becomes cooperative under gevent monkey-patching,
+    so idle subscribers cost a greenlet rather than an OS thread.
+    """
+
+    def __init__(self, device=None, maxsize=100):
+        self.device = device
+        self.closed = False
+        self.dropped = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def offer(self, event):
+        """Non-blocking delivery; False if the subscriber has fallen behind"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout=None):
+        """Next event, or None if none arrives within timeout or the subscription closed"""
+        if self.closed:
+            return None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncSubscription(Subscription):
+    """Subscription consumed from an asyncio event loop; offer() is safe from any thread"""
+
+    def __init__(self, device=None, maxsize=100, loop=None):
+        self.device = device
+        self.closed = False
+        self.dropped = False
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event):
+        if self._queue.full():
+            return False
+        self._loop.call_soon_threadsafe(self._put, event)
+        return True
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Filled up between offer() and delivery; the hub drops us on the next offer
+            pass
+
+    async def get(self, timeout=None):
+        if self.closed:
+            return None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TelemetryHub:
+    """In-process pub/sub fan-out of accepted readings to live subscribers.
+
+    Publishing never blocks ingest: a subscriber whose queue is full is
+    dropped and has to reconnect.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._by_device = {}
+        self._all = set()
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "dropped_subscribers": 0}
+
+    def subscribe(self, device=None, subscription=None):
+        """Register a subscriber for one device (or all devices)"""
+        if subscription is None:
+            subscription = Subscription(device, maxsize=self.queue_size)
+        with self._lock:
+            if subscription.device:
+                self._by_device.setdefault(subscription.device, set()).add(subscription)
+            else:
+                self._all.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            if subscription.device:
+                subscribers = self._by_device.get(subscription.device)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_device[subscription.device]
+            else:
+                self._all.discard(subscription)
+
+    def publish(self, document):
+        """Fan a stored sensor_data document out to matching subscribers"""
+        device = document.get('localIp')
+        with self._lock:
+            subscribers = list(self._all) + list(self._by_device.get(device, ()))
+            self.stats["published"] += 1
+        if not subscribers:
+            return
+
+        event = format_telemetry(document)
+        event['device'] = device
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.offer(event):
+                delivered += 1
+            else:
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self.stats["dropped_subscribers"] += 1
+        with self._lock:
+            self.stats["delivered"] += delivered
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._all) + sum(len(s) for s in self._by_device.values())
+
+
+# Process-wide hub shared by the ingest path and the streaming endpoints
+telemetry_hub = TelemetryHub()
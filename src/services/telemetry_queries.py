@@ -0,0 +1,335 @@
+import base64
+import csv
+import io
+import random
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from utils.helpers import parse_datetime
+
+EPOCH = datetime(1970, 1, 1)
+
+# Fields exposed by the telemetry API: (API key, document field, unit)
+TELEMETRY_FIELDS = (
+    ('temp', 'temperature', 'C'),
+    ('humid', 'humidity', '%'),
+    ('light', 'light', 'lux')
+)
+
+# Upper bound on points returned by /telemetry/history
+HISTORY_MAX_POINTS = 500
+
+# Cursor batch size for /telemetry/export and page size limit for /telemetry/records
+EXPORT_BATCH_SIZE = 1000
+RECORDS_MAX_LIMIT = 1000
+
+# Seconds between SSE/WebSocket keepalives on an idle stream
+STREAM_KEEPALIVE = 15
+
+# Bucket sizes offered by /telemetry/history, in seconds
+BUCKET_SIZES = {
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '1h': 3600,
+    '6h': 21600,
+    '1d': 86400
+}
+
+# Response formats offered by /telemetry/history
+HISTORY_FORMATS = ('rows', 'columnar', 'binary')
+
+AGGREGATIONS = {
+    'avg': '$avg',
+    'min': '$min',
+    'max': '$max',
+    'last': '$last'
+}
+
+
+def format_telemetry(document):
+    """Convert a sensor_data document (or bucket) to the API's telemetry shape.
+
+    The timestamp stays a datetime; the JSON encoder writes it in ISO 8601.
+    """
+    data = {
+        key: {'value': document.get(field), 'unit': unit}
+        for key, field, unit in TELEMETRY_FIELDS
+    }
+    data['timestamp'] = document.get('timestamp')
+    return data
+
+
+def bucket_count(start, end, bucket_seconds):
+    """Number of epoch-aligned buckets that [start, end) touches"""
+    first = bucket_start(start, bucket_seconds)
+    last = bucket_start(end - timedelta(microseconds=1), bucket_seconds)
+    return int((last - first).total_seconds()) // bucket_seconds + 1
+
+
+def choose_bucket(start, end, max_points):
+    """Smallest offered bucket that keeps the range within max_points; None if none does"""
+    for name, seconds in sorted(BUCKET_SIZES.items(), key=lambda item: item[1]):
+        if bucket_count(start, end, seconds) <= max_points:
+            return name
+    return None
+
+
+def bucket_id(bucket_seconds):
+    """Group key rounding $timestamp down to a bucket aligned to the Unix epoch"""
+    bucket_ms = bucket_seconds * 1000
+    return {'$subtract': ['$timestamp', {'$mod': [{'$subtract': ['$timestamp', EPOCH]}, bucket_ms]}]}
+
+
+def bucket_start(timestamp, bucket_seconds):
+    """Python equivalent of bucket_id for a single datetime"""
+    delta = timestamp - EPOCH
+    offset = (delta.days * 86400 + delta.seconds) % bucket_seconds
+    return timestamp - timedelta(seconds=offset, microseconds=delta.microseconds)
+
+
+def history_pipeline(start, end, bucket_seconds, agg='avg', device=None, max_points=500):
+    """Aggregation pipeline that downsamples sensor_data into time buckets.
+
+    The $match on timestamp is served by the timestamp_id index. Buckets are
+    aligned to the Unix epoch so the same range always yields the same buckets.
+    """
+    match = {'timestamp': {'$gte': start, '$lt': end}}
+    # parse_history_params rejects ranges with more buckets than max_points, so
+    # the $limit below never drops buckets a request asked for
+    if device:
+        match['localIp'] = device
+
+    operator = AGGREGATIONS[agg]
+    group = {
+        '_id': bucket_id(bucket_seconds),
+        'count': {'$sum': 1}
+    }
+    for _, field, _ in TELEMETRY_FIELDS:
+        group[field] = {operator: f'${field}'}
+
+    pipeline = [{'$match': match}]
+    if agg == 'last':
+        # $last needs readings in time order within each bucket
+        pipeline.append({'$sort': {'timestamp': 1}})
+    pipeline += [
+        {'$group': group},
+        {'$sort': {'_id': 1}},
+        {'$limit': max_points},
+        {'$addFields': {'timestamp': '$_id'}}
+    ]
+    return pipeline
+
+
+def format_bucket(bucket):
+    """API shape for one history bucket"""
+    data = format_telemetry(bucket)
+    for key, _, _ in TELEMETRY_FIELDS:
+        value = data[key]['value']
+        if isinstance(value, float):
+            data[key]['value'] = round(value, 2)
+    data['count'] = bucket.get('count', 0)
+    return data
+
+
+def columnar_stage():
+    """Final stage folding sorted history buckets into one document of parallel arrays.
+
+    Timestamps are pushed as epoch milliseconds, so neither the server nor the
+    client builds a dict or a date string per point.
+    """
+    group = {
+        '_id': None,
+        'timestamps': {'$push': {'$subtract': ['$_id', EPOCH]}},
+        'count': {'$push': '$count'}
+    }
+    for _, field, _ in TELEMETRY_FIELDS:
+        group[field] = {'$push': f'${field}'}
+    return {'$group': group}
+
+
+def format_columnar(columns):
+    """API shape for a columnar history result (None when there are no buckets)"""
+    columns = columns or {}
+    data = {
+        'timestamps': columns.get('timestamps', []),
+        'count': columns.get('count', [])
+    }
+    for key, field, _ in TELEMETRY_FIELDS:
+        data[key] = [round(value, 2) if isinstance(value, float) else value for value in columns.get(field, [])]
+    return data
+
+
+def columnar_units():
+    return {key: unit for key, _, unit in TELEMETRY_FIELDS}
+
+
+# Binary history layout, all little-endian: uint32 point count, the timestamps
+# as int64 epoch milliseconds, then one float32 array per series in
+# TELEMETRY_FIELDS order; missing values are NaN
+BINARY_HEADER = struct.Struct('<I')
+
+
+def pack_columnar(columns):
+    """Encode a columnar history result in the binary layout above"""
+    timestamps = array('q', columns.get('timestamps', []))
+    series = [
+        array('f', (float('nan') if value is None else value for value in columns.get(field, [])))
+        for _, field, _ in TELEMETRY_FIELDS
+    ]
+    if sys.byteorder != 'little':
+        timestamps.byteswap()
+        for values in series:
+            values.byteswap()
+    return BINARY_HEADER.pack(len(timestamps)) + timestamps.tobytes() + b''.join(values.tobytes() for values in series)
+
+
+# Fields written by /telemetry/export, in column order
+EXPORT_FIELDS = ('id', 'timestamp', 'temperature', 'humidity', 'light', 'lightPercentage', 'rssi', 'localIp')
+
+# Sort order for export and keyset pagination; (timestamp, _id) is unique
+KEYSET_SORT = [('timestamp', 1), ('_id', 1)]
+
+
+def range_query(start=None, end=None, device=None):
+    """sensor_data filter for an optional time range and device"""
+    query = {}
+    if start is not None or end is not None:
+        query['timestamp'] = {}
+        if start is not None:
+            query['timestamp']['$gte'] = start
+        if end is not None:
+            query['timestamp']['$lt'] = end
+    if device:
+        query['localIp'] = device
+    return query
+
+
+def export_row(document):
+    """Flat, JSON-safe export record for a sensor_data document"""
+    row = {field: document.get(field) for field in EXPORT_FIELDS}
+    row['id'] = str(document['_id'])
+    timestamp = document.get('timestamp')
+    row['timestamp'] = timestamp.isoformat() if timestamp else None
+    return row
+
+
+def encode_cursor(document):
+    """Opaque pagination cursor pointing just after this document"""
+    raw = f"{document['timestamp'].isoformat()}|{document['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, ObjectId) from a cursor made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, object_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def after_cursor(query, cursor):
+    """Restrict a query to documents sorted after the cursor position"""
+    timestamp, object_id = decode_cursor(cursor)
+    keyset = {'$or': [
+        {'timestamp': {'$gt': timestamp}},
+        {'timestamp': timestamp, '_id': {'$gt': object_id}}
+    ]}
+    return {'$and': [query, keyset]} if query else keyset
+
+
+def parse_int_param(args, name, default):
+    """Integer query parameter with a default; ValueError if malformed"""
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+
+
+def parse_range_params(args):
+    """Optional from/to/device query parameters shared by the raw data endpoints"""
+    start = parse_datetime(args['from']) if args.get('from') else None
+    end = parse_datetime(args['to']) if args.get('to') else None
+    if start is not None and end is not None and start >= end:
+        raise ValueError("'from' must be before 'to'")
+    return start, end, args.get('device')
+
+
+def parse_history_params(args, max_points):
+    """Validated /telemetry/history query parameters; raises ValueError"""
+    end = parse_datetime(args['to']) if args.get('to') else datetime.utcnow()
+    try:
+        start = parse_datetime(args['from']) if args.get('from') else end - timedelta(hours=24)
+    except OverflowError:
+        raise ValueError("'to' is out of range")
+    limit = min(parse_int_param(args, 'limit', max_points), max_points)
+    if limit <= 0:
+        raise ValueError("'limit' must be positive")
+    if start >= end:
+        raise ValueError("'from' must be before 'to'")
+
+    bucket = args.get('bucket') or choose_bucket(start, end, limit)
+    agg = args.get('agg', 'avg')
+    response_format = args.get('format', 'rows')
+    if bucket is None:
+        raise ValueError(f"The range needs more than {limit} buckets even at 1d; shorten it")
+    if bucket not in BUCKET_SIZES:
+        raise ValueError(f"Invalid bucket '{bucket}' (use one of {', '.join(BUCKET_SIZES)})")
+    if bucket_count(start, end, BUCKET_SIZES[bucket]) > limit:
+        smallest = choose_bucket(start, end, limit)
+        hint = f"use bucket={smallest} or larger" if smallest else "shorten it"
+        raise ValueError(f"The range needs more than {limit} '{bucket}' buckets; {hint}")
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Invalid agg '{agg}' (use one of {', '.join(AGGREGATIONS)})")
+    if response_format not in HISTORY_FORMATS:
+        raise ValueError(f"Invalid format '{response_format}' (use one of {', '.join(HISTORY_FORMATS)})")
+
+    return {
+        'start': start,
+        'end': end,
+        'limit': limit,
+        'bucket': bucket,
+        'agg': agg,
+        'device': args.get('device'),
+        'format': response_format
+    }
+
+
+def csv_line(values):
+    """One CSV-encoded line"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def csv_lines(rows):
+    """Encode export rows as CSV: the header, then one line per row"""
+    yield csv_line(EXPORT_FIELDS)
+    for row in rows:
+        yield csv_line([row[field] for field in EXPORT_FIELDS])
+
+
+def generate_test_telemetry():
+    """Generate test telemetry data"""
+    return {
+        'temp': {
+            'value': round(random.uniform(20.0, 35.0), 1),
+            'unit': 'C'
+        },
+        'humid': {
+            'value': round(random.uniform(30.0, 80.0), 1),
+            'unit': '%'
+        },
+        'light': {
+            'value': round(random.uniform(100.0, 1000.0), 1),
+            'unit': 'lux'
+        }
+    }
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from collections import deque
+from services.spool import insert_once
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    """Raised when the write-behind queue cannot accept more readings"""
+
+
+class WriteBehindBuffer:
+    """Bounded in-process queue that flushes readings with unordered insert_many.
+
+    A flush is triggered when `batch_size` documents are waiting or the oldest
+    queued document is older than `max_age` seconds, whichever comes first.
+    A batch that fails because the database is unreachable goes back to the
+    head of the queue and is retried up to `max_retries` times, `retry_delay`
+    seconds apart, before it is counted as failed. A duplicate-key error on a
+    retry means an earlier attempt stored the document, so it counts as
+    written; when `check_stored()` is true (a time-series collection, which
+    has no unique _id) a retry skips the documents already stored instead.
+    `on_written`, if given, is called from the flusher with the
+    documents each batch actually stored, and `on_dropped` with a batch given
+    up on after its retries.
+    """
+
+    def __init__(self, collection, max_queue=10000, batch_size=500, max_age=1.0,
+                 max_retries=5, retry_delay=1.0, on_written=None, on_dropped=None, check_stored=None):
+        self.collection = collection
+        self.check_stored = check_stored
+        self.on_written = on_written
+        self.on_dropped = on_dropped
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._attempts = 0
+        self._retry_at = 0.0
+
+        self.stats = {
+            "accepted": 0,
+            "flushed": 0,
+            "failed": 0,
+            "batches": 0,
+            "retries": 0,
+            "rejected_full": 0
+        }
+
+    def submit(self, documents):
+        """Queue documents for writing; all of them are accepted or none are"""
+        with self._condition:
+            if self._closed:
+                raise IngestQueueFull("Ingest buffer is shutting down")
+            if len(self._queue) + len(documents) > self.max_queue:
+                self.stats["rejected_full"] += len(documents)
+                raise IngestQueueFull("Ingest queue is full, retry later")
+
+            now = time.monotonic()
+            for document in documents:
+                self._queue.append((now, document))
+            self.stats["accepted"] += len(documents)
+
+            self._ensure_started()
+            self._condition.notify()
+
+    def depth(self):
+        """Number of documents waiting to be written"""
+        with self._condition:
+            return len(self._queue)
+
+    def close(self, timeout=10.0):
+        """Stop accepting readings and flush everything still queued"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join(timeout)
+
+        # Drain anything left if the flusher never started or timed out;
+        # failing batches are retried until they run out of attempts
+        while self.depth():
+            self._wait_for_retry()
+            self._flush_batch()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._flush_due():
+                    self._condition.wait(self._time_until_due())
+                if self._closed:
+                    # close() drains whatever is left
+                    return
+            self._flush_batch()
+
+    def _flush_due(self):
+        if not self._queue:
+            return False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        if len(self._queue) >= self.batch_size:
+            return True
+        return now - self._queue[0][0] >= self.max_age
+
+    def _time_until_due(self):
+        if not self._queue:
+            return None
+        now = time.monotonic()
+        if now < self._retry_at:
+            return self._retry_at - now
+        return max(0.0, self.max_age - (now - self._queue[0][0]))
+
+    def _wait_for_retry(self):
+        delay = self._retry_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _flush_batch(self):
+        """Write up to batch_size queued documents; returns the number taken"""
+        with self._condition:
+            count = min(len(self._queue), self.batch_size)
+            entries = [self._queue.popleft() for _ in range(count)]
+
+        if not entries:
+            return 0
+
+        documents = [document for _, document in entries]
+        retry = self._attempts > 0 and self.check_stored is not None and self.check_stored()
+        try:
+            # Rejected documents are left out; retrying will not help them
+            stored = insert_once(self.collection, documents, check_stored=retry)
+            if len(stored) < len(documents):
+                logger.error("Write-behind flush had %d failed documents", len(documents) - len(stored))
+        except Exception as e:
+            if self._requeue(entries):
+                logger.warning("Write-behind flush failed, will retry: %s", e)
+                return count
+            stored = []
+            logger.error("Write-behind flush failed after %d retries, dropping %d documents: %s", self.max_retries, len(entries), e)
+            if self.on_dropped is not None:
+                try:
+                    self.on_dropped(documents)
+                except Exception as e:
+                    logger.exception("Write-behind on_dropped callback failed: %s", e)
+
+        if stored and self.on_written is not None:
+            try:
+                self.on_written(stored)
+            except Exception as e:
+                logger.exception("Write-behind on_written callback failed: %s", e)
+
+        written = len(stored)
+        with self._condition:
+            self._attempts = 0
+            self._retry_at = 0.0
+            self.stats["batches"] += 1
+            self.stats["flushed"] += written
+            self.stats["failed"] += len(entries) - written
+        return count
+
+    def _requeue(self, entries):
+        """Put a failed batch back at the head of the queue; False once out of retries"""
+        with self._condition:
+            if self._attempts >= self.max_retries:
+                return False
+            self._attempts += 1
+            self._retry_at = time.monotonic() + self.retry_delay
+            self.stats["retries"] += 1
+            self._queue.extendleft(reversed(entries))
+            return True
@@ -1,24 +1,238 @@
+import logging
 import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
+import threading
+import time
+from pymongo import MongoClient, monitoring
+from utils.metrics import mongo_failures, mongo_latency
+
+logger = logging.getLogger(__name__)
+
+
+def database_name():
+    """MONGO_DB_NAME, read when connecting so a .env loaded by the entry point applies"""
+    return os.getenv('MONGO_DB_NAME', 'iot_database')
+
+
+def client_options():
+    """MongoClient keyword arguments from the MONGO_* environment variables"""
+    options = {
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+        'maxIdleTimeMS': int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000')),
+        'waitQueueTimeoutMS': int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        'socketTimeoutMS': int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+    }
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need their optional packages
+    compressors = os.getenv('MONGO_COMPRESSORS', '')
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters collected from pymongo's monitoring events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failures": 0,
+            "pool_clears": 0
+        }
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self.counts)
+        counts["open"] = counts["created"] - counts["closed"]
+        counts["in_use"] = counts["checked_out"] - counts["checked_in"]
+        return counts
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._count("checked_out")
+
+    def connection_checked_in(self, event):
+        self._count("checked_in")
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Feeds the latency of every MongoDB command into the metrics registry"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+        mongo_failures.inc(event.command_name)
+
+
+command_timer = CommandTimer()
+
+
+class SharedClient:
+    """One lazily created client per process, rebuilt in forked children.
+
+    Nothing connects until the first database operation, so importing the app
+    never needs a reachable server. A pre-fork client is dropped in the child
+    (not closed, since its sockets belong to the parent).
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.pool_stats = PoolStats()
+        self.error = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The shared client, or None if MONGO_URI is unusable"""
+        with self._lock:
+            if self._client is None and self.error is None:
+                try:
+                    self._client = self.factory(
+                        os.getenv('MONGO_URI', ''), connect=False,
+                        event_listeners=[self.pool_stats, command_timer], **client_options()
+                    )
+                except Exception as e:
+                    # A bad URI will not fix itself; remember it instead of retrying per request
+                    self.error = str(e)
+                    logger.error("Error connecting to MongoDB: %s", e)
+            return self._client
+
+    def database(self):
+        client = self.get()
+        return client[database_name()] if client is not None else None
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    def reset_after_fork(self):
+        self._client = None
+        self.error = None
+        self._lock = threading.Lock()
+        self.pool_stats = PoolStats()
+
+
+def _motor_client(*args, **kwargs):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(*args, **kwargs)
+
+
+shared_client = SharedClient(MongoClient)
+shared_async_client = SharedClient(_motor_client)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=shared_client.reset_after_fork)
+    os.register_at_fork(after_in_child=shared_async_client.reset_after_fork)
+
+
+def get_database():
+    """Process-wide sync database handle; None if MONGO_URI is unusable"""
+    return shared_client.database()
+
+
+def get_async_database():
+    """Process-wide motor database handle; create it from inside the event loop"""
+    return shared_async_client.database()
+
+
+def is_timeseries(db, collection_name):
+    """True if the collection exists and is a native time-series collection"""
+    for info in db.list_collections(filter={"name": collection_name}):
+        return info.get("type") == "timeseries"
+    return False
+
+
+def readiness(shared, db):
+    """Ping the server and report pool stats; returns (ready, report)"""
+    report = {"pool": shared.pool_stats.snapshot(), "options": client_options()}
+    if db is None:
+        report["error"] = shared.error or "MongoDB is not configured"
+        return False, report
+    try:
+        started = time.perf_counter()
+        db.command('ping')
+        report["ping_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return True, report
+    except Exception as e:
+        report["error"] = str(e)
+        return False, report
+
+
+async def async_readiness(shared, db):
+    """readiness() for a motor database"""
+    report = {"pool": shared.pool_stats.snapshot(), "options": client_options()}
+    if db is None:
+        report["error"] = shared.error or "MongoDB is not configured"
+        return False, report
+    try:
+        started = time.perf_counter()
+        await db.command('ping')
+        report["ping_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return True, report
+    except Exception as e:
+        report["error"] = str(e)
+        return False, report
 
-load_dotenv()
 
 class MongoDBConnection:
+    """Dedicated client for one-off scripts such as migrations and backfills"""
+
     def __init__(self):
         self.mongo_uri = os.getenv('MONGO_URI', '')
         self.client = None
         self.db = None
-    
+
     def connect(self):
         try:
-            self.client = MongoClient(self.mongo_uri)
-            self.db = self.client['iot_database']  # Change database name as needed
+            self.client = MongoClient(self.mongo_uri, **client_options())
+            self.db = self.client[database_name()]
             return self.db
         except Exception as e:
-            print(f"Error connecting to MongoDB: {e}")
+            logger.error("Error connecting to MongoDB: %s", e)
             return None
-    
+
     def close(self):
         if self.client:
-            self.client.close()
\ No newline at end of file
+            self.client.close()
@@ -1,3 +1,8 @@
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
 def format_json_response(data, status_code=200):
     return {
         "status": status_code,
@@ -5,13 +10,28 @@ def format_json_response(data, status_code=200):
     }
 
 def log_request(request):
-    print(f"Request received: {request.method} {request.path} with body: {request.json}")
+    """Debug-level request log; the body is only read when debug logging is on"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request received: %s %s", request.method, request.path, extra={"body": request.get_json(silent=True)})
 
-def validate_json(schema, json_data):
-    from jsonschema import validate, ValidationError
+
+def parse_datetime(value):
+    """Parse an ISO 8601 string or epoch seconds into a naive UTC datetime"""
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    if seconds is not None:
+        try:
+            return datetime.utcfromtimestamp(seconds)
+        except (OverflowError, OSError, ValueError):
+            # inf, nan, or a year outside what datetime (or the platform) supports
+            raise ValueError(f"Timestamp '{value}' is out of range")
     try:
-        validate(instance=json_data, schema=schema)
-        return True
-    except ValidationError as e:
-        print(f"JSON validation error: {e.message}")
-        return False
\ No newline at end of file
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}' (use ISO 8601 or epoch seconds)")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import date, datetime
+from bson import ObjectId
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON_BACKEND=json forces the standard library even when orjson is installed
+BACKEND = 'orjson' if orjson is not None and os.getenv('JSON_BACKEND', 'orjson') == 'orjson' else 'json'
+
+
+def default(value):
+    """Encode the non-JSON types our documents carry; datetimes use isoformat()"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if BACKEND == 'orjson':
+    # orjson writes naive datetimes exactly like isoformat(), so output matches the fallback
+    def dumps_bytes(value):
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(value):
+        return dumps_bytes(value).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(value):
+        return json.dumps(value, default=default, separators=(',', ':'))
+
+    def dumps_bytes(value):
+        return dumps(value).encode()
+
+    loads = json.loads
+
+
+class FastJSONEncoder(JSONEncoder):
+    """Flask JSON encoder that always emits compact output through dumps().
+
+    Flask 2.1 has no json_provider_class, but jsonify() encodes through
+    app.json_encoder().encode(), so overriding encode() swaps the backend for
+    every response. Indentation requested by JSONIFY_PRETTYPRINT_REGULAR or
+    debug mode is ignored.
+    """
+
+    def encode(self, value):
+        return dumps(value)
+
+
+def init_app(app):
+    """Use the fast encoder for jsonify() and turn off pretty-printing and key sorting"""
+    app.json_encoder = FastJSONEncoder
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    app.config['JSON_SORT_KEYS'] = False
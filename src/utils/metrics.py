@@ -0,0 +1,179 @@
+import bisect
+import threading
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second RPC waits
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of samples keyed by label values"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Metric):
+    """A gauge read from a callback at scrape time, so hot paths never update it"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._callbacks = {}
+
+    def set_function(self, function, *labels):
+        """Report function() for these label values; a None result is skipped"""
+        with self._lock:
+            self._callbacks[labels] = function
+
+    def render(self):
+        with self._lock:
+            callbacks = sorted(self._callbacks.items(), key=lambda item: item[0])
+        lines = self.header()
+        for labels, function in callbacks:
+            try:
+                value = function()
+            except Exception:
+                value = None
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            return sum(series[0]) if series else 0
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(series[0]), series[1])) for labels, series in self._values.items())
+        lines = self.header()
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                extra = (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, extra)} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Process-local metrics rendered in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._get(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter('http_requests_total', 'HTTP requests handled', ('method', 'route', 'status'))
+http_errors = registry.counter('http_request_errors_total', 'HTTP requests answered with a 5xx status', ('method', 'route'))
+http_latency = registry.histogram('http_request_duration_seconds', 'HTTP request latency', ('method', 'route'))
+
+mongo_latency = registry.histogram('mongo_command_duration_seconds', 'MongoDB command latency', ('command',))
+mongo_failures = registry.counter('mongo_command_failures_total', 'MongoDB commands that failed', ('command',))
+
+mqtt_connect_latency = registry.histogram('mqtt_connect_duration_seconds', 'Time from connect to CONNACK', ())
+mqtt_publish_latency = registry.histogram('mqtt_publish_duration_seconds', 'Time from publish to PUBACK', ())
+mqtt_rpc_latency = registry.histogram('mqtt_rpc_duration_seconds', 'Time from RPC request to device response', ())
+alerts_fired = registry.counter('alerts_fired_total', 'Alerts fired by rule', ('rule',))
+rpc_commands = registry.counter('rpc_commands_total', 'Coalesced RPC commands by outcome', ('method', 'outcome'))
+
+admission_denied = registry.counter('admission_denied_total', 'Ingest requests rejected by rate limits', ('scope',))
+duplicates_dropped = registry.counter('ingest_duplicates_dropped_total', 'Readings dropped as duplicates')
+
+app_startup = registry.gauge('app_startup_seconds', 'Time spent importing and creating the app', ('app', 'phase'))
+queue_depth = registry.gauge('ingest_queue_depth', 'Readings waiting to be written', ('queue',))
+spool_oldest_age = registry.gauge('spool_oldest_age_seconds', 'Age of the oldest unreplayed spooled reading')
+spool_replay_rate = registry.gauge('spool_replay_per_second', 'Readings replayed from the spool per second')
@@ -0,0 +1,56 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread in the process at a fixed interval.
+
+    The result is in the folded format ("frame;frame;frame count" per line)
+    read by flamegraph.pl, speedscope and similar tools. Only one capture runs
+    at a time, and nothing is sampled outside a capture.
+    """
+
+    def __init__(self, interval=0.005, max_seconds=60.0):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    def capture(self, seconds):
+        """Sample for `seconds` and return the folded stacks; None if a capture is already running"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._sample(min(seconds, self.max_seconds))
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds):
+        stacks = collections.Counter()
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    stacks[self._fold(frame)] += 1
+            time.sleep(self.interval)
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+def profiler_enabled():
+    """The profiling endpoint is opt-in: PROFILER_ENABLED=true"""
+    return os.getenv('PROFILER_ENABLED', 'false').lower() in ['true', '1', 'yes', 'on']
+
+
+profiler = SamplingProfiler(interval=float(os.getenv('PROFILER_INTERVAL', '0.005')))
@@ -1 +1,5 @@
-# This file is intentionally left blank.
\ No newline at end of file
+import os
+import sys
+
+# Application modules import each other relative to src/ (as when running src/main.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
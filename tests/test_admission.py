@@ -0,0 +1,96 @@
+import threading
+import unittest
+from unittest import mock
+import mongomock
+from flask import Flask
+from starlette.testclient import TestClient
+import asgi
+from config import TestingConfig
+from controllers.data_controller import DataController
+from routes import api_routes
+from services.admission import AdmissionControl, Deduplicator, TokenBuckets, client_key
+from tests.test_ingest import VALID_READING
+
+class TestTokenBuckets(unittest.TestCase):
+    def test_burst_then_retry_after(self):
+        buckets = TokenBuckets(rate=2, burst=3)
+        self.assertEqual([buckets.acquire('a')[0] for _ in range(4)], [True, True, True, False])
+        allowed, retry_after = buckets.acquire('a')
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5, delta=0.05)
+        self.assertTrue(buckets.acquire('b')[0])
+
+    def test_batch_is_charged_per_device(self):
+        admission = AdmissionControl(device_buckets=TokenBuckets(rate=1, burst=2))
+        other = dict(VALID_READING, localIp='10.0.0.2')
+        admission.admit(None, [VALID_READING, VALID_READING, other])
+        with self.assertRaisesRegex(Exception, VALID_READING['localIp']):
+            admission.admit(None, [VALID_READING])
+        self.assertEqual(admission.stats['denied_device'], 1)
+
+    def test_backend_errors_admit(self):
+        buckets = mock.Mock(shared=True)
+        buckets.acquire.side_effect = ConnectionError("redis down")
+        admission = AdmissionControl(token_buckets=buckets)
+        admission.admit('token:x', VALID_READING)
+        self.assertEqual(admission.stats['backend_errors'], 1)
+
+class TestRateLimitedRoutes(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient()['iot_database']
+        self.admission = AdmissionControl(token_buckets=TokenBuckets(rate=0.5, burst=2))
+
+    def test_flask_returns_429_with_retry_after(self):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer device-token'}
+        with mock.patch.object(api_routes, 'data_controller', DataController(db=self.db)), \
+                mock.patch.object(api_routes, 'admission', self.admission):
+            self.assertEqual(client.post('/data/batch', json=[VALID_READING, VALID_READING], headers=headers).status_code, 200)
+            response = client.post('/data', json=VALID_READING, headers=headers)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '2')
+            # A different token has its own budget
+            self.assertEqual(client.post('/data', json=VALID_READING, headers={'Authorization': 'other'}).status_code, 200)
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 3)
+
+    def test_asgi_returns_429(self):
+        client = TestClient(asgi.create_app(TestingConfig))
+        with mock.patch.object(asgi, 'admission', self.admission):
+            self.admission.token_buckets.acquire(client_key(None, 'testclient'), 2)
+            response = client.post('/data', json=VALID_READING)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['retry-after'], '2')
+
+class TestDeduplication(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient()['iot_database']
+        self.controller = DataController(db=self.db, deduplicator=Deduplicator(window=60))
+
+    def test_identical_reading_is_dropped(self):
+        self.assertEqual(self.controller.receive_data(dict(VALID_READING))['status'], 'success')
+        response = self.controller.receive_data(dict(VALID_READING))
+        self.assertTrue(response['duplicate'])
+        self.controller.receive_data(dict(VALID_READING, temperature=26.0))
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 2)
+
+    def test_batch_reports_duplicates(self):
+        response = self.controller.receive_batch([VALID_READING, VALID_READING, dict(VALID_READING, localIp='10.0.0.2')])
+        self.assertEqual((response['accepted'], response['duplicates']), (2, 1))
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 2)
+
+    def test_dropped_counts_duplicates_across_shards(self):
+        deduplicator = Deduplicator(window=60)
+        def feed(worker):
+            for i in range(500):
+                deduplicator.is_duplicate(dict(VALID_READING, localIp=f"10.{worker}.0.{i % 50}"))
+        threads = [threading.Thread(target=feed, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(deduplicator.dropped, 8 * 450)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import threading
+import unittest
+from unittest import mock
+import mongomock
+from controllers.data_controller import DataController
+from services.alerts import AlertEngine, RollingMean, Rule
+from tests.test_ingest import VALID_READING
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def reading(**values):
+    return dict(VALID_READING, **values)
+
+class TestAlertEngine(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def engine(self, *rules, **kwargs):
+        return AlertEngine([Rule.from_dict(rule) for rule in rules], clock=self.clock, **kwargs)
+
+    def test_threshold_must_hold_for_duration(self):
+        engine = self.engine({"name": "hot", "field": "temperature", "op": ">", "value": 35, "for": 300})
+        for offset, temperature in [(0, 36), (200, 37), (300, 36), (400, 38)]:
+            self.clock.now = 1000 + offset
+            engine.evaluate(reading(temperature=temperature))
+        self.assertEqual(engine.stats["fired"], 1)
+        self.assertEqual([alert["rule"] for alert in engine.active()], ["hot"])
+
+        engine.evaluate(reading(temperature=30))
+        self.assertEqual((engine.stats["resolved"], engine.active()), (1, []))
+
+    def test_drop_against_rolling_mean(self):
+        engine = self.engine({"name": "dark", "field": "light", "op": "<", "value": 0.2, "kind": "mean_ratio", "window": 3600})
+        for _ in range(10):
+            self.clock.now += 60
+            engine.evaluate(reading(light=500.0))
+        engine.evaluate(reading(light=120.0))
+        self.assertEqual(engine.stats["fired"], 0)
+        engine.evaluate(reading(light=50.0))
+        self.assertEqual(engine.stats["fired"], 1)
+
+    def test_zscore_and_per_device_state(self):
+        engine = self.engine({"name": "spike", "field": "rssi", "op": "<", "value": -3, "kind": "zscore", "alpha": 0.2})
+        for i in range(20):
+            engine.evaluate(reading(rssi=-45 + i % 3))
+        engine.evaluate(reading(rssi=-88, localIp='10.0.0.2'))
+        self.assertEqual(engine.stats["fired"], 0)
+        engine.evaluate(reading(rssi=-88))
+        self.assertEqual(engine.active()[0]["device"], VALID_READING["localIp"])
+
+    def test_rpc_action_runs_off_the_ingest_thread(self):
+        rpc = mock.Mock()
+        engine = self.engine({
+            "name": "weak", "field": "rssi", "op": "<", "value": -85,
+            "actions": [{"type": "rpc", "method": "setValueButtonLED", "params": True}]
+        }, rpc=rpc)
+        engine.evaluate(reading(rssi=-90))
+        engine.wait_for_actions()
+        rpc.assert_called_once_with(VALID_READING["localIp"], "setValueButtonLED", True)
+
+    def test_stats_count_every_reading_across_shards(self):
+        engine = self.engine({"name": "hot", "field": "temperature", "op": ">", "value": 35})
+        def feed(worker):
+            for i in range(500):
+                engine.evaluate(reading(temperature=20, localIp=f"10.{worker}.0.{i % 50}"))
+        threads = [threading.Thread(target=feed, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(engine.stats["evaluated"], 4000)
+
+    def test_rolling_mean_forgets_old_slots(self):
+        window = RollingMean(60, slots=6)
+        window.add(10.0, 0)
+        window.add(20.0, 30)
+        self.assertEqual(window.mean(59), 15.0)
+        self.assertEqual(window.mean(65), 20.0)
+        self.assertIsNone(window.mean(500))
+
+    def test_invalid_rule_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Rule.from_dict({"name": "bad", "field": "pressure", "op": ">", "value": 1})
+
+class TestIngestAlerts(unittest.TestCase):
+    def test_stored_readings_are_evaluated(self):
+        db = mongomock.MongoClient()['iot_database']
+        alerts = AlertEngine([Rule.from_dict({
+            "name": "hot", "field": "temperature", "op": ">", "value": 35, "actions": [{"type": "store"}]
+        })], database=lambda: db)
+        controller = DataController(db=db, alerts=alerts)
+        controller.receive_batch([reading(temperature=36), reading(temperature=20, localIp='10.0.0.2')])
+        alerts.wait_for_actions()
+        stored = db['alerts'].find_one()
+        self.assertEqual((stored["rule"], stored["device"], stored["value"]), ("hot", VALID_READING["localIp"], 36))
+
+if __name__ == '__main__':
+    unittest.main()
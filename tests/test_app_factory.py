@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import unittest
+from starlette.testclient import TestClient
+import asgi
+import main
+from config import TestingConfig
+from routes import api_routes
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+class TestAppFactory(unittest.TestCase):
+    def test_import_builds_nothing(self):
+        # A fresh interpreter, since this one has already imported everything
+        script = (
+            "import sys, asgi, routes.api_routes as r; "
+            "print(asgi.data_controller, r.data_controller, 'app' in vars(asgi), 'paho.mqtt.client' in sys.modules)"
+        )
+        output = subprocess.run([sys.executable, '-c', script], cwd=SRC, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['None', 'None', 'False', 'False'])
+
+    def test_importing_the_flask_app_builds_nothing(self):
+        script = (
+            "import sys, main, routes.api_routes as r; "
+            "print(r.data_controller, r.led_controller, r.device_controller, 'app' in vars(main), 'paho.mqtt.client' in sys.modules)"
+        )
+        output = subprocess.run([sys.executable, '-c', script], cwd=SRC, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['None', 'None', 'None', 'False', 'False'])
+
+    def test_flask_create_app_builds_controllers_and_reports_startup(self):
+        app = main.create_app(TestingConfig)
+        self.assertTrue(app.testing)
+        self.assertIsNotNone(api_routes.data_controller)
+        self.assertIsNotNone(api_routes.device_controller)
+
+        response = app.test_client().get('/metrics', headers={'Origin': 'http://localhost:5173'})
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], 'http://localhost:5173')
+        metrics = response.get_data(as_text=True)
+        self.assertIn('app_startup_seconds{app="wsgi",phase="import"}', metrics)
+        self.assertIn('app_startup_seconds{app="wsgi",phase="create_app"}', metrics)
+
+    def test_create_app_builds_controllers_and_reports_startup(self):
+        client = TestClient(asgi.create_app(TestingConfig))
+        self.assertIsNotNone(asgi.data_controller)
+        self.assertIsNotNone(asgi.device_controller)
+        metrics = client.get('/metrics').text
+        self.assertIn('app_startup_seconds{app="asgi",phase="import"}', metrics)
+        self.assertIn('app_startup_seconds{app="asgi",phase="create_app"}', metrics)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+from mongomock_motor import AsyncMongoMockClient
+from starlette.testclient import TestClient
+import asgi
+from config import TestingConfig
+from controllers.async_data_controller import AsyncDataController
+from services.telemetry_hub import TelemetryHub
+
+READING = {
+    "temperature": 25.5,
+    "humidity": 60.2,
+    "light": 450.0,
+    "lightPercentage": 75.0,
+    "rssi": -45,
+    "localIp": "192.168.1.100"
+}
+
+class TestASGIApp(unittest.TestCase):
+    def setUp(self):
+        controller = AsyncDataController(db=AsyncMongoMockClient()['iot_database'], hub=TelemetryHub())
+        patcher = mock.patch.object(asgi, 'data_controller', controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(asgi.create_app(TestingConfig))
+
+    def test_ingest_and_latest_match_wsgi_shapes(self):
+        response = self.client.post('/data', json=READING).json()
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['message'], 'Data saved successfully')
+
+        response = self.client.get('/telemetry')
+        body = response.json()
+        self.assertEqual(body['source'], 'database')
+        self.assertEqual(body['data']['temp'], {'value': 25.5, 'unit': 'C'})
+
+        etag = response.headers['etag']
+        self.assertEqual(self.client.get('/telemetry', headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_batch_history_and_records(self):
+        response = self.client.post('/data/batch', json=[READING, {"temperature": 1}]).json()
+        self.assertEqual(response['status'], 'partial')
+        self.assertEqual(response['errors'][0]['index'], 1)
+
+        history = self.client.get('/telemetry/history?bucket=1h').json()
+        self.assertEqual(history['status'], 'success')
+        self.assertEqual(history['data'][0]['count'], 1)
+
+        records = self.client.get('/telemetry/records?limit=10').json()
+        self.assertEqual(records['count'], 1)
+        self.assertIsNone(records['next_cursor'])
+
+        self.assertEqual(self.client.get('/telemetry/history?agg=median').status_code, 400)
+
+    def test_export_ndjson(self):
+        self.client.post('/data/batch', json=[READING, READING])
+        response = self.client.get('/telemetry/export')
+        self.assertEqual(len(response.text.splitlines()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,26 @@
 import unittest
-from src.controllers.data_controller import DataController
+import mongomock
+from controllers.data_controller import DataController
+from tests.test_ingest import VALID_READING
 
 class TestDataController(unittest.TestCase):
     def setUp(self):
-        self.controller = DataController()
+        self.db = mongomock.MongoClient()['iot_database']
+        self.controller = DataController(db=self.db)
 
     def test_receive_data_valid(self):
-        json_data = {"key": "value"}
-        response = self.controller.receive_data(json_data)
+        response = self.controller.receive_data(VALID_READING)
         self.assertEqual(response['status'], 'success')
-        self.assertEqual(response['data'], json_data)
+        stored = self.db['sensor_data'].find_one()
+        self.assertEqual(str(stored['_id']), response['id'])
+        self.assertEqual(stored['temperature'], VALID_READING['temperature'])
 
     def test_receive_data_invalid(self):
         json_data = {"invalid_key": "value"}
         response = self.controller.receive_data(json_data)
         self.assertEqual(response['status'], 'error')
-        self.assertIn('message', response)
\ No newline at end of file
+        self.assertIn('message', response)
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 0)
+
+if __name__ == '__main__':
+    unittest.main()
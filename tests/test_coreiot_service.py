@@ -0,0 +1,217 @@
+import json
+import os
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+from types import SimpleNamespace
+from services.mqtt_pool import MQTTConnectionPool
+from services.coreiot_service import CoreIOTService
+from services.rpc_client import RPCTimeoutError
+from controllers.led_controller import LEDController
+from services.command_queue import CommandCoalescer
+
+class FakeMessageInfo:
+    def __init__(self, acked, mid=0):
+        self.rc = 0
+        self.mid = mid
+        self.acked = acked
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self.acked
+
+class FakeClient:
+    """Stand-in for paho's Client that 'connects' as soon as its loop starts.
+
+    With `respond` set, every RPC request is answered by `respond(params)`.
+    """
+    instances = []
+
+    def __init__(self, accept=True, ack=True, respond=None):
+        self.accept = accept
+        self.ack = ack
+        self.respond = respond
+        self.published = []
+        self.subscriptions = []
+        self.loop_starts = 0
+        FakeClient.instances.append(self)
+
+    def username_pw_set(self, username, password=None):
+        self.username = username
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        self.address = (host, port)
+
+    def loop_start(self):
+        self.loop_starts += 1
+        self.on_connect(self, None, {}, 0 if self.accept else 5)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.on_disconnect(self, None, 0)
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append(topic)
+
+    def publish(self, topic, payload, qos=0):
+        body = json.loads(payload)
+        self.published.append((topic, body, qos))
+        if self.respond is not None:
+            self.deliver(topic.replace('/request/', '/response/'), self.respond(body['params']))
+        return FakeMessageInfo(self.ack)
+
+    def deliver(self, topic, body):
+        self.on_message(self, None, SimpleNamespace(topic=topic, payload=json.dumps(body).encode()))
+
+class TestCoreIOTService(unittest.TestCase):
+    def setUp(self):
+        FakeClient.instances = []
+
+    def test_commands_reuse_one_connection_per_token(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=lambda: FakeClient(respond=lambda p: p))
+        service = CoreIOTService("token-a", pool=pool)
+
+        self.assertEqual(service.send_led_command(True).result(timeout=1), True)
+        self.assertEqual(service.send_led_command(False).result(timeout=1), False)
+
+        self.assertEqual(len(FakeClient.instances), 1)
+        client = FakeClient.instances[0]
+        self.assertEqual(client.loop_starts, 1)
+        self.assertEqual(client.subscriptions, ["v1/devices/me/rpc/response/+"])
+        self.assertEqual(service.connection_stats()["pool"]["published"], 2)
+
+    def test_health_does_not_open_a_connection(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=FakeClient)
+        service = CoreIOTService("token-a", pool=pool)
+        stats = service.connection_stats()
+        self.assertEqual(stats["connection"], {"state": "not started"})
+        self.assertEqual(stats["pool"]["connections"], 0)
+        self.assertEqual(FakeClient.instances, [])
+
+    def test_concurrent_requests_are_correlated_by_id(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=FakeClient)
+        service = CoreIOTService("token-a", pool=pool)
+
+        first = service.call_rpc("getValue", "a")
+        second = service.call_rpc("getValue", "b")
+        client = FakeClient.instances[0]
+        first_topic, second_topic = [message[0] for message in client.published]
+        self.assertNotEqual(first_topic, second_topic)
+
+        # Answer out of order
+        client.deliver(second_topic.replace('/request/', '/response/'), {"value": "B"})
+        client.deliver(first_topic.replace('/request/', '/response/'), {"value": "A"})
+        self.assertEqual(first.result(timeout=1), {"value": "A"})
+        self.assertEqual(second.result(timeout=1), {"value": "B"})
+        self.assertEqual(len(service.pending), 0)
+
+    def test_unanswered_request_times_out(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=FakeClient)
+        service = CoreIOTService("token-a", pool=pool)
+        future = service.call_rpc("setValueButtonLED", True, timeout=0.05)
+        with self.assertRaises(RPCTimeoutError):
+            future.result(timeout=1)
+        self.assertEqual(len(service.pending), 0)
+
+    def test_refused_connection_times_out(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=lambda: FakeClient(accept=False))
+        service = CoreIOTService("token-a", pool=pool)
+        future = service.send_led_command(True, timeout=0.05)
+        with self.assertRaises(RPCTimeoutError):
+            future.result(timeout=1)
+        self.assertEqual(pool.stats()["connected"], 0)
+
+class TestMQTTConnection(unittest.TestCase):
+    def test_publish_waits_for_puback(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=FakeClient)
+        connection = pool.get("token-a")
+        self.assertTrue(connection.publish("topic", json.dumps({"params": 1})))
+        self.assertEqual(connection.health()["published"], 1)
+
+    def test_unacknowledged_publish_fails(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=lambda: FakeClient(ack=False))
+        connection = pool.get("token-a")
+        self.assertFalse(connection.publish("topic", json.dumps({"params": 1})))
+        self.assertEqual(connection.health()["publish_failures"], 1)
+
+    def test_refused_connection_fails_fast(self):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=lambda: FakeClient(accept=False))
+        connection = pool.get("token-a")
+        self.assertFalse(connection.publish("topic", json.dumps({"params": 1}), timeout=0.05))
+        self.assertEqual(pool.stats()["connected"], 0)
+
+class TestLEDController(unittest.TestCase):
+    def controller(self, respond=None, timeout=5.0):
+        pool = MQTTConnectionPool("broker", 1883, client_factory=lambda: FakeClient(respond=respond))
+        return LEDController(coreiot_service=CoreIOTService("token-a", pool=pool, rpc_timeout=timeout))
+
+    def test_returns_state_confirmed_by_device(self):
+        controller = self.controller(respond=lambda params: {"ledState": False})
+        response = controller.set_led_state(True)
+        self.assertEqual(response['status'], 'success')
+        self.assertFalse(response['ledState'])
+        self.assertFalse(controller.get_led_state()['data']['lastLedState'])
+
+    def test_plain_acknowledgement_confirms_requested_state(self):
+        controller = self.controller(respond=lambda params: "success")
+        response = controller.set_led_state("on")
+        self.assertTrue(response['ledState'])
+        self.assertTrue(controller.confirmed_state({'params': 'ok'}, True))
+        self.assertFalse(controller.confirmed_state('off', True))
+
+    def test_unanswered_command_reports_error(self):
+        controller = self.controller(timeout=0.05)
+        response = controller.set_led_state(True)
+        self.assertEqual(response['status'], 'error')
+        self.assertIsNone(controller.last_led_state)
+
+    def test_toggle_flips_confirmed_state(self):
+        controller = self.controller(respond=lambda params: params)
+        self.assertTrue(controller.toggle_led()['ledState'])
+        self.assertFalse(controller.toggle_led()['ledState'])
+        self.assertFalse(controller.last_led_state)
+
+    def test_debounced_toggles_send_only_the_final_state(self):
+        with mock.patch.dict(os.environ, {'LED_DEBOUNCE_WINDOW': '0.05'}):
+            controller = self.controller(respond=lambda params: params)
+        for _ in range(5):
+            response = controller.toggle_led()
+            self.assertFalse(response['confirmed'])
+        self.assertTrue(controller.get_led_state()['data']['desiredLedState'])
+        self.assertTrue(controller.commands.wait_idle(timeout=1))
+
+        client = FakeClient.instances[-1]
+        self.assertEqual([body['params'] for _, body, _ in client.published], [True])
+        self.assertTrue(controller.last_led_state)
+        self.assertEqual(controller.set_led_state(True)['message'], 'LED already ON')
+        self.assertEqual(controller.commands.stats['coalesced'], 4)
+
+class TestCommandCoalescer(unittest.TestCase):
+    def test_value_submitted_in_flight_is_sent_after_it(self):
+        sent = []
+        def send(method, value):
+            sent.append(Future())
+            return sent[-1]
+        commands = CommandCoalescer(send, 0.01)
+
+        commands.submit('setValue', 1)
+        self.assertFalse(commands.wait_idle(timeout=0.05))
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(commands.submit('setValue', 2), 'queued')
+        self.assertEqual(commands.submit('setValue', 3), 'coalesced')
+        sent[0].set_result('ok')
+        self.assertFalse(commands.wait_idle(timeout=0.05))
+        self.assertEqual(len(sent), 2)
+        sent[1].set_result('ok')
+        self.assertTrue(commands.wait_idle(timeout=1))
+        self.assertEqual(commands.confirmed('setValue'), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from models.data_models import telemetry_model
+
+VALID_READING = {
+    "temperature": 25.5,
+    "humidity": 60.2,
+    "light": 450.0,
+    "lightPercentage": 75.0,
+    "rssi": -45,
+    "localIp": "192.168.1.100"
+}
+
+class TestTelemetryModel(unittest.TestCase):
+    def test_valid_reading_keeps_known_fields(self):
+        document, error = telemetry_model.validate(dict(VALID_READING, extra="ignored"))
+        self.assertIsNone(error)
+        self.assertEqual(document, VALID_READING)
+
+    def test_missing_fields_are_listed(self):
+        _, error = telemetry_model.validate({"temperature": 20})
+        self.assertEqual(error, "Missing required fields: humidity, light, lightPercentage, rssi, localIp")
+
+    def test_matches_collection_schema_ranges(self):
+        cases = [
+            ({"humidity": 100.5}, "'humidity' must be at most 100"),
+            ({"light": -1}, "'light' must be at least 0"),
+            ({"lightPercentage": -0.1}, "'lightPercentage' must be at least 0"),
+            ({"temperature": "25"}, "'temperature' must be a finite number"),
+            ({"temperature": True}, "'temperature' must be a finite number"),
+            ({"temperature": float("nan")}, "'temperature' must be a finite number"),
+            ({"temperature": 10 ** 400}, "'temperature' must be a finite number"),
+            ({"rssi": 2 ** 63}, "'rssi' must be a finite number"),
+            ({"localIp": 1}, "'localIp' must be a string")
+        ]
+        for change, message in cases:
+            self.assertEqual(telemetry_model.validate(dict(VALID_READING, **change)), (None, message))
+
+    def test_rejects_non_objects(self):
+        self.assertEqual(telemetry_model.validate([VALID_READING])[1], "Reading must be a JSON object")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+import mongomock
+from flask import Flask
+from controllers.data_controller import DataController
+from routes import api_routes
+from utils.db_connection import SharedClient
+
+class TestSharedClient(unittest.TestCase):
+    def test_lazy_and_shared(self):
+        factory = mock.Mock(return_value=mongomock.MongoClient())
+        shared = SharedClient(factory)
+        factory.assert_not_called()
+
+        self.assertIs(shared.get(), shared.get())
+        self.assertEqual(factory.call_count, 1)
+        self.assertFalse(factory.call_args.kwargs['connect'])
+        self.assertIn('maxPoolSize', factory.call_args.kwargs)
+
+    def test_rebuilt_after_fork(self):
+        factory = mock.Mock(side_effect=lambda *args, **kwargs: mongomock.MongoClient())
+        shared = SharedClient(factory)
+        parent = shared.get()
+        shared.reset_after_fork()
+        self.assertIsNot(shared.get(), parent)
+
+    def test_bad_uri_is_not_retried(self):
+        factory = mock.Mock(side_effect=ValueError("Empty host"))
+        shared = SharedClient(factory)
+        self.assertIsNone(shared.database())
+        self.assertIsNone(shared.database())
+        self.assertEqual(factory.call_count, 1)
+        self.assertEqual(shared.error, "Empty host")
+
+class TestLazyController(unittest.TestCase):
+    def test_construction_does_not_connect(self):
+        with mock.patch.object(DataController, 'connect') as connect:
+            controller = DataController()
+            connect.assert_not_called()
+            controller.receive_data({})
+            connect.assert_called()
+
+class TestHealthRoutes(unittest.TestCase):
+    def client(self, controller):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        patcher = mock.patch.object(api_routes, 'data_controller', controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return app.test_client()
+
+    def test_ready_when_database_answers(self):
+        client = self.client(DataController(db=mongomock.MongoClient()['iot_database']))
+        self.assertEqual(client.get('/health').status_code, 200)
+        response = client.get('/health/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pool', response.get_json()['data'])
+
+    def test_not_ready_without_database(self):
+        controller = DataController()
+        with mock.patch.object(DataController, 'connect', return_value=None):
+            response = self.client(controller).get('/health/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['status'], 'error')
+
+if __name__ == '__main__':
+    unittest.main()
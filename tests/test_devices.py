@@ -0,0 +1,121 @@
+import unittest
+from unittest import mock
+import mongomock
+from flask import Flask
+from controllers.device_controller import DeviceController
+from routes import api_routes
+from services.coreiot_service import CoreIOTService
+from services.device_registry import DeviceRegistry
+from services.mqtt_pool import MQTTConnectionPool
+from tests.test_coreiot_service import FakeClient
+
+class FakeDataController:
+    def get_latest_telemetry_entry(self, device=None):
+        return {"device": device, "temp": 21.5}, "etag-" + str(device)
+
+class TestDevices(unittest.TestCase):
+    def setUp(self):
+        FakeClient.instances = []
+        db = mongomock.MongoClient()['iot_database']
+        self.registry = DeviceRegistry(lambda: db, ttl=60)
+        self.registry.register('kitchen', 'token-a', groups=['downstairs'], local_ip='10.0.0.1')
+        self.registry.register('hall', 'token-b', groups=['downstairs'])
+        self.registry.register('attic', 'token-c', groups=['upstairs'])
+
+        self.pool = MQTTConnectionPool("broker", 1883, client_factory=lambda: self.client_factory())
+        self.controller = DeviceController(
+            FakeDataController(), registry=self.registry,
+            service_factory=lambda token: CoreIOTService(token, pool=self.pool, rpc_timeout=0.2)
+        )
+
+    def client_factory(self):
+        return FakeClient(respond=lambda params: params)
+
+    def test_registry_caches_lookups_and_hides_tokens(self):
+        device = self.registry.get('kitchen')
+        self.assertEqual(device['token'], 'token-a')
+        self.assertEqual([device['_id'] for device in self.registry.group('downstairs')], ['hall', 'kitchen'])
+        self.registry.collection.delete_one({'_id': 'kitchen'})
+        self.assertIs(self.registry.get('kitchen'), device)
+        self.assertEqual(len(self.registry.group('downstairs')), 2)
+
+        listed = self.controller.list_devices()['data']
+        self.assertEqual([device['id'] for device in listed], ['attic', 'hall'])
+        self.assertNotIn('token', listed[0])
+
+    def test_remove_drops_cached_device(self):
+        self.assertIsNotNone(self.registry.get('hall'))
+        self.assertTrue(self.registry.remove('hall'))
+        self.assertIsNone(self.registry.get('hall'))
+        self.assertFalse(self.registry.remove('hall'))
+
+    def test_led_controllers_are_bounded(self):
+        controller = DeviceController(FakeDataController(), registry=self.registry, service_factory=lambda token: CoreIOTService(token, pool=self.pool), max_leds=2)
+        kitchen = controller.led_controller(self.registry.get('kitchen'))
+        controller.led_controller(self.registry.get('hall'))
+        # Using kitchen again makes hall the least recently used
+        self.assertIs(controller.led_controller(self.registry.get('kitchen')), kitchen)
+        controller.led_controller(self.registry.get('attic'))
+        self.assertEqual(list(controller._leds), ['kitchen', 'attic'])
+
+    def test_evicted_controllers_reuse_one_service_per_token(self):
+        controller = DeviceController(FakeDataController(), registry=self.registry, service_factory=lambda token: CoreIOTService(token, pool=self.pool, rpc_timeout=0.2), max_leds=2)
+        for _ in range(50):
+            for device_id in ('kitchen', 'hall', 'attic'):
+                controller.set_device_led(device_id, 'on')
+        for token in ('token-a', 'token-b', 'token-c'):
+            self.assertEqual(len(self.pool.peek(token)._message_handlers), 1)
+
+        # A replaced token's service is closed along with its pooled connection
+        self.registry.register('kitchen', 'token-d', groups=['downstairs'], local_ip='10.0.0.1')
+        self.assertEqual(controller.set_device_led('kitchen', 'off')['status'], 'success')
+        self.assertIsNone(self.pool.peek('token-a'))
+        self.assertEqual(self.pool.stats()['connections'], 3)
+
+    def test_device_telemetry_uses_local_ip(self):
+        response, etag = self.controller.get_device_telemetry('kitchen')
+        self.assertEqual(response['data']['device'], '10.0.0.1')
+        self.assertEqual(etag, 'etag-10.0.0.1')
+        response, etag = self.controller.get_device_telemetry('garage')
+        self.assertTrue(self.controller.is_not_found(response))
+        self.assertIsNone(etag)
+
+    def test_group_command_reports_each_device(self):
+        result = self.controller.set_group_led('downstairs', 'on')
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['confirmed'], 2)
+        self.assertEqual(set(result['results']), {'kitchen', 'hall'})
+        # One pooled connection per token, each carrying its own command
+        self.assertEqual(len(FakeClient.instances), 2)
+        self.assertEqual(self.controller.get_device_led('hall')['data']['lastLedState'], True)
+        self.assertIsNone(self.controller.get_device_led('attic')['data']['lastLedState'])
+
+    def test_group_command_partial_failure(self):
+        # The attic device joins the group but never answers, so its command times out
+        self.registry.register('attic', 'token-c', groups=['downstairs'])
+        silent = FakeClient()
+        with mock.patch.object(self, 'client_factory', side_effect=[silent, FakeClient(respond=lambda p: p), FakeClient(respond=lambda p: p)]):
+            result = self.controller.set_group_led('downstairs', False)
+        self.assertEqual(result['status'], 'partial')
+        self.assertEqual((result['confirmed'], result['failed']), (2, 1))
+        self.assertEqual(result['results']['attic']['status'], 'error')
+
+    def test_routes(self):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        with mock.patch.object(api_routes, 'device_controller', self.controller):
+            client = app.test_client()
+            self.assertEqual(client.get('/devices/garage/telemetry').status_code, 404)
+            self.assertEqual(client.post('/devices/garage/led', json={'state': 'on'}).status_code, 404)
+            self.assertEqual(client.post('/devices/kitchen/led', json={}).status_code, 400)
+
+            response = client.get('/devices/kitchen/telemetry')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(client.get('/devices/kitchen/telemetry', headers={'If-None-Match': response.headers['ETag']}).status_code, 304)
+
+            response = client.post('/devices/kitchen/led', json={'state': 'off'})
+            self.assertEqual(response.get_json()['ledState'], False)
+            self.assertEqual(client.post('/devices/groups/upstairs/led', json={'state': 1}).get_json()['confirmed'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
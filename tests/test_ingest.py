@@ -0,0 +1,190 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+import mongomock
+from flask import Flask
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from controllers.data_controller import DataController
+from routes import api_routes
+from services.write_buffer import WriteBehindBuffer, IngestQueueFull
+
+VALID_READING = {
+    "temperature": 25.5,
+    "humidity": 60.2,
+    "light": 450.0,
+    "lightPercentage": 75.0,
+    "rssi": -45,
+    "localIp": "192.168.1.100"
+}
+
+class FakeCollection:
+    def __init__(self, failures=0):
+        self.documents = []
+        self.calls = 0
+        self.failures = failures
+
+    def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionFailure("database unreachable")
+        self.documents.extend(documents)
+
+class TestBatchIngest(unittest.TestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.controller = DataController(db={'sensor_data': self.collection})
+
+    def test_receive_batch_valid(self):
+        response = self.controller.receive_batch([VALID_READING, VALID_READING])
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['accepted'], 2)
+        self.assertEqual(len(self.collection.documents), 2)
+        self.assertEqual(self.collection.calls, 1)
+
+    def test_receive_batch_reports_item_errors(self):
+        invalid = dict(VALID_READING, humidity=None)
+        response = self.controller.receive_batch([VALID_READING, invalid, "not an object"])
+        self.assertEqual(response['status'], 'partial')
+        self.assertEqual(response['accepted'], 1)
+        self.assertEqual([error['index'] for error in response['errors']], [1, 2])
+
+    def test_receive_batch_requires_array(self):
+        response = self.controller.receive_batch(VALID_READING)
+        self.assertEqual(response['status'], 'error')
+
+class TestIngestRoutes(unittest.TestCase):
+    def client(self, controller):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        patcher = mock.patch.object(api_routes, 'data_controller', controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return app.test_client()
+
+    def test_batch_route(self):
+        collection = FakeCollection()
+        client = self.client(DataController(db={'sensor_data': collection}))
+        response = client.post('/data/batch', json=[VALID_READING, {}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'partial')
+        self.assertEqual(len(collection.documents), 1)
+
+    def test_oversized_numbers_are_validation_errors(self):
+        collection = FakeCollection()
+        client = self.client(DataController(db={'sensor_data': collection}))
+        # Sent as text, since the test client would encode the body with orjson, which has no big ints
+        response = client.post('/data', data=json.dumps(dict(VALID_READING, temperature=10 ** 400)), content_type='application/json')
+        self.assertEqual(response.get_json()['message'], "'temperature' must be a finite number")
+
+        body = json.dumps([VALID_READING, dict(VALID_READING, light=10 ** 400)])
+        response = client.post('/data/batch', data=body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['errors'], [{"index": 1, "message": "'light' must be a finite number"}])
+        self.assertEqual(len(collection.documents), 1)
+
+    def test_full_queue_returns_429(self):
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_queue=1, batch_size=100, max_age=60)
+        self.addCleanup(buffer.close)
+        client = self.client(DataController(db={'sensor_data': collection}, write_buffer=buffer))
+
+        self.assertEqual(client.post('/data', json=VALID_READING).status_code, 200)
+        response = client.post('/data/batch', json=[VALID_READING])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def test_flushes_on_close(self):
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_queue=10, batch_size=4, max_age=60)
+        buffer.submit([{"n": i} for i in range(6)])
+        buffer.close()
+        self.assertEqual(len(collection.documents), 6)
+        self.assertEqual(buffer.stats['flushed'], 6)
+
+    def test_retries_batch_when_database_unreachable(self):
+        collection = FakeCollection(failures=2)
+        buffer = WriteBehindBuffer(collection, max_queue=10, batch_size=10, max_age=0, retry_delay=0.01)
+        buffer.submit([{"n": i} for i in range(3)])
+        buffer.close()
+        self.assertEqual([document["n"] for document in collection.documents], [0, 1, 2])
+        self.assertEqual(buffer.stats['retries'], 2)
+        self.assertEqual(buffer.stats['failed'], 0)
+
+    def test_duplicates_from_a_partial_attempt_count_as_stored(self):
+        class PartialCollection(FakeCollection):
+            def insert_many(self, documents, ordered=True):
+                self.calls += 1
+                if self.calls == 1:
+                    # The first document reached the server before the connection dropped
+                    self.documents.append(documents[0])
+                    raise ConnectionFailure("connection reset")
+                self.documents.append(documents[1])
+                raise BulkWriteError({"writeErrors": [
+                    {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+                    {"index": 2, "code": 121, "errmsg": "Document failed validation"}
+                ]})
+
+        written = []
+        buffer = WriteBehindBuffer(PartialCollection(), max_queue=10, batch_size=10, max_age=60,
+                                   retry_delay=0.01, on_written=written.extend)
+        buffer.submit([{"n": i} for i in range(3)])
+        buffer.close()
+        self.assertEqual(buffer.stats['flushed'], 2)
+        self.assertEqual(buffer.stats['failed'], 1)
+        self.assertEqual([document["n"] for document in written], [0, 1])
+
+    def test_retry_skips_stored_documents_when_checking(self):
+        collection = mongomock.MongoClient()['iot_database']['sensor_data']
+        insert_many = collection.insert_many
+        attempts = []
+        def partial(documents, ordered=True):
+            attempts.append([document["_id"] for document in documents])
+            if not collection.count_documents({}):
+                # The first document reached the server before the connection dropped
+                insert_many(documents[:1])
+                raise ConnectionFailure("connection reset")
+            return insert_many(documents, ordered=ordered)
+
+        written = []
+        buffer = WriteBehindBuffer(collection, max_queue=10, batch_size=10, max_age=0, retry_delay=0.01,
+                                   on_written=written.extend, check_stored=lambda: True)
+        now = datetime(2024, 1, 1)
+        with mock.patch.object(collection, 'insert_many', side_effect=partial):
+            buffer.submit([{"_id": i, "timestamp": now} for i in range(3)])
+            buffer.close()
+        # The retry only sends what the first attempt did not store
+        self.assertEqual(attempts, [[0, 1, 2], [1, 2]])
+        self.assertEqual(sorted(document["_id"] for document in written), [0, 1, 2])
+        self.assertEqual((buffer.stats['flushed'], buffer.stats['failed']), (3, 0))
+
+    def test_counts_batch_failed_after_retries(self):
+        collection = FakeCollection(failures=100)
+        buffer = WriteBehindBuffer(collection, max_queue=10, batch_size=10, max_age=60,
+                                   max_retries=2, retry_delay=0.01)
+        buffer.submit([{"n": i} for i in range(3)])
+        buffer.close()
+        self.assertEqual(collection.calls, 3)
+        self.assertEqual(buffer.stats['failed'], 3)
+        self.assertEqual(buffer.depth(), 0)
+
+    def test_reports_written_documents(self):
+        written = []
+        buffer = WriteBehindBuffer(FakeCollection(), max_queue=10, batch_size=10, max_age=60,
+                                   on_written=written.extend)
+        buffer.submit([{"n": i} for i in range(3)])
+        buffer.close()
+        self.assertEqual([document["n"] for document in written], [0, 1, 2])
+
+    def test_rejects_when_full(self):
+        buffer = WriteBehindBuffer(FakeCollection(), max_queue=2, batch_size=100, max_age=60)
+        buffer.submit([{"n": 1}])
+        with self.assertRaises(IngestQueueFull):
+            buffer.submit([{"n": 2}, {"n": 3}])
+        self.assertEqual(buffer.depth(), 1)
+        buffer.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import gzip
+import json
+import unittest
+from datetime import datetime
+from bson import ObjectId
+from flask import Flask, jsonify
+from middleware.compression import init_compression, negotiate_encoding
+from routes import api_routes
+from utils import json_provider
+
+class TestJSONProvider(unittest.TestCase):
+    def test_matches_stdlib_fallback(self):
+        value = {"id": ObjectId("65a1b2c3d4e5f6a7b8c9d0e1"), "at": datetime(2024, 1, 1, 0, 0, 0, 123000), "n": [1, 2.5, None]}
+        fallback = json.dumps(value, default=json_provider.default, separators=(',', ':'))
+        self.assertEqual(json_provider.dumps(value), fallback)
+        self.assertEqual(json_provider.loads(fallback)["at"], "2024-01-01T00:00:00.123000")
+
+    def test_jsonify_is_compact_even_in_debug(self):
+        app = Flask(__name__)
+        app.debug = True
+        api_routes.setup_routes(app)
+        with app.app_context():
+            body = jsonify({"at": datetime(2024, 1, 1)}).get_data(as_text=True)
+        self.assertEqual(body.strip(), '{"at":"2024-01-01T00:00:00"}')
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        json_provider.init_app(app)
+        init_compression(app)
+
+        @app.route('/big')
+        def big():
+            return jsonify({"data": [{"value": i} for i in range(500)]})
+
+        @app.route('/small')
+        def small():
+            return jsonify({"status": "success"})
+
+        self.client = app.test_client()
+
+    def test_negotiates_encoding(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate_encoding('gzip;q=0, identity'), None)
+        self.assertEqual(negotiate_encoding('*'), negotiate_encoding('br, gzip'))
+        self.assertIsNone(negotiate_encoding(None))
+
+    def test_compresses_large_responses(self):
+        response = self.client.get('/big', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))["data"]), 500)
+
+    def test_leaves_small_or_unaccepted_responses(self):
+        self.assertNotIn('Content-Encoding', self.client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers)
+        self.assertNotIn('Content-Encoding', self.client.get('/big').headers)
+
+if __name__ == '__main__':
+    unittest.main()
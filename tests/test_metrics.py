@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from flask import Flask
+from starlette.testclient import TestClient
+import asgi
+from config import TestingConfig
+from middleware.metrics import init_metrics
+from routes import api_routes
+from utils.db_connection import CommandTimer
+from utils.log import JSONFormatter
+from utils.metrics import Registry, http_requests, mongo_latency
+from utils.profiler import SamplingProfiler
+
+class TestRegistry(unittest.TestCase):
+    def test_renders_prometheus_text(self):
+        registry = Registry()
+        requests = registry.counter('requests_total', 'Requests', ('route',))
+        latency = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+        depth = registry.gauge('depth', 'Depth', ('queue',))
+
+        requests.inc('/data')
+        requests.inc('/data')
+        latency.observe(0.05, '/data')
+        latency.observe(0.5, '/data')
+        depth.set_function(lambda: 7, 'spool')
+        depth.set_function(lambda: None, 'idle')
+
+        text = registry.render()
+        self.assertIn('# TYPE requests_total counter', text)
+        self.assertIn('requests_total{route="/data"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/data",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/data",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count{route="/data"} 2', text)
+        self.assertIn('depth{queue="spool"} 7', text)
+        self.assertNotIn('idle', text)
+
+    def test_mongo_command_timings(self):
+        before = mongo_latency.count('ping')
+        CommandTimer().succeeded(SimpleNamespace(duration_micros=1500, command_name='ping'))
+        self.assertEqual(mongo_latency.count('ping'), before + 1)
+
+class TestRequestMetrics(unittest.TestCase):
+    def test_flask_routes_are_counted_by_rule(self):
+        app = Flask(__name__)
+        init_metrics(app)
+        api_routes.setup_routes(app)
+        client = app.test_client()
+        before = http_requests.value('GET', '/health', '200')
+        client.get('/health')
+        self.assertEqual(http_requests.value('GET', '/health', '200'), before + 1)
+
+        response = client.get('/metrics')
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn(b'http_request_duration_seconds_bucket{method="GET",route="/health"', response.data)
+
+    def test_asgi_routes_are_counted_by_path(self):
+        client = TestClient(asgi.create_app(TestingConfig))
+        before = http_requests.value('GET', '/health', '200')
+        client.get('/health')
+        self.assertEqual(http_requests.value('GET', '/health', '200'), before + 1)
+        self.assertIn('http_requests_total', client.get('/metrics').text)
+
+    def test_profiler_is_opt_in(self):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        client = app.test_client()
+        self.assertEqual(client.post('/debug/profile?seconds=0.01').status_code, 404)
+        with mock.patch.dict(os.environ, {'PROFILER_ENABLED': 'true'}):
+            response = client.post('/debug/profile?seconds=0.05')
+        self.assertEqual(response.status_code, 200)
+
+class TestProfilerAndLogging(unittest.TestCase):
+    def test_folded_stacks(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            stacks = SamplingProfiler(interval=0.001).capture(0.05)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertIn('wait (', stacks)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in stacks.splitlines()))
+
+    def test_json_log_lines_carry_extra_fields(self):
+        record = logging.LogRecord('ingest', logging.INFO, __file__, 1, 'Stored %d', (3,), None)
+        record.device = '10.0.0.1'
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual((entry['message'], entry['level'], entry['device']), ('Stored 3', 'INFO', '10.0.0.1'))
+
+if __name__ == '__main__':
+    unittest.main()
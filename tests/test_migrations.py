@@ -0,0 +1,106 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+import mongomock
+from pymongo import ASCENDING, DESCENDING
+from migrations.runner import IrreversibleMigration, MigrationLocked, MigrationRunner, LOCK_COLLECTION, LOCK_ID
+from migrations.schema import apply_index_plan, index_usage, plan_indexes
+
+def quiet(message):
+    pass
+
+def mongomock_database(test):
+    # mongomock has no list_collections and rejects the validator option, so
+    # sensor_data is always a plain collection here
+    for patcher in (mock.patch('migrations.schema.is_timeseries', return_value=False),
+                    mock.patch('migrations.versions.is_timeseries', return_value=False),
+                    mock.patch.object(mongomock.Database, 'create_collection', lambda self, name, **options: self[name])):
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return mongomock.MongoClient()['iot_database']
+
+class TestMigrationRunner(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock_database(self)
+
+    def index_names(self, collection):
+        return {index['name'] for index in self.db[collection].list_indexes()}
+
+    def test_up_is_recorded_and_idempotent(self):
+        # A database set up by the old script, before the ledger existed
+        self.db['sensor_data'].create_index([('timestamp', DESCENDING), ('temperature', ASCENDING)], name='timestamp_temp')
+
+        runner = MigrationRunner(self.db, log=quiet)
+        self.assertEqual(runner.up(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(runner.up(), [])
+        self.assertEqual(self.index_names('sensor_data'), {'_id_', 'timestamp_id', 'localIp_asc'})
+        self.assertIn('groups_asc', self.index_names('devices'))
+        self.assertTrue(all(entry["applied"] for entry in runner.status()))
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 0)
+
+    def test_down_reverts_to_a_version(self):
+        runner = MigrationRunner(self.db, log=quiet)
+        runner.up()
+        self.assertEqual(runner.down(2), [6, 5, 4, 3])
+        self.assertEqual(self.index_names('sensor_data'), {'_id_', 'timestamp_desc', 'timestamp_id', 'localIp_asc', 'timestamp_temp'})
+        self.assertNotIn('groups_asc', self.index_names('devices'))
+        self.assertEqual([entry["version"] for entry in runner.status() if entry["applied"]], [1, 2])
+        with self.assertRaises(IrreversibleMigration):
+            runner.down(0)
+        self.assertEqual(runner.up(3), [3])
+
+    def test_live_lock_blocks_a_second_runner(self):
+        self.db[LOCK_COLLECTION].insert_one({'_id': LOCK_ID, 'owner': 'other', 'leaseUntil': datetime(2999, 1, 1)})
+        with self.assertRaises(MigrationLocked):
+            MigrationRunner(self.db, log=quiet).up()
+        self.assertEqual(self.db['schema_migrations'].count_documents({}), 0)
+
+class TestIndexPlan(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock_database(self)
+        MigrationRunner(self.db, log=quiet).up()
+
+    def test_diff_creates_missing_before_dropping_unused(self):
+        self.db['sensor_data'].drop_index('timestamp_id')
+        self.db['sensor_data'].create_index([('temperature', ASCENDING)], name='temperature_asc')
+        self.db['devices'].drop_index('groups_asc')
+        self.db['devices'].create_index([('name', ASCENDING)], name='groups_asc')
+
+        plan = plan_indexes(self.db)
+        self.assertEqual([(action, collection) for action, collection, _ in plan],
+                         [('create', 'sensor_data'), ('replace', 'devices'), ('drop', 'sensor_data')])
+
+        apply_index_plan(self.db, plan, log=quiet)
+        self.assertIn('temperature_asc', {index['name'] for index in self.db['sensor_data'].list_indexes()})
+        apply_index_plan(self.db, plan_indexes(self.db), drop_unused=True, log=quiet)
+        self.assertEqual(plan_indexes(self.db), [])
+
+    def test_replace_keeps_an_index_on_the_declared_keys(self):
+        devices = self.db['devices']
+        devices.drop_index('groups_asc')
+        devices.create_index([('name', ASCENDING)], name='groups_asc')
+
+        drop_index = mongomock.Collection.drop_index
+        covered = []
+        def checked_drop(collection, name):
+            if name == 'groups_asc':
+                covered.append([info['key'] for info in collection.index_information().values()])
+            return drop_index(collection, name)
+
+        with mock.patch.object(mongomock.Collection, 'drop_index', checked_drop):
+            apply_index_plan(self.db, plan_indexes(self.db, ['devices']), log=quiet)
+        self.assertEqual(covered, [[[('_id', 1)], [('name', 1)], [('groups', 1), ('_rebuild', 1)]]])
+        self.assertEqual({name: info['key'] for name, info in devices.index_information().items()},
+                         {'_id_': [('_id', 1)], 'groups_asc': [('groups', 1)]})
+
+    def test_usage_report_flags_undeclared_indexes(self):
+        stats = [
+            {'name': 'timestamp_id', 'accesses': {'ops': 120, 'since': datetime(2024, 1, 1)}},
+            {'name': 'legacy', 'accesses': {'ops': 0, 'since': datetime(2024, 1, 1)}}
+        ]
+        with mock.patch.object(mongomock.Collection, 'aggregate', return_value=stats):
+            report = index_usage(self.db, ['sensor_data'])
+        self.assertEqual([(entry['name'], entry['declared']) for entry in report], [('legacy', False), ('timestamp_id', True)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from pymongo.errors import BulkWriteError
+from controllers.data_controller import DataController
+from services.mqtt_ingest import MQTTIngestWorker, shared_topic
+from tests.test_ingest import VALID_READING, FakeCollection
+
+class OptionsCollection(FakeCollection):
+    def with_options(self, write_concern=None):
+        self.write_concern = write_concern
+        return self
+
+class FakeIngestClient:
+    """Stand-in for a paho 2.x Client with manual acknowledgement"""
+
+    def __init__(self, client_id='', clean_session=None):
+        self.client_id = client_id
+        self.clean_session = clean_session
+        self.acked = []
+        self.subscriptions = []
+
+    def username_pw_set(self, username, password=None):
+        self.username = username
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def manual_ack_set(self, on):
+        self.manual = on
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append((topic, qos))
+
+    def ack(self, mid, qos):
+        self.acked.append(mid)
+
+    def deliver(self, mid, body, qos=1):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.on_message(self, None, SimpleNamespace(topic='v1/devices/d1/telemetry', payload=payload, mid=mid, qos=qos))
+
+class TestMQTTIngestWorker(unittest.TestCase):
+    def setUp(self):
+        self.collection = OptionsCollection()
+        self.controller = DataController(db={'sensor_data': self.collection})
+        self.worker = MQTTIngestWorker(self.controller, 'broker', group='ingest', batch_size=3, client_factory=FakeIngestClient)
+        self.client = self.worker.client
+
+    def test_shared_subscription(self):
+        self.assertEqual(shared_topic('v1/devices/+/telemetry', 'ingest'), '$share/ingest/v1/devices/+/telemetry')
+        self.client.on_connect(self.client, None, {}, 0)
+        self.assertEqual(self.client.subscriptions, [('$share/ingest/v1/devices/+/telemetry', 1)])
+        self.assertTrue(self.client.manual)
+
+    def test_acks_only_after_write(self):
+        self.client.deliver(1, VALID_READING)
+        self.client.deliver(2, [VALID_READING, VALID_READING])
+        self.assertEqual(self.client.acked, [])
+        self.assertEqual(self.worker.depth(), 3)
+
+        self.assertTrue(self.worker._flush_batch())
+        self.assertEqual(len(self.collection.documents), 3)
+        self.assertEqual(self.collection.calls, 1)
+        self.assertEqual(self.client.acked, [1, 2])
+        self.assertEqual(self.collection.write_concern.document, {'w': 'majority', 'j': True})
+
+    def test_invalid_messages_are_acked_without_write(self):
+        self.client.deliver(1, b'not json')
+        self.client.deliver(2, dict(VALID_READING, humidity=150))
+        self.client.deliver(3, [VALID_READING, dict(VALID_READING, rssi=None)])
+        self.client.deliver(4, dict(VALID_READING, temperature=10 ** 400))
+        self.assertEqual(self.client.acked, [1, 2, 4])
+        self.assertEqual(self.worker.stats['invalid'], 4)
+        self.assertEqual(self.worker.depth(), 1)
+
+    def test_failed_write_is_retried_without_ack(self):
+        self.collection.failures = 1
+        self.client.deliver(1, VALID_READING)
+        self.assertFalse(self.worker._flush_batch())
+        self.assertEqual(self.client.acked, [])
+        self.assertEqual(self.worker.depth(), 1)
+
+        self.worker._retry_at = 0.0
+        self.assertTrue(self.worker._flush_batch())
+        self.assertEqual(self.client.acked, [1])
+        self.assertEqual(self.worker.stats['retries'], 1)
+
+    def test_duplicates_from_a_partial_attempt_count_as_stored(self):
+        class PartialCollection(OptionsCollection):
+            def insert_many(self, documents, ordered=True):
+                if self.calls == 0:
+                    # The first reading reached the server before the connection dropped
+                    self.documents.append(documents[0])
+                    self.failures = 1
+                    return super().insert_many(documents, ordered)
+                self.calls += 1
+                self.documents.append(documents[1])
+                raise BulkWriteError({"writeErrors": [
+                    {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+                    {"index": 2, "code": 121, "errmsg": "Document failed validation"}
+                ]})
+
+        self.controller = DataController(db={'sensor_data': PartialCollection()})
+        self.worker = MQTTIngestWorker(self.controller, 'broker', batch_size=3, client_factory=FakeIngestClient)
+        self.worker.client.deliver(1, [VALID_READING, VALID_READING, VALID_READING])
+        self.assertFalse(self.worker._flush_batch())
+        self.worker._retry_at = 0.0
+        with mock.patch.object(self.controller, 'update_rollups') as update_rollups:
+            self.assertTrue(self.worker._flush_batch())
+        self.assertEqual(len(update_rollups.call_args[0][0]), 2)
+        self.assertEqual((self.worker.stats['stored'], self.worker.stats['failed']), (2, 1))
+        self.assertEqual(self.worker.client.acked, [1])
+
+if __name__ == '__main__':
+    unittest.main()
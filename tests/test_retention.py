@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+import mongomock
+from services.retention import STATE_COLLECTION, RetentionJob
+from services.rollups import ROLLUP_STATE
+from tests.test_ingest import VALID_READING
+
+NOW = datetime(2024, 3, 10, 12, 30)
+
+class MongomockRetentionJob(RetentionJob):
+    """mongomock's bulk_write does not accept pymongo 4 operations; apply the same updates one by one"""
+
+    def write_rollup(self, rollup, updates):
+        for query, update, upsert in updates:
+            rollup.update_one(query, update, upsert=upsert)
+
+class TestRetentionJob(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient()['iot_database']
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Two readings per hour from 2024-03-08 21:00 up to now
+        self.db['sensor_data'].insert_many([
+            dict(VALID_READING, temperature=20.0 + i % 2, timestamp=NOW - timedelta(minutes=30 * i))
+            for i in range(80)
+        ])
+
+    def job(self, **kwargs):
+        kwargs.setdefault('archive_dir', self.directory)
+        return MongomockRetentionJob(self.db, timedelta(days=1), batch_size=3, clock=lambda: NOW, **kwargs)
+
+    def test_expired_hours_are_rolled_up_archived_and_deleted(self):
+        stats = self.job().run()
+        cutoff = datetime(2024, 3, 9, 12)
+        self.assertEqual(stats["cutoff"], cutoff)
+        self.assertEqual(self.db['sensor_data'].count_documents({'timestamp': {'$lt': cutoff}}), 0)
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 50)
+        self.assertEqual(stats["deleted"], 30)
+
+        buckets = list(self.db['sensor_rollup_1h'].find().sort('timestamp', 1))
+        self.assertEqual(len(buckets), 15)
+        self.assertEqual((buckets[1]['count'], buckets[1]['sum']['temperature'], buckets[1]['max']['temperature']), (2, 41.0, 21.0))
+
+        path = os.path.join(self.directory, 'sensor_data', '2024', '03', '08', '22.ndjson.gz')
+        with gzip.open(path, 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['timestamp'] for row in rows], ['2024-03-08T22:00:00', '2024-03-08T22:30:00'])
+        self.assertFalse(self.db[STATE_COLLECTION].find_one()['owner'])
+
+    def test_resumes_an_interrupted_delete_without_rebuilding(self):
+        job = self.job()
+        with mock.patch.object(job, 'delete', side_effect=RuntimeError("stopped")):
+            with self.assertRaises(RuntimeError):
+                job.run()
+        checkpoint = self.db[STATE_COLLECTION].find_one()
+        self.assertEqual((checkpoint['hour'], checkpoint['phase']), (datetime(2024, 3, 8, 21), 'delete'))
+
+        # Half the hour was deleted before the stop; the rebuilt bucket must not shrink
+        self.db['sensor_data'].delete_one({'timestamp': datetime(2024, 3, 8, 21)})
+        resumed = self.job()
+        with mock.patch.object(resumed, 'rebuild_rollup', wraps=resumed.rebuild_rollup) as rebuild:
+            resumed.run(max_hours=1)
+        rebuild.assert_not_called()
+        bucket = self.db['sensor_rollup_1h'].find_one({'timestamp': datetime(2024, 3, 8, 21)})
+        self.assertEqual(bucket['count'], 2)
+
+    def test_compaction_extends_hourly_coverage_and_pruning_trims_minutes(self):
+        since = datetime(2024, 3, 9, 6)
+        self.db[ROLLUP_STATE].insert_many([{'_id': 'sensor_rollup_1h', 'since': since}, {'_id': 'sensor_rollup_1m', 'since': since}])
+        self.job(minute_rollup_retention=timedelta(hours=12)).run()
+        self.assertEqual(self.db[ROLLUP_STATE].find_one({'_id': 'sensor_rollup_1h'})['since'], datetime.min)
+        self.assertEqual(self.db[ROLLUP_STATE].find_one({'_id': 'sensor_rollup_1m'})['since'], datetime(2024, 3, 10))
+
+    def test_live_lease_blocks_a_second_job(self):
+        self.db[STATE_COLLECTION].insert_one({'_id': 'sensor_data', 'owner': 'other', 'leaseUntil': NOW + timedelta(minutes=1)})
+        self.assertIsNone(self.job().run())
+        self.assertEqual(self.db['sensor_data'].count_documents({}), 80)
+
+    def test_late_readings_are_archived_separately(self):
+        job = self.job(archive_dir=self.directory)
+        job.run()
+        late = NOW - timedelta(days=3)
+        self.db['sensor_data'].insert_one(dict(VALID_READING, timestamp=late))
+        stats = self.job().run()
+        self.assertEqual((stats["stragglers"], stats["deleted"]), (1, 1))
+        self.assertIsNone(self.db['sensor_rollup_1h'].find_one({'timestamp': datetime(2024, 3, 7, 12)}))
+        day = os.listdir(os.path.join(self.directory, 'sensor_data', '2024', '03', '07'))
+        self.assertEqual(len(day), 1)
+        self.assertIn('.late-', day[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import contextlib
+import io
+import unittest
+from datetime import datetime, timedelta
+import mongomock
+from controllers.data_controller import DataController
+from migrations.backfill_rollups import RollupBackfill
+from services.rollups import ROLLUP_STATE, ROLLUPS, RollupStore, choose_rollup, rollup_updates
+
+START = datetime(2024, 1, 1)
+
+def reading(minute, temperature, device="10.0.0.1"):
+    return {
+        "temperature": temperature,
+        "humidity": 50.0,
+        "light": 100.0,
+        "rssi": -40,
+        "localIp": device,
+        "timestamp": START + timedelta(minutes=minute)
+    }
+
+class MongomockRollups(RollupStore):
+    """mongomock's bulk_write does not accept pymongo 4 operations; apply the same updates one by one"""
+
+    def apply(self, documents):
+        for name, seconds in ROLLUPS:
+            for query, update, upsert in rollup_updates(documents, seconds):
+                self.db[name].update_one(query, update, upsert=upsert)
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient()['iot_database']
+        self.rollups = MongomockRollups(self.db)
+
+    def test_accumulates_per_device_buckets(self):
+        self.rollups.apply([reading(0, 20.0), reading(0.5, 24.0), reading(1, 30.0), reading(0, 10.0, "10.0.0.2")])
+        self.rollups.apply([reading(0.25, 22.0)])
+
+        minute = self.db['sensor_rollup_1m'].find_one({"localIp": "10.0.0.1", "timestamp": START})
+        self.assertEqual(minute['count'], 3)
+        self.assertEqual(minute['sum']['temperature'], 66.0)
+        self.assertEqual(minute['min']['temperature'], 20.0)
+        self.assertEqual(minute['max']['temperature'], 24.0)
+        # An older reading arriving later does not replace the last value
+        self.assertEqual(minute['last']['temperature'], 24.0)
+
+        hour = self.db['sensor_rollup_1h'].find_one({"localIp": "10.0.0.1", "timestamp": START})
+        self.assertEqual(hour['count'], 4)
+        self.assertEqual(hour['last']['temperature'], 30.0)
+        self.assertEqual(self.db['sensor_rollup_1h'].count_documents({}), 2)
+
+    def test_chooses_coarsest_fitting_rollup(self):
+        self.assertEqual(choose_rollup(300), ('sensor_rollup_1m', 60))
+        self.assertEqual(choose_rollup(21600), ('sensor_rollup_1h', 3600))
+        self.assertIsNone(choose_rollup(30))
+
+    def cover(self, since):
+        for name, _ in ROLLUPS:
+            self.db[ROLLUP_STATE].update_one({'_id': name}, {'$set': {'since': since}}, upsert=True)
+
+    def test_history_from_rollups_matches_raw(self):
+        readings = [reading(minute, 20.0 + minute, "10.0.0.1" if minute % 2 else "10.0.0.2") for minute in range(10)]
+        self.db['sensor_data'].insert_many([dict(document) for document in readings])
+        self.rollups.apply(readings)
+        self.cover(START)
+
+        raw = DataController(db=self.db)
+        rolled = DataController(db=self.db, rollups=self.rollups)
+        end = START + timedelta(hours=1)
+        for agg in ('avg', 'min', 'max', 'last'):
+            self.assertEqual(
+                rolled.get_telemetry_history(START, end, '5m', agg=agg),
+                raw.get_telemetry_history(START, end, '5m', agg=agg)
+            )
+        self.assertEqual(
+            rolled.get_telemetry_history(START, end, '1h', agg='last', device='10.0.0.2'),
+            raw.get_telemetry_history(START, end, '1h', agg='last', device='10.0.0.2')
+        )
+
+    def test_ingest_updates_rollups(self):
+        controller = DataController(db=self.db, rollups=self.rollups)
+        document = dict(reading(0, 25.0))
+        del document['timestamp']
+        controller.receive_batch([dict(document, lightPercentage=50.0), dict(document, lightPercentage=50.0)])
+        controller.receive_data(dict(document, lightPercentage=50.0))
+        self.assertEqual(sum(bucket['count'] for bucket in self.db['sensor_rollup_1h'].find()), 3)
+
+    def test_history_reads_raw_readings_until_rollups_cover_the_range(self):
+        controller = DataController(db=self.db, rollups=self.rollups)
+        document = dict(reading(0, 25.0))
+        del document['timestamp']
+        controller.receive_data(dict(document, lightPercentage=50.0))
+        # Ingest only vouches for the rollups from the next hour on
+        since = self.db[ROLLUP_STATE].find_one({'_id': 'sensor_rollup_1h'})['since']
+        self.assertGreater(since, datetime.utcnow())
+
+        end = since + timedelta(hours=2)
+        controller.refresh_rollup_coverage()
+        self.assertEqual(controller.history_query(since - timedelta(hours=1), end, '1h', 'avg', None, 500)[0], 'sensor_data')
+        self.assertEqual(controller.history_query(since, end, '1h', 'avg', None, 500)[0], 'sensor_rollup_1h')
+
+        # Coverage is re-read at most every COVERAGE_REFRESH seconds
+        self.cover(START)
+        controller.refresh_rollup_coverage()
+        self.assertEqual(controller.history_query(since - timedelta(hours=1), end, '1h', 'avg', None, 500)[0], 'sensor_data')
+        self.rollups.coverage_read_at = None
+        controller.refresh_rollup_coverage()
+        self.assertEqual(controller.history_query(START, end, '1h', 'avg', None, 500)[0], 'sensor_rollup_1h')
+
+    def test_backfill_extends_coverage_it_reaches(self):
+        self.db['sensor_data'].insert_many([reading(minute, 20.0) for minute in range(0, 120, 10)])
+        backfill = RollupBackfill(self.db)
+        backfill.rollups = self.rollups
+        self.cover(START + timedelta(hours=3))
+        with contextlib.redirect_stdout(io.StringIO()):
+            backfill.run(START, START + timedelta(hours=2))
+        self.assertEqual(self.db[ROLLUP_STATE].find_one({'_id': 'sensor_rollup_1h'})['since'], START + timedelta(hours=3))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(backfill.run(START, START + timedelta(hours=3)), 12)
+        self.assertEqual(self.db[ROLLUP_STATE].find_one({'_id': 'sensor_rollup_1h'})['since'], START)
+        self.assertEqual(self.db['sensor_rollup_1h'].find_one({'timestamp': START})['count'], 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+import mongomock
+from pymongo.errors import ConnectionFailure
+from controllers.data_controller import DataController
+from services.spool import RECORD_HEADER, Spool, SpoolReplayer, open_spool
+from tests.test_ingest import VALID_READING, FakeCollection
+
+class DownCollection(FakeCollection):
+    """A collection whose server is unreachable"""
+
+    def insert_one(self, document):
+        raise ConnectionFailure("database unreachable")
+
+    def insert_many(self, documents, ordered=True):
+        raise ConnectionFailure("database unreachable")
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_replays_in_order_across_segments(self):
+        spool = Spool(self.directory, segment_size=256)
+        spool.append([{"n": i} for i in range(10)])
+        self.assertEqual(spool.depth(), 10)
+        self.assertGreater(spool.metrics()["segments"], 1)
+
+        collection = mongomock.MongoClient()['iot_database']['sensor_data']
+        replayer = SpoolReplayer(spool, lambda: collection, batch_size=4)
+        while replayer.replay_batch():
+            pass
+        self.assertEqual([document["n"] for document in collection.find()], list(range(10)))
+        self.assertEqual(spool.depth(), 0)
+        self.assertIsNone(spool.metrics()["oldest_age_seconds"])
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.startswith('segment-')]), 1)
+
+    def test_reopen_resumes_after_cursor_and_skips_torn_record(self):
+        spool = Spool(self.directory)
+        spool.append([{"n": i} for i in range(3)])
+        documents, position = spool.read_batch(1)
+        spool.commit(position, len(documents))
+        # A crash mid-append leaves a header with no body behind it
+        spool._write_map[spool._write_offset:spool._write_offset + RECORD_HEADER.size] = RECORD_HEADER.pack(50, 0, 0.0)
+        spool.close()
+
+        reopened = Spool(self.directory)
+        self.assertEqual(reopened.depth(), 2)
+        self.assertEqual(reopened.metrics()["corrupt_segments"], 1)
+        reopened.append([{"n": 3}])
+        documents, _ = reopened.read_batch(10)
+        self.assertEqual([document["n"] for document in documents], [1, 2, 3])
+
+    def test_replay_treats_duplicates_as_stored(self):
+        spool = Spool(self.directory)
+        collection = mongomock.MongoClient()['iot_database']['sensor_data']
+        # Stored by an attempt that failed before it could commit or call on_written
+        collection.insert_one({"_id": 1})
+        spool.append([{"_id": 1}, {"_id": 2}])
+        written = []
+        SpoolReplayer(spool, lambda: collection, on_written=written.extend).replay_batch()
+        self.assertEqual(collection.count_documents({}), 2)
+        self.assertEqual([document["_id"] for document in written], [1, 2])
+        self.assertEqual(spool.metrics()["failed"], 0)
+
+    def test_replay_skips_stored_readings_when_checking(self):
+        # A time-series collection would store {"_id": 1} twice instead of raising
+        spool = Spool(self.directory)
+        collection = mongomock.MongoClient()['iot_database']['sensor_data']
+        now = datetime(2024, 1, 1)
+        collection.insert_one({"_id": 1, "timestamp": now})
+        spool.append([{"_id": 1, "timestamp": now}, {"_id": 2, "timestamp": now}])
+        written = []
+        replayer = SpoolReplayer(spool, lambda: collection, on_written=written.extend, check_stored=lambda: True)
+        with mock.patch.object(collection, 'insert_many', wraps=collection.insert_many) as insert_many:
+            replayer.replay_batch()
+        self.assertEqual([document["_id"] for document in insert_many.call_args[0][0]], [2])
+        self.assertEqual([document["_id"] for document in written], [1, 2])
+        self.assertEqual(spool.metrics()["failed"], 0)
+
+    def test_replay_keeps_batch_when_database_down(self):
+        spool = Spool(self.directory)
+        spool.append([{"n": 1}])
+        with self.assertRaises(ConnectionFailure):
+            SpoolReplayer(spool, lambda: DownCollection()).replay_batch()
+        self.assertEqual(spool.depth(), 1)
+
+    def test_open_spool_claims_free_directory(self):
+        first = open_spool(self.directory)
+        second = open_spool(self.directory)
+        self.assertNotEqual(first.directory, second.directory)
+
+class TestSpoolIngest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.spool = Spool(self.directory)
+
+    def test_spools_when_insert_fails_and_while_draining(self):
+        controller = DataController(db={'sensor_data': DownCollection()}, spool=self.spool)
+        response = controller.receive_data(VALID_READING)
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['message'], 'Data spooled')
+
+        # With a backlog, new readings queue behind it instead of waiting on the database
+        collection = FakeCollection()
+        controller = DataController(db={'sensor_data': collection}, spool=self.spool)
+        response = controller.receive_batch([VALID_READING, VALID_READING])
+        self.assertEqual(response['accepted'], 2)
+        self.assertEqual(collection.calls, 0)
+        self.assertEqual(self.spool.depth(), 3)
+
+    def test_batch_spools_when_database_unreachable(self):
+        controller = DataController(db={'sensor_data': DownCollection()}, spool=self.spool)
+        response = controller.receive_batch([VALID_READING, {}])
+        self.assertEqual((response['status'], response['accepted']), ('partial', 1))
+        self.assertEqual(self.spool.depth(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
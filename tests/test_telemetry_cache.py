@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+import mongomock
+from flask import Flask
+from controllers.data_controller import DataController
+from routes import api_routes
+
+READING = {
+    "temperature": 25.5,
+    "humidity": 60.2,
+    "light": 450.0,
+    "lightPercentage": 75.0,
+    "rssi": -45,
+    "localIp": "192.168.1.100"
+}
+
+class TestLatestTelemetryCache(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient()['iot_database']
+        self.controller = DataController(db=self.db)
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        patcher = mock.patch.object(api_routes, 'data_controller', self.controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_ingest_writes_through_to_cache(self):
+        self.controller.receive_data(READING)
+        with mock.patch.object(mongomock.Collection, 'find_one') as find_one:
+            response = self.client.get('/telemetry?device=192.168.1.100')
+            find_one.assert_not_called()
+        self.assertEqual(response.get_json()['data']['temp']['value'], 25.5)
+
+    def test_unchanged_poll_returns_304(self):
+        self.controller.receive_data(READING)
+        etag = self.client.get('/telemetry').headers['ETag']
+        response = self.client.get('/telemetry', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.controller.receive_data(dict(READING, temperature=30.0))
+        response = self.client.get('/telemetry', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['data']['temp']['value'], 30.0)
+
+    def test_expired_entry_reloads_readings_from_other_processes(self):
+        self.controller.latest_cache.ttl = 0
+        self.controller.receive_data(READING)
+        self.db['sensor_data'].insert_one(dict(READING, temperature=40.0, timestamp=datetime.utcnow() + timedelta(seconds=1)))
+        self.assertEqual(self.controller.get_latest_telemetry()['temp']['value'], 40.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+import mongomock
+from flask import Flask
+from controllers.data_controller import DataController
+from routes import api_routes
+
+START = datetime(2024, 1, 1)
+
+class TestTelemetryExport(unittest.TestCase):
+    def setUp(self):
+        db = mongomock.MongoClient()['iot_database']
+        # Pairs of readings share a timestamp to exercise the _id tie-breaker
+        db['sensor_data'].insert_many([
+            {
+                "temperature": float(i),
+                "humidity": 50.0,
+                "light": 100.0,
+                "lightPercentage": 10.0,
+                "rssi": -40,
+                "localIp": "10.0.0.1",
+                "timestamp": START + timedelta(seconds=i // 2)
+            }
+            for i in range(7)
+        ])
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        patcher = mock.patch.object(api_routes, 'data_controller', DataController(db=db))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_ndjson_export(self):
+        response = self.client.get('/telemetry/export')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual([row['temperature'] for row in rows], [float(i) for i in range(7)])
+
+    def test_csv_export_with_range(self):
+        response = self.client.get('/telemetry/export?format=csv&from=2024-01-01T00:00:01&to=2024-01-01T00:00:02')
+        rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+        self.assertEqual([row['temperature'] for row in rows], ['2.0', '3.0'])
+
+    def test_keyset_pagination_visits_every_row_once(self):
+        seen = []
+        cursor = None
+        while True:
+            url = '/telemetry/records?limit=3' + (f'&cursor={cursor}' if cursor else '')
+            body = self.client.get(url).get_json()
+            seen += [row['temperature'] for row in body['data']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [float(i) for i in range(7)])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/telemetry/records?cursor=bogus').status_code, 400)
+
+    def test_out_of_range_timestamps(self):
+        for query in ('from=1e20', 'to=inf', 'from=-1e300', 'to=nan'):
+            self.assertEqual(self.client.get(f'/telemetry/export?{query}').status_code, 400, query)
+            self.assertEqual(self.client.get(f'/telemetry/records?{query}').status_code, 400, query)
+
+if __name__ == '__main__':
+    unittest.main()
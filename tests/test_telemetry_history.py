@@ -0,0 +1,98 @@
+import struct
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+import mongomock
+from flask import Flask
+from controllers.data_controller import DataController
+from routes import api_routes
+from services.telemetry_queries import EPOCH, format_columnar, pack_columnar
+
+START = datetime(2024, 1, 1)
+
+class TestTelemetryHistory(unittest.TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient()['iot_database']
+        self.db['sensor_data'].insert_many([
+            {
+                "temperature": 20.0 + minute,
+                "humidity": 50.0,
+                "light": 100.0 * minute,
+                "localIp": "10.0.0.1" if minute % 2 else "10.0.0.2",
+                "timestamp": START + timedelta(minutes=minute)
+            }
+            for minute in range(10)
+        ])
+        self.controller = DataController(db=self.db)
+
+    def test_downsamples_into_buckets(self):
+        buckets = self.controller.get_telemetry_history(START, START + timedelta(hours=1), '5m')
+        self.assertEqual(len(buckets), 2)
+        self.assertEqual(buckets[0]['temp']['value'], 22.0)
+        self.assertEqual(buckets[0]['count'], 5)
+        self.assertEqual(buckets[1]['timestamp'], START + timedelta(minutes=5))
+
+    def test_last_aggregation_and_device_filter(self):
+        buckets = self.controller.get_telemetry_history(
+            START, START + timedelta(hours=1), '5m', agg='last', device='10.0.0.1'
+        )
+        self.assertEqual([bucket['temp']['value'] for bucket in buckets], [23.0, 29.0])
+
+    def test_columnar_matches_rows(self):
+        end = START + timedelta(hours=1)
+        rows = self.controller.get_telemetry_history(START, end, '5m')
+        columns = format_columnar(self.controller.get_telemetry_history_columns(START, end, '5m'))
+        self.assertEqual(columns['timestamps'], [int((row['timestamp'] - EPOCH).total_seconds() * 1000) for row in rows])
+        self.assertEqual(columns['temp'], [row['temp']['value'] for row in rows])
+        self.assertEqual(columns['count'], [5, 5])
+
+    def test_binary_layout(self):
+        body = pack_columnar(self.controller.get_telemetry_history_columns(START, START + timedelta(hours=1), '5m'))
+        count, = struct.unpack_from('<I', body)
+        timestamps = struct.unpack_from(f'<{count}q', body, 4)
+        temperatures = struct.unpack_from(f'<{count}f', body, 4 + 8 * count)
+        self.assertEqual(count, 2)
+        self.assertEqual(timestamps[0], 1704067200000)
+        self.assertEqual(temperatures, (22.0, 27.0))
+        self.assertEqual(len(body), 4 + 8 * count + 3 * 4 * count)
+
+    def test_route_validates_parameters(self):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        with mock.patch.object(api_routes, 'data_controller', self.controller):
+            client = app.test_client()
+            response = client.get('/telemetry/history?from=2024-01-01T00:00:00Z&to=2024-01-01T01:00:00Z&bucket=5m')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['count'], 2)
+            self.assertEqual(client.get('/telemetry/history?bucket=7m').status_code, 400)
+            self.assertEqual(client.get('/telemetry/history?agg=median').status_code, 400)
+            self.assertEqual(client.get('/telemetry/history?format=xml').status_code, 400)
+            self.assertEqual(client.get('/telemetry/history?from=1e20').status_code, 400)
+            self.assertEqual(client.get('/telemetry/history?to=inf').status_code, 400)
+
+            response = client.get('/telemetry/history?from=2024-01-01T00:00:00Z&to=2024-01-01T01:00:00Z&bucket=5m&format=columnar')
+            body = response.get_json()
+            self.assertEqual(body['units'], {'temp': 'C', 'humid': '%', 'light': 'lux'})
+            self.assertEqual(body['data']['temp'], [22.0, 27.0])
+
+            response = client.get('/telemetry/history?from=2024-01-01T00:00:00Z&to=2024-01-01T01:00:00Z&bucket=5m&format=binary')
+            self.assertEqual(response.mimetype, 'application/octet-stream')
+            self.assertEqual(response.headers['X-Point-Count'], '2')
+
+    def test_bucket_that_would_truncate_is_rejected(self):
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+        with mock.patch.object(api_routes, 'data_controller', self.controller):
+            client = app.test_client()
+            # Starting mid-bucket, 10 minutes touch 3 five-minute buckets
+            query = '/telemetry/history?from=2024-01-01T00:02:00Z&to=2024-01-01T00:12:00Z&limit=2'
+            response = client.get(query + '&bucket=5m')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('bucket=15m', response.get_json()['message'])
+
+            response = client.get(query)
+            self.assertEqual(response.get_json()['bucket'], '15m')
+            self.assertEqual(sum(bucket['count'] for bucket in response.get_json()['data']), 8)
+
+if __name__ == '__main__':
+    unittest.main()
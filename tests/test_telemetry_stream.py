@@ -0,0 +1,70 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+import mongomock
+from flask import Flask
+from controllers.data_controller import DataController
+from routes import api_routes
+from services.telemetry_hub import TelemetryHub
+
+READING = {
+    "temperature": 25.5,
+    "humidity": 60.2,
+    "light": 450.0,
+    "lightPercentage": 75.0,
+    "rssi": -45,
+    "localIp": "192.168.1.100"
+}
+
+def document(device, temperature=20.0):
+    return {"localIp": device, "temperature": temperature, "timestamp": datetime(2024, 1, 1)}
+
+class TestTelemetryHub(unittest.TestCase):
+    def test_device_filter(self):
+        hub = TelemetryHub()
+        everything = hub.subscribe()
+        one_device = hub.subscribe('10.0.0.1')
+
+        hub.publish(document('10.0.0.1'))
+        hub.publish(document('10.0.0.2'))
+
+        self.assertEqual(everything.get(timeout=0)['device'], '10.0.0.1')
+        self.assertEqual(everything.get(timeout=0)['device'], '10.0.0.2')
+        self.assertEqual(one_device.get(timeout=0)['device'], '10.0.0.1')
+        self.assertIsNone(one_device.get(timeout=0))
+
+    def test_slow_consumer_is_dropped(self):
+        hub = TelemetryHub(queue_size=2)
+        slow = hub.subscribe()
+        for i in range(3):
+            hub.publish(document('10.0.0.1', temperature=i))
+        self.assertTrue(slow.dropped)
+        self.assertEqual(hub.subscriber_count(), 0)
+        self.assertEqual(hub.stats['dropped_subscribers'], 1)
+
+class TestTelemetryStreamRoute(unittest.TestCase):
+    def test_sse_receives_ingested_reading(self):
+        hub = TelemetryHub()
+        controller = DataController(db=mongomock.MongoClient()['iot_database'], hub=hub)
+        app = Flask(__name__)
+        api_routes.setup_routes(app)
+
+        with mock.patch.object(api_routes, 'data_controller', controller), \
+                mock.patch.object(api_routes, 'telemetry_hub', hub):
+            response = app.test_client().get('/telemetry/stream', buffered=False)
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            stream = iter(response.response)
+            self.assertEqual(next(stream), b"retry: 3000\n\n")
+
+            controller.receive_data(READING)
+            event = next(stream).decode()
+            response.close()
+
+        self.assertTrue(event.startswith("event: telemetry\n"))
+        payload = json.loads(event.split("data: ", 1)[1])
+        self.assertEqual(payload['temp']['value'], 25.5)
+        self.assertEqual(hub.subscriber_count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()